@@ -13,6 +13,7 @@ try:
         name = 'TonkaConstruction',
         ext_modules = [packbits])
 except:
-    # RELY ON THE PYTHON FALLBACK.
-    warnings.warn('The C PackBits decompression binary is not available on this installation. Expect image decompression to be SLOW.')
+    # RELY ON THE NUMPY FALLBACK.
+    warnings.warn('The C PackBits decompression binary is not available on this installation. '
+        'Bitmaps will be decompressed with the NumPy fallback, which is slower.')
     setup(name = 'TonkaConstruction')
@@ -0,0 +1,156 @@
+
+from struct import Struct
+from typing import Optional, Tuple
+
+import numpy
+from PIL import Image
+
+# The header of a delta stream:
+#  - The signature,
+#  - The version,
+#  - The width and height of the canvas,
+#  - The number of channels in each pixel (1 for paletted pixels),
+#  - The number of frames.
+DELTA_STREAM_HEADER = Struct('<4s4HL')
+DELTA_STREAM_SIGNATURE = b'TKDS'
+DELTA_STREAM_VERSION = 1
+# The header of each frame in a delta stream: the left, top, width, and height
+# of the dirty rectangle. The pixels in the rectangle follow, row by row.
+# Frames that change nothing have an empty rectangle.
+DELTA_STREAM_FRAME_HEADER = Struct('<4H')
+
+## Places the frames of an animation, one after another, on one canvas the size of the animation.
+##
+## The canvas is allocated once per animation and reused for every frame. Placing a frame
+## clears the previous frame from the canvas and then copies the pixels of this frame that
+## are not the transparent color onto the canvas, with NumPy masked slicing rather than a new
+## image for each frame. Pixels can be paletted (one color index each) or expanded to RGB or RGBA.
+##
+## Each time a frame is placed, the dirty rectangle (the smallest rectangle that contains every
+## pixel that changed since the previous frame) is returned, so only the changes between
+## consecutive frames need to be exported.
+class AnimationCompositor:
+    ## \param[in] width, height - The dimensions of the canvas, in pixels.
+    ## \param[in] transparent_color - The color the canvas is filled with, which is never copied from frames.
+    ##            A color index for paletted pixels; otherwise, a tuple with a value for each channel.
+    def __init__(self, width: int, height: int, transparent_color):
+        self.transparent_color = numpy.array(transparent_color, dtype = numpy.uint8)
+        self.channel_count = self.transparent_color.size
+        shape = (height, width) if self.transparent_color.ndim == 0 else (height, width, self.channel_count)
+        self.canvas = numpy.empty(shape, dtype = numpy.uint8)
+        self.canvas[...] = self.transparent_color
+        self._previous_rectangle = None
+
+    ## \return The width of the canvas, in pixels.
+    @property
+    def width(self) -> int:
+        return self.canvas.shape[1]
+
+    ## \return The height of the canvas, in pixels.
+    @property
+    def height(self) -> int:
+        return self.canvas.shape[0]
+
+    ## Clears the previous frame from the canvas and places another.
+    ## \param[in] pixels - The pixels of the frame, as an array with one row for each line of the frame.
+    ## \param[in] left, top - The position of the frame on the canvas. Any part outside the canvas is cut off.
+    ## \return The dirty rectangle, as (left, top, width, height), or None if no pixels changed.
+    def place(self, pixels: numpy.ndarray, left: int, top: int) -> Optional[Tuple[int, int, int, int]]:
+        # FIND WHERE THE FRAME GOES.
+        frame_height, frame_width = pixels.shape[:2]
+        rectangle = self._clip(left, top, frame_width, frame_height)
+        affected_rectangle = self._union(self._previous_rectangle, rectangle)
+        if affected_rectangle is None:
+            return None
+        affected_slices = self._slices(affected_rectangle)
+        pixels_before = self.canvas[affected_slices].copy()
+
+        # CLEAR THE PREVIOUS FRAME.
+        if self._previous_rectangle is not None:
+            self.canvas[self._slices(self._previous_rectangle)] = self.transparent_color
+        self._previous_rectangle = rectangle
+
+        # COPY THE OPAQUE PIXELS OF THIS FRAME.
+        if rectangle is not None:
+            clipped_left, clipped_top, clipped_width, clipped_height = rectangle
+            source = pixels[clipped_top - top:clipped_top - top + clipped_height, clipped_left - left:clipped_left - left + clipped_width]
+            opaque = self._differs(source, self.transparent_color)
+            self.canvas[self._slices(rectangle)][opaque] = source[opaque]
+
+        # FIND THE DIRTY RECTANGLE.
+        changed = self._differs(pixels_before, self.canvas[affected_slices])
+        changed_rows = numpy.flatnonzero(changed.any(axis = 1))
+        if len(changed_rows) == 0:
+            return None
+        changed_columns = numpy.flatnonzero(changed.any(axis = 0))
+        affected_left, affected_top, _, _ = affected_rectangle
+        return (affected_left + int(changed_columns[0]), affected_top + int(changed_rows[0]),
+            int(changed_columns[-1] - changed_columns[0]) + 1, int(changed_rows[-1] - changed_rows[0]) + 1)
+
+    ## \return A copy of part of the canvas as an image.
+    ## \param[in] mode - The mode of the image, like P or RGB.
+    ## \param[in] palette - For paletted images, the RGB bytes of the palette.
+    ## \param[in] rectangle - The part of the canvas to copy, as (left, top, width, height). None for the whole canvas.
+    def image(self, mode: str, palette: bytes = None, rectangle = None) -> Image.Image:
+        # The pixels are copied, since the canvas changes with the next frame.
+        pixels = self.canvas if rectangle is None else self.canvas[self._slices(rectangle)]
+        image = Image.frombytes(mode, (pixels.shape[1], pixels.shape[0]), pixels.tobytes())
+        if palette is not None:
+            image.putpalette(palette)
+        return image
+
+    ## \return The pixels in part of the canvas, row by row.
+    def pixels_in(self, rectangle) -> bytes:
+        return self.canvas[self._slices(rectangle)].tobytes()
+
+    ## \return The part of a rectangle that is on the canvas, or None if none of it is.
+    def _clip(self, left: int, top: int, width: int, height: int):
+        clipped_left = max(left, 0)
+        clipped_top = max(top, 0)
+        clipped_right = min(left + width, self.width)
+        clipped_bottom = min(top + height, self.height)
+        if (clipped_right <= clipped_left) or (clipped_bottom <= clipped_top):
+            return None
+        return (clipped_left, clipped_top, clipped_right - clipped_left, clipped_bottom - clipped_top)
+
+    ## \return The smallest rectangle that contains both rectangles, either of which can be None.
+    @staticmethod
+    def _union(first_rectangle, second_rectangle):
+        if first_rectangle is None:
+            return second_rectangle
+        if second_rectangle is None:
+            return first_rectangle
+        left = min(first_rectangle[0], second_rectangle[0])
+        top = min(first_rectangle[1], second_rectangle[1])
+        right = max(first_rectangle[0] + first_rectangle[2], second_rectangle[0] + second_rectangle[2])
+        bottom = max(first_rectangle[1] + first_rectangle[3], second_rectangle[1] + second_rectangle[3])
+        return (left, top, right - left, bottom - top)
+
+    ## \return The slices that select a rectangle of the canvas.
+    @staticmethod
+    def _slices(rectangle):
+        left, top, width, height = rectangle
+        return (slice(top, top + height), slice(left, left + width))
+
+    ## \return For each pixel, whether its color differs between the two arrays.
+    @staticmethod
+    def _differs(first_pixels: numpy.ndarray, second_pixels: numpy.ndarray) -> numpy.ndarray:
+        differs = (first_pixels != second_pixels)
+        return differs if differs.ndim == 2 else differs.any(axis = 2)
+
+## Writes the changes between the frames of an animation as one compact binary file:
+## a DELTA_STREAM_HEADER and then, for each frame, a DELTA_STREAM_FRAME_HEADER with its
+## dirty rectangle followed by the pixels in that rectangle. The first frame changes a blank canvas.
+## \param[in] file - A writable binary file.
+## \param[in] compositor - The compositor the frames were placed with.
+## \param[in] frame_deltas - For each frame, its dirty rectangle and the pixels in it (or None if nothing changed).
+def write_delta_stream(file, compositor: AnimationCompositor, frame_deltas):
+    file.write(DELTA_STREAM_HEADER.pack(DELTA_STREAM_SIGNATURE, DELTA_STREAM_VERSION,
+        compositor.width, compositor.height, compositor.channel_count, len(frame_deltas)))
+    for frame_delta in frame_deltas:
+        if frame_delta is None:
+            file.write(DELTA_STREAM_FRAME_HEADER.pack(0, 0, 0, 0))
+            continue
+        rectangle, pixels = frame_delta
+        file.write(DELTA_STREAM_FRAME_HEADER.pack(*rectangle))
+        file.write(pixels)
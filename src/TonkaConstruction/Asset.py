@@ -1,23 +1,53 @@
 
-import logging
 import io
+import os
+import json
+import logging
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from struct import Struct
+
+import numpy
+from PIL import Image
 
-import self_documenting_struct as struct
 from asset_extraction_framework.File import File
 from asset_extraction_framework.Asset.Animation import Animation
 from asset_extraction_framework.Asset.Image import RectangularBitmap
 from asset_extraction_framework.Asset.Sound import Sound
 
-# ATTEMPT TO IMPORT THE C-BASED DECOMPRESSION LIBRARY.
-try:
-    # We will fall back to the pure Python implementation if it doesn't work, but there is easily a 
-    # 10x slowdown with pure Python.
-    import PackBits
-    packbits_c_loaded = True
-except ImportError:
-    print('WARNING: The C PackBits decompression binary is not available on this installation. Expect decompression to be SLOW.')
-    packbits_c_loaded = False
+from .PackBitsDecompression import decompress_frame_bitmap, decompress_pack_bits_with_numpy
+from .ExportWriter import ExportWriter
+from .ContentStore import export_bitmap
+from .Profiler import profile_phase, profile_count
+from .FrameTable import FrameTable, FRAME_TABLE_DTYPE, NO_AUDIO_POINTER
+from .AudioTrack import AudioTrack
+from .AssetTypeCodes import asset_type_name
+from .SpriteAtlas import SpriteAtlas
+from .AnimationCompositor import AnimationCompositor, write_delta_stream
+
+# The color index that is transparent in all asset frames.
+# Corresponds to 0x0dff0b in the palette.
+ALPHA_COLOR = 0x0f
+
+# The fixed header at the start of each asset, 0x80 bytes in all:
+#  - Three type codes,
+#  - The frame count and frame contents,
+#  - The width and height,
+#  - 0x56 unknown bytes,
+#  - The left and top coordinates,
+#  - 0x04 unknown bytes,
+#  - The horizontal and vertical resolution,
+#  - 0x0c unknown bytes,
+#  - The hotspot x and y coordinates.
+ASSET_HEADER = Struct('<3H2H2H86s2h4s2H12s2H')
+# The header at the start of each frame:
+#  - The width and height,
+#  - The uncompressed and compressed bitmap sizes,
+#  - The audio length,
+#  - The left and top coordinates.
+FRAME_HEADER = Struct('<2L3L2h')
+FRAME_DIMENSIONS = Struct('<2L')
 
 ## Each asset has a series of frames that can contain a still frame only, 
 ## audio and a still frame, or unnown data. All assets share this animation-
@@ -43,92 +73,196 @@ class Asset(Animation):
     ## Reads and parses a complete asset.
     ## \param[in,out] file - The module file that contains this asset.
     ##                The stream must be pointing to the first byte of the asset.
-    def __init__(self, file: File):
+    ## \param[in] read_frames - When False, only the fixed asset header is read.
+    ##            The frames can then be read later with read_frames.
+    def __init__(self, file: File, read_frames: bool = True):
         # SET THE METADATA.
         super().__init__()
         self.name = None
-        self._alpha_color = 0x0f # Corresponds to 0x0dff0b in the palette.
+        self._alpha_color = ALPHA_COLOR
         self.bitmaps_per_audio = 8
 
+        # READ THE HEADER.
+        (*type_codes, frame_count, contents, width, height, unk1, left, top, unk2,
+            horizontal_resolution, vertical_resolution, unk3, hotspot_x, hotspot_y) = \
+            ASSET_HEADER.unpack(file.stream.read(ASSET_HEADER.size))
+
         # GET THE TYPE OF THE ASSET.
         # The asset type is determined by the first six bytes of the asset.
-        # First, the type codes must be read.
-        TYPE_CODE_COUNT = 3
-        type_codes = []
-        for _ in range(TYPE_CODE_COUNT):
-            type_codes.append(struct.unpack.uint16_le(file.stream))
-        # Then, the type codes are assigned to a human-readable type,
-        # so the types are easier to manage.
-        if type_codes == [0x00, 0x00, 0x00]:
-            self.type = self.AssetType.AUDIO_ONLY
-        elif type_codes == [0x00, 0x01, 0x01]:
-            self.type = self.AssetType.EARTH_COMPONENT
-        elif type_codes == [0x01, 0x01, 0x01]:
-            self.type = self.AssetType.TIMED_ANIMATION
-        elif type_codes == [0x02, 0x01, 0x01]:
-            self.type = self.AssetType.CLICKABLE_STILL
-        elif type_codes == [0x03, 0x01, 0x01]:
-            self.type = self.AssetType.SCRIPTED_ANIMATION
-        elif type_codes[0:2] == [0x01, 0x0c]:
+        self.type = self.AssetType[asset_type_name(type_codes)]
+        if self.type == self.AssetType.CURSOR:
             # The cursor type also stores cursor information in the type code.
-            # TODO: Further specify these.
-            self.type = self.AssetType.CURSOR
             self.cursor_directions = type_codes[-2]
             self.cursor_facets = type_codes[-1]
-        else:
-            # HALT ON AN UNKNOWN TYPE CODE.
-            raise ValueError(f"Unknown asset type codes: {type_codes}")
 
         # CALCULATE THE NUMBER OF FRAMES IN THIS ANIMATION.
-        frame_count = struct.unpack.uint16_le(file.stream)
         if self.type == self.AssetType.CURSOR:
             # For cursors, the frame count only indicates the number of .
             frame_count *= (self.cursor_directions * self.cursor_facets)
 
         # SET THE EXPECTED CONTENTS OF THE FRAMES IN THIS ASSET.
         # A frame can contain video only, video and audio, or have unknown contents.
-        self.contents = self.FrameContents(struct.unpack.uint16_le(file.stream))
+        self.contents = self.FrameContents(contents)
 
-        # READ THE DIMENSIONS OF THE ANIMATION.
+        # SET THE DIMENSIONS OF THE ANIMATION.
         # Note that these values might not be the true dimensions of the animation,
         # as would be calculated from the actual dimensions of the frames in the animation.
-        self._width = struct.unpack.uint16_le(file.stream)
-        self._height = struct.unpack.uint16_le(file.stream)
+        self._width = width
+        self._height = height
 
         # TODO: I don't know what's in here.
-        self.unk1 = file.stream.read(0x56)
+        self.unk1 = unk1
 
-        # READ THE COORDINATES OF THE ANIMATION.
-        self._left = struct.unpack.int16_le(file.stream)
-        self._top = struct.unpack.int16_le(file.stream)
+        # SET THE COORDINATES OF THE ANIMATION.
+        self._left = left
+        self._top = top
 
         # TODO: I don't know what's in here.
-        self.unk2 = file.stream.read(0x04)
+        self.unk2 = unk2
 
-        # READ THE RESOLUTION OF THE ANIMATION. 
+        # SET THE RESOLUTION OF THE ANIMATION. 
         # TODO: I don't think this is actually resolution.
-        self.horizontal_resolution = struct.unpack.uint16_le(file.stream)
-        self.vertical_resolution = struct.unpack.uint16_le(file.stream)
+        self.horizontal_resolution = horizontal_resolution
+        self.vertical_resolution = vertical_resolution
 
         # TODO: I don't know what's in here.
-        self.unk3 = file.stream.read(0x0c)
+        self.unk3 = unk3
 
-        # READ THE HOTSPOT.
+        # SET THE HOTSPOT.
         # If this asset is not clickable, these will both be zero.
-        self.hotspot_x = struct.unpack.uint16_le(file.stream)
-        self.hotspot_y = struct.unpack.uint16_le(file.stream)
+        self.hotspot_x = hotspot_x
+        self.hotspot_y = hotspot_y
 
         # READ THE ANIMATION FRAME START POINTERS.
+        self._frame_start_pointers = None
         if self.contents == self.FrameContents.VIDEO_ONLY:
             # These pointers are relative to the entire DAT file, not just this asset. 
             # Each points to the beginning of the header of a video frame in this animation.
             # For some reason, a pointer table is not provided for frames that also have audio.
-            # These pointers are just ignored.
-            frame_start_pointers = []
-            for _ in range(frame_count):
-                frame_start_pointers.append(file.stream.read(4))
+            # They let any frame be read without reading the frames before it.
+            self._frame_start_pointers = parse_frame_start_pointers(file.stream.read(4 * frame_count), frame_count)
+
+        # REMEMBER WHERE THE FRAMES START.
+        # This lets the frames be read later, independently of the header.
+        self._file = file
+        self._frame_count = frame_count
+        self._frames_pointer = file.stream.tell()
+        self._frames_read = False
+        self._frame_table = None
+        self._frame_deltas = None
+        self._animation_framing_applied = False
+        if read_frames:
+            self.read_frames(file)
+
+    ## Creates an asset from its records in a parse index, without reading any headers.
+    ## \param[in,out] file - The module file that contains this asset.
+    ## \param[in] record - The record of this asset, as created by to_index_record.
+    ## \param[in] frame_records - The records of the frames in this asset, in order.
+    @classmethod
+    def from_index_record(cls, file: File, record, frame_records):
+        # SET THE HEADER FIELDS.
+        # These are set in the same order as when the asset is parsed,
+        # so the exported metadata is the same either way.
+        asset = cls.__new__(cls)
+        Animation.__init__(asset)
+        asset.name = None
+        asset._alpha_color = ALPHA_COLOR
+        asset.bitmaps_per_audio = 8
+        asset.type = cls.AssetType[record['type']]
+        if asset.type == cls.AssetType.CURSOR:
+            asset.cursor_directions = record['cursor_directions']
+            asset.cursor_facets = record['cursor_facets']
+        asset.contents = cls.FrameContents(record['contents'])
+        asset._width = record['width']
+        asset._height = record['height']
+        asset.unk1 = record['unk1']
+        asset._left = record['left']
+        asset._top = record['top']
+        asset.unk2 = record['unk2']
+        asset.horizontal_resolution = record['horizontal_resolution']
+        asset.vertical_resolution = record['vertical_resolution']
+        asset.unk3 = record['unk3']
+        asset.hotspot_x = record['hotspot_x']
+        asset.hotspot_y = record['hotspot_y']
+        asset._file = file
+        asset._frame_count = record['frame_count']
+        asset._frames_pointer = record['frames_pointer']
+        asset._frame_start_pointers = None
+        if asset.contents == cls.FrameContents.VIDEO_ONLY:
+            # The frame start pointers are just before the frames.
+            frame_start_pointers_pointer = asset._frames_pointer - (4 * asset._frame_count)
+            frame_start_pointers = file.payload_at(frame_start_pointers_pointer, 4 * asset._frame_count)
+            asset._frame_start_pointers = parse_frame_start_pointers(frame_start_pointers, asset._frame_count)
+
+        # CREATE THE FRAME TABLE.
+        # Frame objects (and their audio) are only created when they are first accessed.
+        asset._frames_read = True
+        asset._frame_table = FrameTable.from_index_records(file, frame_records)
+        asset._frame_deltas = None
+        asset._animation_framing_applied = False
+        asset._frames = None
+        asset._sounds = None
+        return asset
+
+    ## \return The header fields of this asset, for a parse index.
+    ##         The frames have their own records.
+    def to_index_record(self) -> dict:
+        return {
+            'type': self.type.name,
+            'cursor_directions': getattr(self, 'cursor_directions', None),
+            'cursor_facets': getattr(self, 'cursor_facets', None),
+            'frame_count': self._frame_count,
+            'contents': self.contents.value,
+            'width': self._width,
+            'height': self._height,
+            'unk1': self.unk1,
+            'left': self._left,
+            'top': self._top,
+            'unk2': self.unk2,
+            'horizontal_resolution': self.horizontal_resolution,
+            'vertical_resolution': self.vertical_resolution,
+            'unk3': self.unk3,
+            'hotspot_x': self.hotspot_x,
+            'hotspot_y': self.hotspot_y,
+            'frames_pointer': self._frames_pointer}
+
+    ## Reads the frames (and any interleaved audio) of this asset.
+    ## Frames are only read once; later calls do nothing.
+    ##
+    ## When the asset has frame start pointers, each frame is read from its pointer.
+    ## If the pointers disagree with the frames they point to, the frames are
+    ## scanned in sequence instead, as they are for assets without pointers.
+    ## \param[in,out] file - The module file that contains this asset.
+    ##                The stream need not be at any particular position.
+    def read_frames(self, file: File):
+        if self._frames_read:
+            return
+        self._frames_read = True
 
         # READ THE ASSET FRAMES.
+        with profile_phase('frame_headers'):
+            frame_records = None
+            if self._frame_start_pointers is not None:
+                frame_records = self._read_frame_records_at_start_pointers(file)
+                if frame_records is None:
+                    logging.warning(f'The frame start pointers of an asset at 0x{self._frames_pointer:08x} disagree with its frames; scanning its frames in sequence instead.')
+            if frame_records is None:
+                frame_records, _ = self._scan_frame_records(file)
+        profile_count('frames_read', len(frame_records))
+
+        # CREATE THE FRAME TABLE.
+        # Frame objects (and their audio) are only created when they are first accessed.
+        self._frame_table = FrameTable(file, numpy.array(frame_records, dtype = FRAME_TABLE_DTYPE))
+        self._frames = None
+        self._sounds = None
+
+    ## Reads the frames of this asset one after another.
+    ## \return The records of the complete frames, and the position of each of their headers.
+    def _scan_frame_records(self, file: File):
+        file.stream.seek(self._frames_pointer)
+        frame_count = self._frame_count
+        frame_records = []
+        frame_header_pointers = []
         for frame_id in range(frame_count):
             logging.debug(f" ### Frame {frame_id+1} of {frame_count} ###")
             # PARSE THE FRAME.
@@ -145,17 +279,162 @@ class Asset(Animation):
             # Bitmap-only animations and frames between audio chunks have a single frame per iteration.
             asset_has_audio = (self.contents != self.FrameContents.VIDEO_ONLY)
             audio_expected_after_this_frame = (frame_id % self.bitmaps_per_audio == 0) and (asset_has_audio)
-            frame = AssetFrame(file, frame_id, audio_expected = audio_expected_after_this_frame)
+            frame_header_pointer = file.stream.tell()
+            frame_record = read_frame_record(file, frame_id, audio_expected = audio_expected_after_this_frame)
 
-            # ADD ALL COMPLETE FRAMES TO THE BITMAP SET.
+            # ADD ALL COMPLETE FRAMES TO THE FRAME TABLE.
             # Extra frames should never exist in the first place, so they are just thrown away.
-            if not frame.ignore_frame:
-                frame._palette = file.background._palette
-                self.frames.append(frame)
-
-            # ADD ANY AUDIO TO THE AUDIO SET.
+            if frame_record is not None:
+                frame_records.append(frame_record)
+                frame_header_pointers.append(frame_header_pointer)
+        return frame_records, frame_header_pointers
+
+    ## Reads each frame of this asset from its frame start pointer.
+    ## \return The records of the frames, or None if the pointers disagree with the frames.
+    ##         Each frame must be complete and must end exactly where the next frame starts.
+    def _read_frame_records_at_start_pointers(self, file: File) -> Optional[list]:
+        frame_start_pointers = self._frame_start_pointers.tolist()
+        if (len(frame_start_pointers) == 0) or (frame_start_pointers[0] != self._frames_pointer):
+            return None
+        frame_records = []
+        for frame_index, frame_start_pointer in enumerate(frame_start_pointers):
+            # READ THE FRAME.
+            if frame_start_pointer + FRAME_HEADER.size > len(file.stream):
+                return None
+            file.stream.seek(frame_start_pointer)
+            frame_record = read_frame_record(file, frame_index)
+            if frame_record is None:
+                return None
+
+            # MAKE SURE THE NEXT FRAME STARTS WHERE THIS ONE ENDS.
+            end_of_frame_pointer = file.stream.tell()
+            is_last_frame = (frame_index == len(frame_start_pointers) - 1)
+            if not is_last_frame and (frame_start_pointers[frame_index + 1] != end_of_frame_pointer):
+                return None
+            frame_records.append(frame_record)
+        return frame_records
+
+    ## Compares the frame start pointers of this asset with the frames found by reading
+    ## the frames in sequence. The frames are scanned for this even if they were already read.
+    ## \return A description of each disagreement. Empty if they agree or there are no pointers.
+    def frame_start_pointer_mismatches(self) -> List[str]:
+        if self._frame_start_pointers is None:
+            return []
+        _, frame_header_pointers = self._scan_frame_records(self._file)
+        frame_start_pointers = self._frame_start_pointers.tolist()
+        mismatches = []
+        if len(frame_start_pointers) != len(frame_header_pointers):
+            mismatches.append(f'{len(frame_start_pointers)} frame start pointers, but {len(frame_header_pointers)} frames')
+        for frame_index, (frame_start_pointer, frame_header_pointer) in enumerate(zip(frame_start_pointers, frame_header_pointers)):
+            if frame_start_pointer != frame_header_pointer:
+                mismatches.append(f'Frame {frame_index} starts at 0x{frame_header_pointer:08x}, but its pointer is 0x{frame_start_pointer:08x}')
+        return mismatches
+
+    ## \return The frame at the given index, without reading the frames before it when possible.
+    ##         Frames of assets with frame start pointers are read directly from their pointers.
+    ##         Otherwise, the frames are read in sequence first (if they weren't already).
+    ## \param[in] index - The index of the frame in this asset.
+    def frame(self, index: int) -> 'AssetFrame':
+        # USE ANY FRAMES THAT ARE ALREADY READ.
+        if self._frames_read:
+            if self._frames is not None:
+                return self._frames[index]
+            frame = AssetFrame.from_index_record(self._frame_table.file, self._frame_table.index_record(index))
+            frame._palette = self._frame_table.file.background._palette
+            return frame
+
+        # SEEK TO THE FRAME.
+        # The pointer must point somewhere in the frames of this asset.
+        if self._frame_start_pointers is not None:
+            frame_start_pointer = int(self._frame_start_pointers[index])
+            pointer_is_plausible = (self._frames_pointer <= frame_start_pointer) and \
+                (frame_start_pointer + FRAME_HEADER.size <= len(self._file.stream))
+            if pointer_is_plausible:
+                self._file.stream.seek(frame_start_pointer)
+                frame = AssetFrame(self._file, index)
+                if not frame.ignore_frame:
+                    frame._palette = self._file.background._palette
+                    return frame
+
+        # READ ALL THE FRAMES.
+        # Frames without pointers (or with bad pointers) can only be found by reading the frames before them.
+        self.read_frames(self._file)
+        return self.frame(index)
+
+    ## Decompresses the bitmaps of all the frames in this asset on several threads at once,
+    ## so later reads of their pixels are answered from the pixel cache.
+    ## The C decompressor releases the global interpreter lock, so frames are decompressed in parallel.
+    ## \param[in] thread_count - The number of threads to decompress frames on.
+    def decode_frames(self, thread_count: int):
+        self.read_frames(self._file)
+        frames_with_bitmaps = self._frame_table[self._frame_table['compressed_image_data_size'] > 0]
+        with ThreadPoolExecutor(max_workers = thread_count) as executor:
+            for _ in executor.map(lambda frame_view: frame_view.pixels, frames_with_bitmaps):
+                pass
+
+    ## \return The frames in this asset. If they have not been read yet, they are read now.
+    ##         Frame objects are created from the frame table the first time they are
+    ##         accessed and are then kept until released.
+    @property
+    def frames(self) -> List['AssetFrame']:
+        if not self._frames_read:
+            self.read_frames(self._file)
+        if self._frames is None:
+            self._create_frames()
+        return self._frames
+
+    @frames.setter
+    def frames(self, frames: List['AssetFrame']):
+        self._frames = frames
+
+    ## \return The audio chunks in this asset, in order. These are created with the frames.
+    @property
+    def sounds(self) -> List[Sound]:
+        if not self._frames_read:
+            self.read_frames(self._file)
+        if self._sounds is None:
+            self._create_frames()
+        return self._sounds
+
+    @sounds.setter
+    def sounds(self, sounds: List[Sound]):
+        self._sounds = sounds
+
+    ## \return The frame table of this asset, or None if the frames have not been read yet.
+    ##          The frame table describes the frames without creating frame objects.
+    def frame_table(self) -> Optional[FrameTable]:
+        return self._frame_table
+
+    ## \return The audio of this asset as one track that can be streamed from the module,
+    ##         or None if this asset has no audio or its frames have not been read yet.
+    def audio_track(self) -> Optional[AudioTrack]:
+        if self._frame_table is None:
+            return None
+        return AudioTrack.from_frame_table(self._frame_table)
+
+    ## Releases the frame objects (and their audio) of this asset, like after the asset is exported.
+    ## They are created again from the frame table if they are accessed again.
+    ## Frames that do not come from a frame table cannot be released.
+    def release_frames(self):
+        if self._frame_table is not None:
+            self._frames = None
+            self._sounds = None
+            # The frames are created again without their framing.
+            self._animation_framing_applied = False
+
+    ## Creates the frame objects (and their audio) from the frame table.
+    def _create_frames(self):
+        frames = []
+        sounds = []
+        palette = self._frame_table.file.background._palette
+        for frame_record in self._frame_table.index_records():
+            frame = AssetFrame.from_index_record(self._frame_table.file, frame_record)
+            frame._palette = palette
+            frames.append(frame)
             if frame.audio is not None:
-                self.sounds.append(frame.audio)
+                sounds.append(frame.audio)
+        self._frames = frames
+        self._sounds = sounds
 
     ## Exports the assets in this module.
     ## \param[in] directory_path - The directory where the assets should be exported.
@@ -175,7 +454,11 @@ class Asset(Animation):
             command_line_arguments.animation_format = 'none'
 
             # EXPORT THE ASSET AS DISCRETE FRAMES/AUDIO FILES.
-            super().export(directory_path, command_line_arguments)
+            # The frames are packed into one sprite atlas instead, if requested.
+            if getattr(command_line_arguments, 'sprite_atlas', False) and (command_line_arguments.bitmap_format not in ('none', 'raw')):
+                self._export_sprite_atlas(directory_path, command_line_arguments)
+            else:
+                self._export_frames_and_sounds(directory_path, command_line_arguments)
             # Restore the former arguments.
             command_line_arguments.bitmap_options = saved_bitmap_options
             command_line_arguments.animation_format = saved_animation_format
@@ -183,7 +466,163 @@ class Asset(Animation):
             # EXPORT THE ASSET WITH THE REQUESTED SETTINGS.
             # Since this asset is an animation, we don't need to make
             # any change.
+            self._export_frames_and_sounds(directory_path, command_line_arguments)
+
+    ## Exports the frames and audio of this asset like the base class does, except that
+    ## the audio is streamed from the module as one track rather than joined from its chunks,
+    ## and files are queued on the active export writer, if there is one.
+    ## \param[in] directory_path - The directory where the asset should be exported.
+    ## \param[in] command_line_arguments - All the command-line arguments provided to the 
+    ##            script that invoked this function.
+    def _export_frames_and_sounds(self, directory_path: str, command_line_arguments):
+        audio_track = self.audio_track()
+        if audio_track is None:
             super().export(directory_path, command_line_arguments)
+            self._export_frame_deltas(directory_path)
+            return
+
+        # EXPORT THE FRAMES.
+        # The base class would write the audio itself, so it is hidden while the frames are exported.
+        if len(self.frames) > 0:
+            sounds = self._sounds
+            self._sounds = []
+            try:
+                super().export(directory_path, command_line_arguments)
+            finally:
+                self._sounds = sounds
+            self._export_frame_deltas(directory_path)
+            audio_directory_path = os.path.join(directory_path, self.name)
+        else:
+            # Assets with only audio don't get their own subdirectory.
+            audio_directory_path = directory_path
+
+        # EXPORT THE AUDIO.
+        self._export_sounds(audio_track, os.path.join(audio_directory_path, 'audio'), command_line_arguments)
+
+    ## Exports the dirty rectangles of the frames, if they were recorded when the frames were placed,
+    ## next to the frames: dirty_rectangles.json gives the rectangle of each frame (None for frames
+    ## that change nothing), and deltas.bin is the delta stream written by write_delta_stream.
+    def _export_frame_deltas(self, directory_path: str):
+        if self._frame_deltas is None:
+            return
+        compositor, frame_deltas = self._frame_deltas
+        self._frame_deltas = None
+        frame_directory_path = os.path.join(directory_path, self.name)
+        dirty_rectangles = {'width': compositor.width, 'height': compositor.height,
+            'frames': [frame_delta[0] if frame_delta is not None else None for frame_delta in frame_deltas]}
+        encoded_delta_stream = io.BytesIO()
+        write_delta_stream(encoded_delta_stream, compositor, frame_deltas)
+        files = ((os.path.join(frame_directory_path, 'dirty_rectangles.json'), json.dumps(dirty_rectangles).encode('utf-8')),
+            (os.path.join(frame_directory_path, 'deltas.bin'), encoded_delta_stream.getvalue()))
+        export_writer = ExportWriter.active()
+        for filepath, data in files:
+            if export_writer is not None:
+                export_writer.write(filepath, data)
+            else:
+                with open(filepath, 'wb') as file:
+                    file.write(data)
+
+    ## Exports the frames of this asset as one sprite atlas with a JSON sidecar, rather than
+    ## one file per frame. Any audio is exported next to the atlas, with the same name.
+    ## Assets without any bitmaps (like audio-only assets) are exported as they would be otherwise.
+    ## \param[in] directory_path - The directory where the asset should be exported.
+    ## \param[in] command_line_arguments - All the command-line arguments provided to the 
+    ##            script that invoked this function.
+    def _export_sprite_atlas(self, directory_path: str, command_line_arguments):
+        if not SpriteAtlas(self).export(directory_path, command_line_arguments):
+            self._export_frames_and_sounds(directory_path, command_line_arguments)
+            return
+        audio_track = self.audio_track()
+        if audio_track is not None:
+            self._export_sounds(audio_track, os.path.join(directory_path, self.name), command_line_arguments)
+
+    ## Exports the audio of this asset, queuing it on the active export writer if there is one.
+    ## Like the base class, the audio is always written as a WAV file, unless the
+    ## audio format is 'none', in which case no audio is written at all.
+    ## \param[in] audio_track - The audio of this asset.
+    ## \param[in] filepath_without_extension - Where the audio should be exported.
+    ##            The audio format is the extension.
+    ## \param[in] command_line_arguments - All the command-line arguments provided to the 
+    ##            script that invoked this function.
+    def _export_sounds(self, audio_track: AudioTrack, filepath_without_extension: str, command_line_arguments):
+        if command_line_arguments.audio_format == 'none':
+            return
+        audio_filepath = f'{filepath_without_extension}.{command_line_arguments.audio_format}'
+        export_writer = ExportWriter.active()
+        if export_writer is not None:
+            export_writer.export_audio_track(audio_track, audio_filepath)
+        else:
+            with profile_phase('audio_encoding_and_writing'):
+                audio_track.write_wave(audio_filepath)
+
+    ## Places each frame on a canvas the size of the entire animation, like the base class does.
+    ## The frames are placed with one reused canvas rather than a new image for each frame, and
+    ## frames expanded to RGB or RGBA stay expanded (the base class would convert them back to a palette).
+    ##
+    ## When dirty rectangles are requested for an animation, each frame after the first is cut down
+    ## to the rectangle that changed since the previous frame, and the changes are also recorded as
+    ## a delta stream that is exported with the frames.
+    ## \param[in] command_line_arguments - All the command-line arguments provided to the 
+    ##            script that invoked this function.
+    def _reframe_to_animation_size(self, command_line_arguments):
+        # DETERMINE WHETHER TO REFRAME THE FRAMES.
+        # Like in the base class, frames that are already framed are not framed again.
+        apply_animation_framing: bool = (command_line_arguments.bitmap_options == 'animation_framing') or \
+            (command_line_arguments.animation_format != 'none')
+        if not apply_animation_framing or self._animation_framing_applied:
+            return
+        self._frame_deltas = None
+        bounding_box = self._minimal_bounding_box
+        if bounding_box is None:
+            return
+        MAXIMUM_ANIMATION_WIDTH = 5000
+        MAXIMUM_ANIMATION_HEIGHT = 5000
+        if (bounding_box.width > MAXIMUM_ANIMATION_WIDTH) or (bounding_box.height > MAXIMUM_ANIMATION_HEIGHT):
+            return
+        # Only animations exported as frames can be cut down to their dirty rectangles.
+        export_dirty_rectangles = getattr(command_line_arguments, 'dirty_rectangles', False) and \
+            self.is_animation and (command_line_arguments.animation_format == 'none')
+
+        # PLACE EACH FRAME ON THE CANVAS.
+        # The canvas is filled with the alpha color, which is fully transparent in RGBA.
+        compositor = None
+        frame_deltas = []
+        for frame in self.frames:
+            bitmap: Image.Image = frame._exportable_image
+            if bitmap is None:
+                frame.create_exportable_image_from_pixels()
+                bitmap = frame._exportable_image
+                if bitmap is None:
+                    continue
+            palette = frame._palette.raw_rgb_bytes() if frame._palette is not None else None
+            if compositor is None:
+                alpha_color = self._alpha_color
+                if bitmap.mode != 'P':
+                    alpha_color = tuple(palette[self._alpha_color * 3:(self._alpha_color * 3) + 3])
+                    if bitmap.mode == 'RGBA':
+                        alpha_color += (0x00,)
+                compositor = AnimationCompositor(bounding_box.width, bounding_box.height, alpha_color)
+            left = frame.left - bounding_box.left
+            top = frame.top - bounding_box.top
+            dirty_rectangle = compositor.place(numpy.asarray(bitmap), left, top)
+
+            # EXPORT THE FULL CANVAS OR ONLY WHAT CHANGED.
+            # Framed bitmaps depend on where they are placed on the canvas,
+            # so this is part of their contents in a content store.
+            frame._content_framing = (bounding_box.width, bounding_box.height, left, top)
+            frame_palette = palette if bitmap.mode == 'P' else None
+            if export_dirty_rectangles:
+                frame_deltas.append((dirty_rectangle, compositor.pixels_in(dirty_rectangle)) if dirty_rectangle is not None else None)
+                if len(frame_deltas) > 1:
+                    # Frames that change nothing are not exported at all.
+                    frame._content_framing += (dirty_rectangle,)
+                    frame._exportable_image = compositor.image(bitmap.mode, frame_palette, dirty_rectangle) if dirty_rectangle is not None else None
+                    frame._include_in_export = (dirty_rectangle is not None)
+                    continue
+            frame._exportable_image = compositor.image(bitmap.mode, frame_palette)
+        if export_dirty_rectangles and (compositor is not None):
+            self._frame_deltas = (compositor, frame_deltas)
+        self._animation_framing_applied = True
 
     ## Returns True if the asset is an animation; False otherwise.
     ## Animation assets have bitmap frames intended to be placed in sequence,
@@ -199,8 +638,10 @@ class Asset(Animation):
         # Other asset types can be considered not animations
         # if they have a sufficiently few number of frames.
         DISCRETE_CUTOFF = 3
+        # Counting the frames doesn't require creating the frame objects.
+        frame_count = len(self._frame_table) if self._frames is None else len(self._frames)
         return (self.type not in (self.AssetType.CURSOR, self.AssetType.AUDIO_ONLY)) and \
-            (len(self.frames) > DISCRETE_CUTOFF)
+            (frame_count > DISCRETE_CUTOFF)
 
     ## Returns True when the bitmap has unreasonably large dimensions.
     ## This usually indicates a parsing error or extra frame.
@@ -208,6 +649,77 @@ class Asset(Animation):
     def has_too_large_dimensions(self) -> bool:
         return (self.width > 0xffff) or (self.height > 0xffff)
 
+## \return The frame start pointers in a frame start pointer table, or None if the table
+##         is truncated, like at the end of a damaged module. The frames can then only
+##         be read in order, as they are for assets that don't have this table.
+## \param[in] frame_start_pointers - The table, as read from the module.
+## \param[in] frame_count - The number of frames in the asset.
+def parse_frame_start_pointers(frame_start_pointers, frame_count: int) -> Optional[numpy.ndarray]:
+    if len(frame_start_pointers) != 4 * frame_count:
+        return None
+    return numpy.frombuffer(frame_start_pointers, dtype = '<u4').astype(numpy.int64)
+
+## Reads the header of a frame and skips past its payloads, without creating a frame object.
+## \param[in,out] file - The module file that contains this frame.
+##                The stream must be pointing to the first byte of the frame.
+##                Afterward, the stream points just past the frame.
+## \param[in] frame_index - The position of this frame in the asset.
+## \param[in] audio_expected - Whether or not this frame has audio.
+##            If this is set but the frame indicates it has no audio,
+##            no audio is recorded.
+## \return The record of this frame, with the fields of FRAME_TABLE_DTYPE in order.
+##         None if this is not a real frame; the stream is then left at the start of the frame.
+def read_frame_record(file: File, frame_index: int, audio_expected: bool = False) -> Optional[tuple]:
+    # READ THE FRAME'S DIMENSIONS.
+    # The whole header is read at once, but only the dimensions are used until the frame is known to be real.
+    frame_header = file.stream.read(FRAME_HEADER.size)
+    width, height = FRAME_DIMENSIONS.unpack_from(frame_header)
+    # On audio-only assets, sometimes there is a junk frame at the end.
+    # Not sure why. They can be discarded. These are the same checks as
+    # AssetFrame.is_inconsistent and AssetFrame.has_too_large_dimensions.
+    is_inconsistent = (width == 0 and height != 0) or (width != 0 and height == 0)
+    has_too_large_dimensions = (width > 0xffff) or (height > 0xffff)
+    skip_frame = is_inconsistent or has_too_large_dimensions
+    if skip_frame:
+        # UN-READ ALL BYTES READ FOR THIS FRAME.
+        # This data was not supposed to be consumed in the first place, as
+        # it actually belongs to the next chunk of data. It is not a real frame.
+        # Thus, the stream should be rewound as if this data was never read
+        # as part of a frame.
+        file.rewind(len(frame_header))
+        return None
+
+    # READ THE REST OF THE HEADER.
+    # This includes the nominal bitmap size (in bytes), the audio length,
+    # and the frame starting coordinates.
+    # Each audio chunk stores exactly one second of audio at the given sampling frequency.
+    (_, _, uncompressed_image_size, compressed_image_data_size, audio_length_in_bytes, left, top) = FRAME_HEADER.unpack(frame_header)
+    # Normally, each audio chunk stores exactly one second of audio at an 8-bit
+    # sampling frequency (bitrate). Thus the number of bytes to read is the same
+    # as the sampling frequency in Hertz.
+    #
+    # But for some reason, when the sampling frequency is 22.050kHz (0x5622) 
+    # and this audio chunk is the first one read, the amount of audio present
+    # is actually double the sampling frequency. So this adjustment made.
+    first_frame = (frame_index == 0)
+    double_audio_length = (first_frame == True) and (audio_length_in_bytes == 0x5622)
+    if double_audio_length:
+        audio_length_in_bytes *= 2
+
+    # SKIP THE AUDIO FOR THIS FRAME.
+    # Even when audio is expected, the audio length
+    # could still be zero to indicate no audio is actually present.
+    audio_pointer = NO_AUDIO_POINTER
+    audio_available_to_read = (audio_expected) and (audio_length_in_bytes > 0)
+    if audio_available_to_read:
+        audio_pointer = file.stream.tell()
+        file.stream.seek(min(audio_pointer + audio_length_in_bytes, len(file.stream)))
+
+    # SKIP THE COMPRESSED BITMAP FOR THIS FRAME.
+    raw_pointer = file.stream.tell()
+    file.stream.seek(min(raw_pointer + compressed_image_data_size, len(file.stream)))
+    return (width, height, uncompressed_image_size, compressed_image_data_size, audio_length_in_bytes, left, top, audio_pointer, raw_pointer)
+
 ## Reads and parses a frame in an asset.
 ## \param[in,out] file - The module file that contains this asset.
 ##                The stream must be pointing to the first byte of the asset.
@@ -224,73 +736,104 @@ class AssetFrame(RectangularBitmap):
         # If the frame is not marked valid, it will appear to have no dimensions.
         self.ignore_frame = False
         self.audio = None
+        self._content_framing = None
 
-        # READ THE FRAME'S DIMENSIONS.
-        self._width = struct.unpack.uint32_le(file.stream)
-        self._height = struct.unpack.uint32_le(file.stream)
-        # On audio-only assets, sometimes there is a junk frame at the end.
-        # Not sure why. They can be discarded.
-        skip_frame = (self.is_inconsistent) or (self.has_too_large_dimensions)
-        if skip_frame:
-            # UN-READ ALL BYTES READ FOR THIS FRAME.
-            # This data was not supposed to be consumed in the first place, as
-            # it actually belongs to the next chunk of data. It is not a real frame.
-            # Thus, the stream should be rewound as if this data was never read
-            # as part of a frame.
-            file.rewind(8)
-
-            # END PARSING THIS FRAME.
+        # READ THE FRAME.
+        frame_record = read_frame_record(file, frame_index, audio_expected)
+        if frame_record is None:
             self.ignore_frame = True
             return
-
-        # READ THE NOMINAL BITMAP SIZE, IN BYTES.
-        self.uncompressed_image_size = struct.unpack.uint32_le(file.stream)
-        self.compressed_image_data_size = struct.unpack.uint32_le(file.stream)
-
-        # READ THE AUDIO LENGTH.
-        # Each audio chunk stores exactly one second of audio at the given sampling frequency.
-        self.audio_length_in_bytes = struct.unpack.uint32_le(file.stream)
-        # Normally, each audio chunk stores exactly one second of audio at an 8-bit
-        # sampling frequency (bitrate). Thus the number of bytes to read is the same
-        # as the sampling frequency in Hertz.
-        #
-        # But for some reason, when the sampling frequency is 22.050kHz (0x5622) 
-        # and this audio chunk is the first one read, the amount of audio present
-        # is actually double the sampling frequency. So this adjustment made.
-        first_frame = (frame_index == 0)
-        double_audio_length = (first_frame == True) and (self.audio_length_in_bytes == 0x5622)
-        if double_audio_length:
-            self.audio_length_in_bytes *= 2
-
-        # READ THE FRAME STARTING COORDINATES.
-        self._left = struct.unpack.int16_le(file.stream)
-        self._top = struct.unpack.int16_le(file.stream)
-
-        # READ THE AUDIO FOR THIS FRAME.
-        # Even when audio is expected, the audio length
-        # could still be zero to indicate no audio is actually present.
-        audio_available_to_read = (audio_expected) and (self.audio_length_in_bytes > 0)
-        if audio_available_to_read:
-            # TODO: Can we turn this into a memoryview? And only reference the original file?
-            self.audio = Sound()
-            self.audio._pcm = file.stream.read(self.audio_length_in_bytes)
-            self.audio._big_endian = False
-            self.audio._sample_width = 1
-            self.audio._sample_rate = 22050
-            self.audio._channel_count = 1
-
-        # DECOMPRESS THE BITMAP FOR THIS FRAME.
+        self._set_from_record(file, dict(zip(FRAME_TABLE_DTYPE.names, frame_record)))
+
+    ## Creates a frame from its record in a frame table or parse index, without reading any headers.
+    ## Only the audio and the compressed bitmap are read, directly from their recorded positions.
+    ## \param[in,out] file - The module file that contains this frame.
+    ## \param[in] record - The record of this frame, with the FRAME_TABLE_DTYPE fields.
+    ##            An audio pointer of None indicates the frame has no audio.
+    @classmethod
+    def from_index_record(cls, file: File, record):
+        frame = cls.__new__(cls)
+        RectangularBitmap.__init__(frame)
+        frame.ignore_frame = False
+        frame.audio = None
+        frame._content_framing = None
+        frame._set_from_record(file, record)
+        return frame
+
+    ## Sets the header fields of this frame from its record and reads its payloads.
+    def _set_from_record(self, file: File, record):
+        # SET THE HEADER FIELDS.
+        self._width = record['width']
+        self._height = record['height']
+        self.uncompressed_image_size = record['uncompressed_image_size']
+        self.compressed_image_data_size = record['compressed_image_data_size']
+        self.audio_length_in_bytes = record['audio_length_in_bytes']
+        self._left = record['left']
+        self._top = record['top']
+
+        # READ THE PAYLOADS.
+        self._audio_pointer = None
+        audio_pointer = record['audio_pointer']
+        if (audio_pointer is not None) and (audio_pointer != NO_AUDIO_POINTER):
+            file.stream.seek(audio_pointer)
+            self._read_audio(file)
+        file.stream.seek(record['raw_pointer'])
+        self._read_bitmap(file)
+
+    ## \return The header fields of this frame and the positions of its payloads, for a parse index.
+    def to_index_record(self) -> dict:
+        return {
+            'width': self._width,
+            'height': self._height,
+            'uncompressed_image_size': self.uncompressed_image_size,
+            'compressed_image_data_size': self.compressed_image_data_size,
+            'audio_length_in_bytes': self.audio_length_in_bytes,
+            'left': self._left,
+            'top': self._top,
+            'audio_pointer': self._audio_pointer,
+            'raw_pointer': self._raw_pointer}
+
+    ## Reads the audio for this frame from the current stream position.
+    def _read_audio(self, file: File):
+        self._audio_pointer = file.stream.tell()
+        self.audio = Sound()
+        self.audio._pcm = file.read_payload(self.audio_length_in_bytes)
+        self.audio._big_endian = False
+        self.audio._sample_width = AudioTrack.SAMPLE_WIDTH
+        self.audio._sample_rate = AudioTrack.SAMPLE_RATE
+        self.audio._channel_count = AudioTrack.CHANNEL_COUNT
+
+    ## Reads the compressed bitmap for this frame from the current stream position.
+    ## The bitmap is decompressed only when its pixels are requested.
+    def _read_bitmap(self, file: File):
+        # Its position in the file uniquely identifies its decompressed pixels.
+        self._raw_pointer = file.stream.tell()
+        self._pixel_cache_key = (file.filepath, self._raw_pointer)
         if self.compressed_image_data_size > 0:
-            self.raw = file.stream.read(self.compressed_image_data_size)
-
+            self.raw = file.read_payload(self.compressed_image_data_size)
+
+    ## Exports the bitmap for this frame, deduplicating it with the active content store
+    ## and queuing it on the active export writer, if there are any.
+    def export(self, root_directory_path: str, command_line_arguments):
+        export_bitmap(self, root_directory_path, command_line_arguments, self._content_parts(), super().export)
+
+    ## \return Everything that determines the exported bitmap for this frame, for a content store.
+    ##         None if this frame has no compressed bitmap.
+    def _content_parts(self):
+        if self.ignore_frame or (self.compressed_image_data_size == 0):
+            return None
+        palette = self._palette._raw_bytes.getvalue() if self._palette is not None else None
+        return ('frame', palette, self._width, self._height, self.uncompressed_image_size, self._content_framing, self.raw)
+
+    ## Decompresses the bitmap for this frame. Decompressed pixels are held in
+    ## the shared pixel cache, so reading this property repeatedly does not
+    ## decompress the same bitmap repeatedly.
+    ## A malformed bitmap is reported as a warning and then treated as if there were no bitmap,
+    ## so one bad frame doesn't stop the rest of the module from being exported.
     @property
     def pixels(self):
         if not self.ignore_frame and self.compressed_image_data_size > 0:
-            if packbits_c_loaded:
-                self._pixels = PackBits.decompress(self.raw, self.compressed_image_data_size, self.uncompressed_image_size)
-            else:
-                self.decompress_bitmap()
-            return self._pixels
+            return decompress_frame_bitmap(self._pixel_cache_key, self.raw, self.compressed_image_data_size, self.uncompressed_image_size)
 
     # \return True when the image has one zero and one nonzero dimension.
     # The image should not be processed in this state.
@@ -305,30 +848,7 @@ class AssetFrame(RectangularBitmap):
         return (self.width > 0xffff) or (self.height > 0xffff)
 
     ## Applies Apple PackBits to decompress the bitmap bitstream.
-    # NOTE: This is a pure Python implementation and is slow. The C implementation should be preferred when available!
-    def decompress_bitmap(self):
-        # UNCOMPRESS THE COMPRESSED IMAGE STREAM.
-        # First, we must have a empty place to put the uncompressed bytes.
-        self._pixels = b''
-        compressed_image_data = io.BytesIO(self.raw)
-        compressed_image_data.seek(0)
-        # Read the full number of compressed bytes.
-        while compressed_image_data.tell() < self.compressed_image_data_size:
-            # Read the operation byte. 
-            n = struct.unpack.int8(compressed_image_data)
-            # An operation byte inclusively between 0x00 (+0) and 0x7f (+127) indicates
-            # an uncompressed run of the value of the operation byte plus one.
-            if n >= 0 and n <= 127:
-                run_length = n+1
-                self._pixels += compressed_image_data.read(run_length)
-            # An operation byte inclusively between 0x81 (-127) and 0xff (-1) indicates
-            # the next byte is a color that should be repeated for a run of (-n+1) pixels.
-            elif n >= -127 and n <= -1:
-                color_byte = compressed_image_data.read(1)
-                run_length = -n+1
-                color_run = color_byte * run_length
-                self._pixels += color_run
-
-        off_by_one_compression_error = (len(self._pixels) - self.uncompressed_image_size == 1)
-        if off_by_one_compression_error:
-            self._pixels = self._pixels[:-1]
+    ## \return The decompressed pixels.
+    # NOTE: This is the NumPy implementation that is used when the C implementation is not available.
+    def decompress_bitmap(self) -> bytes:
+        return decompress_pack_bits_with_numpy(self.raw, self.compressed_image_data_size, self.uncompressed_image_size)
@@ -0,0 +1,156 @@
+
+import os
+import sqlite3
+from typing import List
+
+from .Module import Module
+
+## A searchable index of the assets in many modules, so assets can be found
+## across the whole game without parsing every module.
+##
+## The catalog is a SQLite database with one row per asset. Building it reads only
+## the chunk table and the fixed asset headers of each module; no frames are read and
+## no pixels are decoded. A module is cataloged again only when its size or
+## modification time changes. Queries are answered from the database alone, and
+## only the assets selected from a query are parsed in full when they are exported.
+class AssetCatalog:
+    # Increment whenever the tables change. Catalogs with another version are rebuilt.
+    SCHEMA_VERSION = 1
+
+    # The columns of each asset, after the module path and asset index that identify it.
+    # The frame count and dimensions are as declared in the asset header.
+    ASSET_COLUMNS = ('module_filename', 'type', 'contents', 'frame_count', 'width', 'height', 'left', 'top',
+        'hotspot_x', 'hotspot_y', 'cursor_directions', 'cursor_facets', 'byte_size')
+
+    ## Opens the catalog, creating it if it doesn't exist.
+    ## \param[in] database_path - The path to the SQLite database that holds the catalog.
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        self._connection = sqlite3.connect(database_path, timeout = 60)
+        self._connection.row_factory = sqlite3.Row
+        self._create_tables()
+
+    ## Closes the catalog.
+    def close(self):
+        self._connection.close()
+
+    ## Adds the assets in the given modules to the catalog.
+    ## Modules already cataloged with the same size and modification time are skipped.
+    ## \param[in] module_filepaths - The full paths to the module files.
+    ## \return The number of modules that were cataloged.
+    def build(self, module_filepaths: List[str]) -> int:
+        cataloged_module_count = 0
+        for module_filepath in module_filepaths:
+            # CHECK WHETHER THE MODULE IS ALREADY CATALOGED.
+            path = os.path.realpath(module_filepath)
+            file_status = os.stat(path)
+            module_record = self._connection.execute('SELECT * FROM modules WHERE path = ?', (path,)).fetchone()
+            module_is_current = (module_record is not None) and \
+                (module_record['size'] == file_status.st_size) and \
+                (module_record['modification_time'] == file_status.st_mtime_ns)
+            if module_is_current:
+                continue
+
+            # READ THE ASSET HEADERS.
+            # Nothing else in the module is needed.
+            module = Module(path, lazy = True, zero_copy = True)
+            asset_records = [self._asset_record(module, index, asset) for index, asset in enumerate(module.asset_headers())]
+
+            # RECORD THE ASSETS.
+            with self._connection:
+                self._connection.execute('DELETE FROM assets WHERE module_path = ?', (path,))
+                for asset_index, asset_record in enumerate(asset_records):
+                    values = (path, asset_index, *asset_record.values())
+                    placeholders = ', '.join('?' * len(values))
+                    self._connection.execute(f'INSERT INTO assets VALUES ({placeholders})', values)
+                self._connection.execute('INSERT OR REPLACE INTO modules VALUES (?, ?, ?)',
+                    (path, file_status.st_size, file_status.st_mtime_ns))
+            cataloged_module_count += 1
+        return cataloged_module_count
+
+    ## Finds the assets that match all the given criteria. Criteria that are None are ignored.
+    ## \param[in] types - The names of the asset types to include, like CURSOR.
+    ## \param[in] contents - The names of the frame contents to include, like AUDIO_AND_VIDEO.
+    ## \param[in] module_pattern - A glob pattern the module filename must match, like MODULE1*.DAT.
+    ## \param[in] has_hotspot - When True, include only assets with a nonzero hotspot;
+    ##            when False, only assets without one.
+    ## \param[in] minimum_frame_count, maximum_frame_count - The bounds of the declared frame count.
+    ## \return The matching assets, in the order of their modules and then their position
+    ##         in the module. Each has the module path, the asset index, and the ASSET_COLUMNS.
+    def query(self, types: List[str] = None, contents: List[str] = None, module_pattern: str = None,
+            has_hotspot: bool = None, minimum_frame_count: int = None, maximum_frame_count: int = None) -> List[sqlite3.Row]:
+        # BUILD THE CONDITIONS.
+        conditions = []
+        parameters = []
+        if types is not None:
+            conditions.append(f'type IN ({", ".join("?" * len(types))})')
+            parameters.extend(types)
+        if contents is not None:
+            conditions.append(f'contents IN ({", ".join("?" * len(contents))})')
+            parameters.extend(contents)
+        if module_pattern is not None:
+            conditions.append('module_filename GLOB ?')
+            parameters.append(module_pattern)
+        if has_hotspot is not None:
+            conditions.append('(hotspot_x != 0 OR hotspot_y != 0)' if has_hotspot else '(hotspot_x = 0 AND hotspot_y = 0)')
+        if minimum_frame_count is not None:
+            conditions.append('frame_count >= ?')
+            parameters.append(minimum_frame_count)
+        if maximum_frame_count is not None:
+            conditions.append('frame_count <= ?')
+            parameters.append(maximum_frame_count)
+
+        # FIND THE ASSETS.
+        where_clause = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        return self._connection.execute(
+            f'SELECT * FROM assets {where_clause} ORDER BY module_path, asset_index', parameters).fetchall()
+
+    ## Exports the given assets. Each module is opened once, and only the selected
+    ## assets in it are parsed in full and exported. Backgrounds are not exported.
+    ## \param[in] asset_records - The assets to export, as returned by query.
+    ## \param[in] directory_path - The directory where the module export directories should be created.
+    ## \param[in] command_line_arguments - The export options, like for Module.export_assets.
+    def export(self, asset_records, directory_path: str, command_line_arguments):
+        asset_indices_by_module = {}
+        for asset_record in asset_records:
+            asset_indices_by_module.setdefault(asset_record['module_path'], []).append(asset_record['asset_index'])
+        for module_path, asset_indices in asset_indices_by_module.items():
+            print(f'INFO: Exporting {len(asset_indices)} asset(s) in {module_path}')
+            module = Module(module_path, lazy = True, zero_copy = command_line_arguments.zero_copy)
+            module.export_assets(directory_path, command_line_arguments, asset_indices = asset_indices)
+
+    ## \return The catalog columns of an asset, from its header alone.
+    @staticmethod
+    def _asset_record(module: Module, asset_index: int, asset) -> dict:
+        return {
+            'module_filename': module.filename,
+            'type': asset.type.name,
+            'contents': asset.contents.name,
+            'frame_count': asset._frame_count,
+            'width': asset._width,
+            'height': asset._height,
+            'left': asset._left,
+            'top': asset._top,
+            'hotspot_x': asset.hotspot_x,
+            'hotspot_y': asset.hotspot_y,
+            'cursor_directions': getattr(asset, 'cursor_directions', None),
+            'cursor_facets': getattr(asset, 'cursor_facets', None),
+            'byte_size': module._chunk_pointers[asset_index + 1] - module._chunk_pointers[asset_index]}
+
+    ## Creates the tables of the catalog, discarding a catalog made by another version.
+    def _create_tables(self):
+        with self._connection:
+            # DISCARD AN OUTDATED CATALOG.
+            schema_version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+            if schema_version != self.SCHEMA_VERSION:
+                for table_name in ('modules', 'assets'):
+                    self._connection.execute(f'DROP TABLE IF EXISTS {table_name}')
+                self._connection.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+            # CREATE THE TABLES.
+            self._connection.execute('CREATE TABLE IF NOT EXISTS modules '
+                '(path TEXT PRIMARY KEY, size INTEGER, modification_time INTEGER)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS assets '
+                f'(module_path TEXT, asset_index INTEGER, {", ".join(self.ASSET_COLUMNS)}, PRIMARY KEY (module_path, asset_index))')
+            for column_name in ('type', 'contents', 'frame_count'):
+                self._connection.execute(f'CREATE INDEX IF NOT EXISTS assets_{column_name} ON assets ({column_name})')
@@ -0,0 +1,31 @@
+
+from struct import Struct
+
+# The type codes at the start of each asset, the first six bytes of the asset header.
+ASSET_TYPE_CODES = Struct('<3H')
+
+## Gets the type of an asset from the type codes at the start of the asset.
+## The type codes are assigned to a human-readable type, so the types are easier to manage.
+## This is kept apart from the asset parser, so assets can be classified without
+## loading any of the exporting machinery.
+## \param[in] type_codes - The three type codes, as a list.
+## \return The name of the type, as in Asset.AssetType.
+## \raises ValueError - The type codes are not known.
+def asset_type_name(type_codes) -> str:
+    if type_codes == [0x00, 0x00, 0x00]:
+        return 'AUDIO_ONLY'
+    elif type_codes == [0x00, 0x01, 0x01]:
+        return 'EARTH_COMPONENT'
+    elif type_codes == [0x01, 0x01, 0x01]:
+        return 'TIMED_ANIMATION'
+    elif type_codes == [0x02, 0x01, 0x01]:
+        return 'CLICKABLE_STILL'
+    elif type_codes == [0x03, 0x01, 0x01]:
+        return 'SCRIPTED_ANIMATION'
+    elif type_codes[0:2] == [0x01, 0x0c]:
+        # The cursor type also stores cursor information in the type code.
+        # TODO: Further specify these.
+        return 'CURSOR'
+    else:
+        # HALT ON AN UNKNOWN TYPE CODE.
+        raise ValueError(f"Unknown asset type codes: {type_codes}")
@@ -0,0 +1,66 @@
+
+import wave
+from typing import Optional
+
+import numpy
+
+## The audio of an asset as one logical track.
+##
+## The audio of an asset is stored as chunks interleaved with the frames, each holding
+## one second of audio (except the first chunk at 22.050 kHz, which holds two seconds).
+## A track records only where each chunk is in the module, so the whole track can be
+## streamed from the module into one WAV file without reading the chunks into
+## separate buffers or concatenating them first.
+class AudioTrack:
+    # All audio in the modules is 8-bit mono at 22.050 kHz.
+    SAMPLE_RATE = 22050
+    SAMPLE_WIDTH = 1
+    CHANNEL_COUNT = 1
+
+    ## \param[in] file - The module file that contains the audio.
+    ## \param[in] chunk_pointers - The position of each audio chunk in the module, in order.
+    ## \param[in] chunk_lengths - The length of each audio chunk, in bytes.
+    ##            The length of a doubled first chunk must already be doubled.
+    def __init__(self, file, chunk_pointers: numpy.ndarray, chunk_lengths: numpy.ndarray):
+        self.file = file
+        self.chunk_pointers = chunk_pointers
+        self.chunk_lengths = chunk_lengths
+
+    ## Creates the audio track of the frames in a frame table.
+    ## \return The audio track, or None if none of the frames have audio.
+    @classmethod
+    def from_frame_table(cls, frame_table) -> Optional['AudioTrack']:
+        has_audio = frame_table['audio_pointer'] >= 0
+        if not has_audio.any():
+            return None
+        return cls(frame_table.file, frame_table['audio_pointer'][has_audio], frame_table['audio_length_in_bytes'][has_audio])
+
+    ## \return The number of audio chunks in this track.
+    def __len__(self) -> int:
+        return len(self.chunk_pointers)
+
+    ## \return The length of this track, in bytes.
+    @property
+    def length_in_bytes(self) -> int:
+        return int(self.chunk_lengths.sum())
+
+    ## \return The length of this track, in seconds.
+    @property
+    def duration(self) -> float:
+        return self.length_in_bytes / (self.SAMPLE_RATE * self.SAMPLE_WIDTH * self.CHANNEL_COUNT)
+
+    ## Reads each audio chunk of this track from the module, in order.
+    ## Only one chunk is read at a time.
+    def chunks(self):
+        for chunk_pointer, chunk_length in zip(self.chunk_pointers.tolist(), self.chunk_lengths.tolist()):
+            yield self.file.payload_at(chunk_pointer, chunk_length)
+
+    ## Writes this track as an uncompressed WAV file, streaming one chunk at a time.
+    ## \param[in] wave_file_or_filepath - The filepath of the WAV file, or a writable binary file.
+    def write_wave(self, wave_file_or_filepath):
+        with wave.open(wave_file_or_filepath, 'wb') as wave_file:
+            wave_file.setnchannels(self.CHANNEL_COUNT)
+            wave_file.setsampwidth(self.SAMPLE_WIDTH)
+            wave_file.setframerate(self.SAMPLE_RATE)
+            for chunk in self.chunks():
+                wave_file.writeframes(chunk)
@@ -1,32 +1,84 @@
 
-import self_documenting_struct as struct
+import io
+from struct import Struct
+
 from asset_extraction_framework.Asset.Image import RectangularBitmap
 from asset_extraction_framework.Asset.Palette import RgbPalette
 
+from .ContentStore import export_bitmap
+
+# The header at the start of the background:
+#  - Five unknown 16-bit integers,
+#  - The filename, padded with nulls to 0x50 bytes,
+#  - Four unknown 32-bit integers,
+#  - 0x24 unknown bytes,
+#  - Two unknown 32-bit integers,
+#  - 0x14 unknown bytes,
+#  - The palette, 0x100 blue-green-red entries aligned to four bytes each,
+#  - The width, height, and pixel count,
+#  - 0x0c unknown bytes.
+BACKGROUND_HEADER = Struct('<5H80s4L36s2L20s1024s3L12s')
+
+# The header fields of a background that are stored in a parse index as they are.
+INDEXED_HEADER_FIELD_NAMES = ('unk1', 'unk2', 'unk3', 'unk4', 'unk5', 'filename', 'unk6', 'unk7', 'unk8', 'unk8_1', 'unk12', 'unk9', 'unk10', 'unk13')
+
 ## Provides a background for each module.
 class Background(RectangularBitmap):
     def __init__(self, file):
         super().__init__()
         self.name = "Background"
-        self.unk1 = struct.unpack.uint16_le(file.stream)
-        self.unk2 = struct.unpack.uint16_le(file.stream)
-        self.unk3 = struct.unpack.uint16_le(file.stream)
-        self.unk4 = struct.unpack.uint16_le(file.stream)
-        self.unk5 = struct.unpack.uint16_le(file.stream)
-        self.filename = file.stream.read(0x50).rstrip(b'\x00')
-        self.unk6 = struct.unpack.uint32_le(file.stream)
-        self.unk7 = struct.unpack.uint32_le(file.stream)
-        self.unk8 = struct.unpack.uint32_le(file.stream)
-        self.unk8_1 = struct.unpack.uint32_le(file.stream)
-        self.unk12 = file.stream.read(0x24)
-        self.unk9 = struct.unpack.uint32_le(file.stream)
-        self.unk10 = struct.unpack.uint32_le(file.stream)
-        self.unk13 = file.stream.read(0x14)
-        self._palette = RgbPalette(file.stream, has_entry_alignment = True, total_palette_entries = 0x100, blue_green_red_order = True)
-        self._width = struct.unpack.uint32_le(file.stream)
-        self._height = struct.unpack.uint32_le(file.stream)
-        pixel_count = struct.unpack.uint32_le(file.stream)
-        self.unk14 = file.stream.read(0x0c)
+        (self.unk1, self.unk2, self.unk3, self.unk4, self.unk5, self.filename, self.unk6, self.unk7, self.unk8, self.unk8_1,
+            self.unk12, self.unk9, self.unk10, self.unk13, palette, self._width, self._height, pixel_count, self.unk14) = \
+            BACKGROUND_HEADER.unpack(file.stream.read(BACKGROUND_HEADER.size))
+        self.filename = self.filename.rstrip(b'\x00')
+        self._palette = RgbPalette(io.BytesIO(palette), has_entry_alignment = True, total_palette_entries = 0x100, blue_green_red_order = True)
 
         # The image data is always uncompressed.
-        self._pixels = file.stream.read(pixel_count)
\ No newline at end of file
+        self._pixels_pointer = file.stream.tell()
+        self._pixels = file.read_payload(pixel_count)
+
+    ## Exports the background, deduplicating it with the active content store
+    ## and queuing it on the active export writer, if there are any.
+    def export(self, root_directory_path: str, command_line_arguments):
+        export_bitmap(self, root_directory_path, command_line_arguments, self._content_parts(), super().export)
+
+    ## \return Everything that determines the exported bitmap for this background, for a content store.
+    def _content_parts(self):
+        return ('background', self._palette._raw_bytes.getvalue(), self._width, self._height, self._pixels)
+
+    ## Creates a background from its record in a parse index, without reading its header.
+    ## Only the pixels are read, directly from their recorded position.
+    ## \param[in,out] file - The module file that contains this background.
+    ## \param[in] record - The record of this background, as created by to_index_record.
+    @classmethod
+    def from_index_record(cls, file, record):
+        # SET THE HEADER FIELDS.
+        # These are set in the same order as when the background is parsed,
+        # so the exported metadata is the same either way.
+        background = cls.__new__(cls)
+        RectangularBitmap.__init__(background)
+        background.name = "Background"
+        for field_name in INDEXED_HEADER_FIELD_NAMES:
+            setattr(background, field_name, record[field_name])
+        background._palette = RgbPalette(io.BytesIO(record['palette']), has_entry_alignment = True, total_palette_entries = 0x100, blue_green_red_order = True)
+        background._width = record['width']
+        background._height = record['height']
+        background.unk14 = record['unk14']
+
+        # READ THE PIXELS.
+        file.stream.seek(record['pixels_pointer'])
+        background._pixels_pointer = record['pixels_pointer']
+        background._pixels = file.read_payload(record['pixel_count'])
+        return background
+
+    ## \return The header fields of this background and the position of its pixels, for a parse index.
+    def to_index_record(self) -> dict:
+        record = {field_name: getattr(self, field_name) for field_name in INDEXED_HEADER_FIELD_NAMES}
+        record.update({
+            'palette': self._palette._raw_bytes.getvalue(),
+            'width': self._width,
+            'height': self._height,
+            'unk14': self.unk14,
+            'pixels_pointer': self._pixels_pointer,
+            'pixel_count': len(self._pixels)})
+        return record
\ No newline at end of file
@@ -0,0 +1,162 @@
+
+import os
+import shutil
+import hashlib
+import threading
+from typing import Optional
+
+from .ExportWriter import ExportWriter
+from .Profiler import profile_phase, profile_count
+
+# The content store that exports are currently deduplicated with, if any.
+_active_content_store = None
+
+## Deduplicates exported bitmaps by their content, across modules.
+##
+## Many modules share backgrounds, cursors, and other stills. Each exported bitmap
+## is identified by a hash of everything that determines the exported file: the
+## compressed (or uncompressed) pixels, the dimensions, the palette, any animation
+## framing, and the export options. The first bitmap with a given hash is exported
+## normally and then linked into the store. Every later bitmap with the same hash is
+## hard-linked to the stored file instead, without decompressing or encoding it again.
+## Where hard links are not supported, the stored file is copied instead.
+##
+## Since exported bitmaps can share their files with the store, exported bitmaps are never
+## rewritten in place. Each is written to a new file instead, even when no store is active,
+## so exporting again over a previous export can't change what is in the store.
+##
+## The store is a directory that can be shared by any number of exports, including
+## exports running at the same time (like on worker processes). Files are only put in
+## the store once they are completely written, and they are put there in one step.
+## While a store is active (inside a with block), bitmaps exported with export_bitmap
+## are deduplicated with it.
+class ContentStore:
+    ## \param[in] directory_path - The directory that holds the stored files.
+    ##            It is created if it does not exist.
+    def __init__(self, directory_path: str):
+        self.directory_path = directory_path
+        self.linked_count = 0
+        self.stored_count = 0
+        self.bytes_linked = 0
+        self._lock = threading.Lock()
+        self._previous_active_store = None
+
+    ## Makes this the active content store.
+    def __enter__(self):
+        global _active_content_store
+        self._previous_active_store = _active_content_store
+        _active_content_store = self
+        return self
+
+    def __exit__(self, *exception_info):
+        global _active_content_store
+        _active_content_store = self._previous_active_store
+
+    ## \return The content store that exports should be deduplicated with, or None if they should not be.
+    @staticmethod
+    def active() -> Optional['ContentStore']:
+        return _active_content_store
+
+    ## \return Where the file with the given content parts is stored.
+    ## \param[in] content_parts - Everything that determines the contents of the file.
+    ##            Each part is either bytes-like or converted to a string.
+    ## \param[in] extension - The extension of the file, like bmp.
+    def content_filepath(self, content_parts, extension: str) -> str:
+        content_hash = hashlib.sha256()
+        for content_part in (extension, *content_parts):
+            content_part = content_part if isinstance(content_part, (bytes, bytearray, memoryview)) else repr(content_part).encode('utf-8')
+            # The length keeps parts from running together.
+            content_hash.update(len(content_part).to_bytes(8, 'little'))
+            content_hash.update(content_part)
+        content_key = content_hash.hexdigest()
+        return os.path.join(self.directory_path, content_key[:2], f'{content_key}.{extension}')
+
+    ## Hard-links (or copies) a stored file to where it is exported.
+    ## \return True if the file was stored and is now exported; False if it is not stored yet.
+    def link(self, content_filepath: str, filepath: str) -> bool:
+        if not os.path.exists(content_filepath):
+            return False
+        link_file(content_filepath, filepath)
+        with self._lock:
+            self.linked_count += 1
+            self.bytes_linked += os.path.getsize(filepath)
+        return True
+
+    ## Records an exported file in the store, so later exports with the same contents can link to it.
+    def store(self, filepath: str, content_filepath: str):
+        if os.path.exists(content_filepath):
+            # Another export stored the same contents first.
+            return
+        os.makedirs(os.path.dirname(content_filepath), exist_ok = True)
+        link_file(filepath, content_filepath)
+        with self._lock:
+            self.stored_count += 1
+
+    ## \return The store counters, suitable for reporting.
+    @property
+    def statistics(self) -> dict:
+        return {'linked_count': self.linked_count, 'stored_count': self.stored_count, 'bytes_linked': self.bytes_linked}
+
+## Hard-links a file to another path, or copies it where hard links are not supported.
+## Any file already at the link path is replaced in one step.
+def link_file(source_filepath: str, link_filepath: str):
+    temporary_filepath = f'{link_filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        os.link(source_filepath, temporary_filepath)
+    except OSError:
+        # Hard links are not supported here (or the files are on different devices).
+        shutil.copyfile(source_filepath, temporary_filepath)
+    os.replace(temporary_filepath, link_filepath)
+
+## Removes a file, if it exists.
+def remove_file(filepath: str):
+    try:
+        os.unlink(filepath)
+    except FileNotFoundError:
+        pass
+
+## Exports a bitmap, deduplicating it with the active content store and
+## queuing it on the active export writer, if there are any.
+## \param[in] bitmap - The bitmap to export.
+## \param[in] content_parts - Everything that determines the exported bitmap, except the export format.
+##            None if the bitmap should not be deduplicated.
+## \param[in] export_directly - Exports the bitmap directly, like RectangularBitmap.export.
+def export_bitmap(bitmap, root_directory_path: str, command_line_arguments, content_parts, export_directly):
+    # CHECK WHETHER THE BITMAP CAN BE DEDUPLICATED.
+    # Only bitmaps encoded by Pillow are deduplicated; raw bitmaps are always exported directly.
+    content_store = ContentStore.active()
+    bitmap_format = command_line_arguments.bitmap_format
+    can_be_linked = bitmap._include_in_export and (bitmap_format not in ('none', 'raw'))
+    deduplicate = (content_store is not None) and (content_parts is not None) and can_be_linked
+    name = getattr(bitmap, 'name', None)
+    filename = os.path.join(root_directory_path, name) if name is not None else root_directory_path
+    filepath = f'{filename}.{bitmap_format}'
+    if deduplicate:
+        # LINK ANY STORED COPY OF THE BITMAP.
+        # The bitmap doesn't even need to be decompressed then.
+        content_filepath = content_store.content_filepath((command_line_arguments.bitmap_color, *content_parts), bitmap_format)
+        if content_store.link(content_filepath, filepath):
+            profile_count('content_store_links')
+            return
+
+    # REMOVE ANY PREVIOUSLY EXPORTED BITMAP.
+    # It might be linked to the store (or to other exported bitmaps), so it must not be
+    # overwritten in place. The bitmap is written to a new file instead.
+    if can_be_linked:
+        remove_file(filepath)
+
+    # EXPORT THE BITMAP.
+    # Queued bitmaps are stored by the writer once they are written.
+    export_writer = ExportWriter.active()
+    on_written = (lambda: content_store.store(filepath, content_filepath)) if deduplicate else None
+    if (export_writer is not None) and export_writer.export_bitmap(bitmap, root_directory_path, command_line_arguments, on_written = on_written):
+        return
+    with profile_phase('image_encoding_and_writing'):
+        export_directly(root_directory_path, command_line_arguments)
+    if deduplicate and os.path.exists(filepath):
+        content_store.store(filepath, content_filepath)
+
+## Prints the counters of a content store.
+def print_content_store_statistics(statistics: dict):
+    print(f'INFO: Content store: {statistics["linked_count"]} duplicate bitmaps linked ({statistics["bytes_linked"]} bytes), '
+        f'{statistics["stored_count"]} new bitmaps stored')
@@ -2,54 +2,474 @@
 
 from typing import List
 import os
+import sys
+import argparse
+import io
+import json
+import logging
+import traceback
+import contextlib
 
 from asset_extraction_framework.CommandLine import CommandLineArguments
 from asset_extraction_framework.Application import Application
 
-from TonkaConstruction.Module import Module
+# Only what is needed to parse the command line is imported here. The parsing and exporting
+# machinery (NumPy, Pillow, and the asset extraction framework exporters) takes far longer
+# to import than most inventories take to run, so it is imported only where it is used.
+from TonkaConstruction.PixelCache import PixelCache, pixel_cache
+from TonkaConstruction.Inventory import ModuleInventory, print_inventories
 
 class TonkaConstruction(Application):
     def __init__(self, application_name: str):
         super().__init__(application_name)
         self.modules = []
+        # Modules processed in worker processes have their own pixel caches,
+        # so their counters are collected here.
+        self.pixel_cache_statistics = {'hits': 0, 'misses': 0, 'evictions': 0}
+        # The profile of each module, if profiling. Modules processed in worker
+        # processes only send back their profile reports.
+        self.profiles = {}
+        self.profile_reports = []
+
+    ## \param[in] zero_copy - When True, module payloads reference the memory-mapped
+    ##            module files rather than being copied out of them.
+    ## \param[in] parse_index_path - The path to a parse index to read module headers from
+    ##            and record newly parsed modules in. None to always parse the modules.
+    ## \param[in] validate_frame_pointers - When True, report any frame start pointers
+    ##            that disagree with the frames found by reading them in sequence.
+    ## \param[in] profile_hooks - The optional profilers to run while profiling each module,
+    ##            as for Profile. None to not profile the modules.
+    ## \param[in] metadata_directory_path - When provided, the JSON Lines metadata of each module
+    ##            is written while it is parsed, in its export directory in this directory.
+    def process(self, input_paths, zero_copy: bool = False, parse_index_path: str = None, validate_frame_pointers: bool = False,
+            profile_hooks = None, metadata_directory_path: str = None):
+        from TonkaConstruction.Module import Module
+        from TonkaConstruction.ParseIndex import ParseIndex
+        from TonkaConstruction.MetadataWriter import MetadataWriter
+        from TonkaConstruction.Profiler import Profile
 
-    def process(self, input_paths):
         # READ EACH OF THE MODULES.
+        parse_index = ParseIndex(parse_index_path) if parse_index_path else None
         matched_module_filepaths = self.find_matching_files(input_paths, r'module.*\.dat$', case_sensitive = False)
         for module_filepath in matched_module_filepaths:
             print(f'INFO: Processing {module_filepath}')
-            module = Module(module_filepath)
+            profile = Profile(module_filepath, profile_hooks) if profile_hooks is not None else None
+            metadata_writer = MetadataWriter.for_module(metadata_directory_path, module_filepath) if metadata_directory_path else None
+            with profile or contextlib.nullcontext(), metadata_writer or contextlib.nullcontext():
+                module = Module(module_filepath, zero_copy = zero_copy, parse_index = parse_index, metadata_writer = metadata_writer)
+            if validate_frame_pointers:
+                print_frame_start_pointer_mismatches(module)
             self.modules.append(module)
+            if profile is not None:
+                self.profiles[module.filepath] = profile
+        if parse_index is not None:
+            parse_index.close()
 
     def export_assets(self, command_line_arguments):
             application_export_subdirectory: str = os.path.join(command_line_arguments.export, self.application_name)
             for index, module in enumerate(self.modules):
                 print(f'INFO: Exporting assets in {module.filepath}')
-                module.export_assets(application_export_subdirectory, command_line_arguments)
+                with self.profiles.get(module.filepath) or contextlib.nullcontext():
+                    module.export_assets(application_export_subdirectory, command_line_arguments)
 
     # This is in a separate function becuase even on fast computers it 
     # can take a very long time and often isn't necessary.
+    # JSON Lines metadata is instead written while the modules are parsed.
     def export_metadata(self, command_line_arguments):
+        from TonkaConstruction.Profiler import profile_phase
+        if command_line_arguments.metadata_format != 'json':
+            return
         application_export_subdirectory: str = os.path.join(command_line_arguments.export, self.application_name)
         for module in self.modules:
             print(f'INFO: Exporting metadata for {module.filename}')
-            module.export_metadata(application_export_subdirectory)
+            with self.profiles.get(module.filepath) or contextlib.nullcontext(), profile_phase('metadata_export'):
+                module.export_metadata(application_export_subdirectory)
+
+    ## Parses and exports the modules in the input paths one at a time.
+    ## Each module is exported as soon as it is parsed and is then released before 
+    ## the next module is parsed, so memory use stays at about one module no matter
+    ## how many modules there are. The parsed modules are not kept.
+    def process_streaming(self, command_line_arguments):
+        matched_module_filepaths = self.find_matching_files(command_line_arguments.input, r'module.*\.dat$', case_sensitive = False)
+        for module_filepath in matched_module_filepaths:
+            module_profile_report = parse_and_export_module(module_filepath, self.application_name, command_line_arguments)
+            if module_profile_report is not None:
+                self.profile_reports.append(module_profile_report)
+
+    ## Parses and exports the modules in the input paths on a pool of worker processes.
+    ## Each module is independent of the others, so each is parsed and exported
+    ## entirely within one worker. The parsed modules are not kept.
+    ##
+    ## Messages and errors are reported in the same order the modules would have
+    ## been processed one at a time, regardless of which worker finishes first.
+    ## \return The filepaths of the modules that could not be processed.
+    def process_in_parallel(self, command_line_arguments) -> List[str]:
+        from concurrent.futures import ProcessPoolExecutor
+        matched_module_filepaths = self.find_matching_files(command_line_arguments.input, r'module.*\.dat$', case_sensitive = False)
+        failed_module_filepaths = []
+        with ProcessPoolExecutor(max_workers = command_line_arguments.jobs, 
+                initializer = initialize_worker, initargs = (command_line_arguments,)) as executor:
+            futures = [executor.submit(process_module, module_filepath, self.application_name, command_line_arguments) 
+                for module_filepath in matched_module_filepaths]
+            for module_filepath, future in zip(matched_module_filepaths, futures):
+                # WAIT FOR THIS MODULE.
+                try:
+                    result = future.result()
+                except Exception:
+                    # The worker itself failed, rather than the module.
+                    result = {'log': '', 'error': traceback.format_exc(), 'pixel_cache': {}, 'profile': None}
+
+                # REPORT THE OUTCOME.
+                print(result['log'], end = '')
+                if result['error'] is not None:
+                    print(f'ERROR: Failed to process {module_filepath}:\n{result["error"]}')
+                    failed_module_filepaths.append(module_filepath)
+                for counter in ('hits', 'misses', 'evictions'):
+                    self.pixel_cache_statistics[counter] += result['pixel_cache'].get(counter, 0)
+                if result['profile'] is not None:
+                    self.profile_reports.append(result['profile'])
+        return failed_module_filepaths
+
+## Prepares a worker process for processing modules in parallel.
+## Worker processes might not inherit the global settings of the parent process.
+def initialize_worker(command_line_arguments):
+    logging.basicConfig(level = logging.DEBUG if command_line_arguments.debug else logging.WARNING)
+    pixel_cache.resize(command_line_arguments.pixel_cache_size * 1024 * 1024)
+
+## Parses a single module and exports its assets and metadata, if requested.
+## This runs in a worker process, so the parsed module is not returned.
+## \return A dictionary with the following:
+##  - log: Everything printed while processing the module.
+##  - error: None if the module was processed successfully; otherwise, a description of the error.
+##  - pixel_cache: The pixel cache counters for the module.
+##  - profile: The profile report for the module, or None if it was not profiled.
+def process_module(module_filepath: str, application_name: str, command_line_arguments) -> dict:
+    log = io.StringIO()
+    error = None
+    module_profile_report = None
+    pixel_cache.clear()
+    with contextlib.redirect_stdout(log):
+        try:
+            module_profile_report = parse_and_export_module(module_filepath, application_name, command_line_arguments)
+        except Exception:
+            error = traceback.format_exc()
+    return {'log': log.getvalue(), 'error': error, 'pixel_cache': pixel_cache.statistics, 'profile': module_profile_report}
+
+## Parses a single module and exports its assets and metadata, if requested.
+## The parsed module is not kept, so its memory is released and its file is closed once this returns.
+## \return The profile report for the module, or None if profiling was not requested.
+def parse_and_export_module(module_filepath: str, application_name: str, command_line_arguments) -> dict:
+    from TonkaConstruction.Module import Module
+    from TonkaConstruction.ParseIndex import ParseIndex
+    from TonkaConstruction.MetadataWriter import MetadataWriter
+    from TonkaConstruction.Profiler import Profile, profile_phase
+
+    print(f'INFO: Processing {module_filepath}')
+    profile = Profile(module_filepath, command_line_arguments.profile_hooks) if command_line_arguments.profile else None
+    with profile or contextlib.nullcontext():
+        parse_index = ParseIndex(command_line_arguments.parse_index) if command_line_arguments.parse_index else None
+        metadata_directory_path = jsonl_metadata_directory_path(application_name, command_line_arguments)
+        metadata_writer = MetadataWriter.for_module(metadata_directory_path, module_filepath) if metadata_directory_path else None
+        with metadata_writer or contextlib.nullcontext():
+            module = Module(module_filepath, zero_copy = command_line_arguments.zero_copy, parse_index = parse_index, metadata_writer = metadata_writer)
+        with module:
+            if parse_index is not None:
+                parse_index.close()
+            if command_line_arguments.validate_frame_pointers:
+                print_frame_start_pointer_mismatches(module)
+            if command_line_arguments.export:
+                application_export_subdirectory: str = os.path.join(command_line_arguments.export, application_name)
+                print(f'INFO: Exporting assets in {module.filepath}')
+                module.export_assets(application_export_subdirectory, command_line_arguments)
+                if command_line_arguments.metadata_format == 'json':
+                    print(f'INFO: Exporting metadata for {module.filename}')
+                    with profile_phase('metadata_export'):
+                        module.export_metadata(application_export_subdirectory)
+    if profile is not None:
+        return profile_report(profile, command_line_arguments.profile)
+
+## \return The directory where the JSON Lines metadata of modules should be written while they are parsed,
+##         or None if it should not be written.
+def jsonl_metadata_directory_path(application_name: str, command_line_arguments) -> str:
+    if (not command_line_arguments.export) or (command_line_arguments.metadata_format != 'jsonl'):
+        return None
+    return os.path.join(command_line_arguments.export, application_name)
+
+## \return The report of a module profile, with the size of the module.
+##          Any cProfile statistics are written next to the profile report, with the module filename added.
+def profile_report(profile: 'Profile', profile_filepath: str) -> dict:
+    cprofile_filepath = f'{profile_filepath}.{os.path.basename(profile.module_filepath)}.prof'
+    report = profile.report(cprofile_filepath = cprofile_filepath)
+    report['bytes_in'] = os.path.getsize(profile.module_filepath)
+    return report
+
+## Writes the profile reports of all the modules as one JSON file.
+def write_profile_reports(profile_filepath: str, profile_reports: List[dict]):
+    from TonkaConstruction import PackBitsDecompression
+    decompressor = 'c' if PackBitsDecompression.packbits_c_loaded else 'python'
+    with open(profile_filepath, 'w') as profile_file:
+        json.dump({'decompressor': decompressor, 'modules': profile_reports}, profile_file, indent = 2)
+    print(f'INFO: Wrote the profile of {len(profile_reports)} module(s) to {profile_filepath}')
+
+## Prints any frame start pointers in a module that disagree with its frames.
+def print_frame_start_pointer_mismatches(module: 'Module'):
+    mismatches = module.frame_start_pointer_mismatches()
+    for mismatch in mismatches:
+        print(f'WARNING: {module.filename}: {mismatch}')
+    print(f'INFO: Validated frame start pointers in {module.filename}: {len(mismatches)} mismatch(es)')
+
+def print_pixel_cache_statistics(statistics: dict):
+    print(f'INFO: Pixel cache: {statistics["hits"]} hits, {statistics["misses"]} misses, {statistics["evictions"]} evictions')
+
+## Prints assets found in an asset catalog, one per line.
+def print_catalog_assets(asset_records):
+    print(f'{"MODULE":<14} {"INDEX":>5} {"TYPE":<18} {"CONTENTS":<15} {"FRAMES":>6} {"SIZE":>9} {"LEFT,TOP":>11} {"HOTSPOT":>9} {"BYTES":>9}')
+    for asset_record in asset_records:
+        size = f'{asset_record["width"]}x{asset_record["height"]}'
+        coordinates = f'{asset_record["left"]},{asset_record["top"]}'
+        hotspot = f'{asset_record["hotspot_x"]},{asset_record["hotspot_y"]}'
+        cursor = f' ({asset_record["cursor_directions"]} directions, {asset_record["cursor_facets"]} facets)' \
+            if asset_record['cursor_directions'] is not None else ''
+        print(f'{asset_record["module_filename"]:<14} {asset_record["asset_index"]:>5} {asset_record["type"]:<18} '
+            f'{asset_record["contents"]:<15} {asset_record["frame_count"]:>6} {size:>9} {coordinates:>11} {hotspot:>9} '
+            f'{asset_record["byte_size"]:>9}{cursor}')
+    print(f'INFO: {len(asset_records)} matching asset(s)')
+
+## Builds and queries a catalog of the assets in many modules, and exports the matching assets if requested.
+## Invoked as the catalog subcommand:
+##  TonkaConstruction catalog CATALOG [INPUT ...] [--type CURSOR] [--has-hotspot] [--export DIRECTORY] ...
+def catalog_main(raw_command_line: List[str]):
+    from TonkaConstruction.Asset import Asset
+    from TonkaConstruction.ExportWriter import ExportWriter
+    from TonkaConstruction.AssetCatalog import AssetCatalog
+
+    # PARSE THE COMMAND-LINE ARGUMENTS.
+    APPLICATION_NAME: str = 'Tonka'
+    argument_parser = argparse.ArgumentParser(prog = 'TonkaConstruction catalog', formatter_class = argparse.RawTextHelpFormatter,
+        description = (
+            'Finds assets across many modules from a catalog of their headers, without decoding any pixels.'
+            '\nOnly the matching assets are parsed in full, and only if they are exported.'))
+    argument_parser.add_argument('catalog', help = 'The path to the catalog. It is created if it does not exist.')
+    argument_parser.add_argument('input', nargs = '*', help = (
+        'Folders or filepaths of modules to add to the catalog before querying it.'
+        '\nModules already in the catalog are only read again if they changed.'))
+    argument_parser.add_argument('--type', nargs = '+', choices = [asset_type.name for asset_type in Asset.AssetType], 
+        default = None, help = 'Only include assets of these types.')
+    argument_parser.add_argument('--contents', nargs = '+', choices = [contents.name for contents in Asset.FrameContents], 
+        default = None, help = 'Only include assets with these frame contents.')
+    argument_parser.add_argument('--module', default = None, help = 'Only include assets in modules whose filenames match this glob pattern.')
+    argument_parser.add_argument('--has-hotspot', action = 'store_true', default = None, help = 'Only include assets with a nonzero hotspot.')
+    argument_parser.add_argument('--minimum-frames', type = int, default = None, help = 'Only include assets with at least this many declared frames.')
+    argument_parser.add_argument('--maximum-frames', type = int, default = None, help = 'Only include assets with at most this many declared frames.')
+    argument_parser.add_argument('--export', default = None, help = 'Export the matching assets to this directory.')
+    argument_parser.add_argument('--bitmap-format', choices = ['bmp', 'png', 'raw', 'none'], default = 'bmp', help = 'The export format for bitmaps.')
+    argument_parser.add_argument('--audio-format', choices = ['wav', 'raw', 'none'], default = 'wav', help = 'The export format for audio.')
+    argument_parser.add_argument('--bitmap-color', choices = ['paletted', 'rgb', 'rgba'], default = 'paletted', help = 'The color format of exported bitmaps.')
+    command_line_arguments = argument_parser.parse_args(raw_command_line)
+    if (command_line_arguments.bitmap_color == 'rgba') and (command_line_arguments.bitmap_format == 'bmp'):
+        argument_parser.error('BMP files cannot hold transparency. Use --bitmap-format png with --bitmap-color rgba.')
+
+    # ADD ANY MODULES TO THE CATALOG.
+    catalog = AssetCatalog(command_line_arguments.catalog)
+    try:
+        if len(command_line_arguments.input) > 0:
+            tonka: TonkaConstruction = TonkaConstruction(APPLICATION_NAME)
+            module_filepaths = tonka.find_matching_files(command_line_arguments.input, r'module.*\.dat$', case_sensitive = False)
+            cataloged_module_count = catalog.build(module_filepaths)
+            print(f'INFO: Cataloged {cataloged_module_count} new or changed module(s) of {len(module_filepaths)}')
+
+        # FIND THE MATCHING ASSETS.
+        asset_records = catalog.query(types = command_line_arguments.type, contents = command_line_arguments.contents, 
+            module_pattern = command_line_arguments.module, has_hotspot = command_line_arguments.has_hotspot, 
+            minimum_frame_count = command_line_arguments.minimum_frames, maximum_frame_count = command_line_arguments.maximum_frames)
+        print_catalog_assets(asset_records)
+
+        # EXPORT THE MATCHING ASSETS, IF REQUESTED.
+        if command_line_arguments.export:
+            export_arguments = argparse.Namespace(bitmap_format = command_line_arguments.bitmap_format, 
+                audio_format = command_line_arguments.audio_format, bitmap_color = command_line_arguments.bitmap_color,
+                bitmap_options = 'no_framing', animation_format = 'none', zero_copy = True, incremental = False, content_store = None,
+                decode_threads = 1, export_writers = 0, export_queue_size = ExportWriter.DEFAULT_QUEUE_SIZE)
+            catalog.export(asset_records, os.path.join(command_line_arguments.export, APPLICATION_NAME), export_arguments)
+    finally:
+        catalog.close()
+
+## Adds the arguments that control how modules are parsed and exported (caching, parallelism,
+## incremental and deduplicated export, profiling, and the like) to the main argument parser.
+## \param[in,out] argument_parser - The parser to add the arguments to.
+def add_performance_arguments(argument_parser: argparse.ArgumentParser):
+    from TonkaConstruction.ExportWriter import ExportWriter
+
+    pixel_cache_size_argument_help = (
+        'The most memory, in megabytes, to use for holding decompressed bitmap pixels.'
+        '\nPixels read more than once during export are only decompressed once while they are held.'
+        '\nThe least recently used pixels are released first. Pass 0 to disable.')
+    inventory_argument_help = (
+        'Only read the chunk table and asset type codes of each module, and print how many assets of each type'
+        '\nit has and any problems that would keep it from being parsed. Nothing is parsed or exported.')
+    argument_parser.add_argument('--inventory', action = 'store_true', default = False, help = inventory_argument_help)
+    argument_parser.add_argument('--pixel-cache-size', type = int,
+        default = PixelCache.DEFAULT_MAXIMUM_SIZE_IN_BYTES // (1024 * 1024), help = pixel_cache_size_argument_help)
+    zero_copy_argument_help = (
+        'Reference bitmap, audio, and background data directly in the memory-mapped module files'
+        '\nrather than copying it out, to reduce memory use and copying on large inputs.')
+    argument_parser.add_argument('--zero-copy', action = 'store_true', default = False, help = zero_copy_argument_help)
+    jobs_argument_help = (
+        'The number of worker processes to use. When more than one, each module is parsed'
+        '\nand exported independently on a worker process, and the parsed modules are not kept.')
+    argument_parser.add_argument('--jobs', '-j', type = int, default = 1, help = jobs_argument_help)
+    stream_argument_help = (
+        'Export each module as soon as it is parsed, then release it before parsing the next.'
+        '\nThis keeps memory use flat no matter how many modules are processed.')
+    argument_parser.add_argument('--stream', action = 'store_true', default = False, help = stream_argument_help)
+    parse_index_argument_help = (
+        'The path to an index of parsed modules. Modules recorded in the index are not parsed again;'
+        '\ntheir payloads are read directly from the recorded positions. New or changed modules are'
+        '\nparsed and recorded. The index is created if it does not exist.')
+    argument_parser.add_argument('--parse-index', default = None, help = parse_index_argument_help)
+    incremental_argument_help = (
+        'Only export the background and assets that changed since the previous export with the same options.'
+        '\nA manifest of what was exported is kept in the export directory of each module.')
+    argument_parser.add_argument('--incremental', action = 'store_true', default = False, help = incremental_argument_help)
+    export_writers_argument_help = (
+        'The number of threads that write exported files. When more than zero, bitmaps and audio'
+        '\nare encoded in memory and queued for these threads, so encoding overlaps with disk writes.'
+        '\nQueue depth and stalls are reported for each module.')
+    argument_parser.add_argument('--export-writers', type = int, default = 0, help = export_writers_argument_help)
+    export_queue_size_argument_help = (
+        'The most encoded files that can wait for an export writer. When the queue is full,'
+        '\nencoding waits for the writers to catch up, which bounds the memory held by queued files.')
+    argument_parser.add_argument('--export-queue-size', type = int, 
+        default = ExportWriter.DEFAULT_QUEUE_SIZE, help = export_queue_size_argument_help)
+    decode_threads_argument_help = (
+        'The number of threads that decompress the frames of each animation before it is exported.'
+        '\nAnimations are only decompressed ahead when all their frames fit in the pixel cache.')
+    argument_parser.add_argument('--decode-threads', type = int, default = 1, help = decode_threads_argument_help)
+    validate_frame_pointers_argument_help = (
+        'Compare the frame start pointers of each video-only asset with the frames found by reading'
+        '\nthe frames in sequence, and report any disagreement.')
+    argument_parser.add_argument('--validate-frame-pointers', action = 'store_true', default = False, 
+        help = validate_frame_pointers_argument_help)
+    content_store_argument_help = (
+        'A directory of exported bitmaps shared by all modules and exports. Each bitmap is identified by a hash'
+        '\nof its compressed pixels, palette, and export options. A bitmap already in the store is hard-linked'
+        '\n(or copied, where hard links are not supported) rather than decompressed and exported again.')
+    argument_parser.add_argument('--content-store', default = None, help = content_store_argument_help)
+    dirty_rectangles_argument_help = (
+        'When animation frames are framed to the full animation size, export each frame after the first'
+        '\nas only the rectangle that changed since the previous frame. The rectangles are written to'
+        '\ndirty_rectangles.json, and the changes are also written as one compact delta stream, deltas.bin.')
+    argument_parser.add_argument('--dirty-rectangles', action = 'store_true', default = False, 
+        help = dirty_rectangles_argument_help)
+    sprite_atlas_argument_help = (
+        'Pack all the frames of each asset that is not an animation (like cursors and other libraries of stills)'
+        '\ninto one image, with a JSON sidecar giving the rectangle, position, and hotspot of each frame.'
+        '\nThis replaces one file per frame with two files per asset.')
+    argument_parser.add_argument('--sprite-atlas', action = 'store_true', default = False, help = sprite_atlas_argument_help)
+    metadata_format_argument_help = (
+        'Specify the format of exported metadata.'
+        '\njson: Export every attribute of every parsed object as one JSON file per module, after the module is parsed.'
+        '\n      This can take a very long time.'
+        '\njsonl: Write only the scalar header fields of the module, background, assets, and frames as JSON Lines,'
+        '\n       one record per line, while the module is parsed. Pixels and audio are never written.')
+    argument_parser.add_argument('--metadata-format', choices = ['json', 'jsonl'], 
+        default = 'json', help = metadata_format_argument_help)
+    profile_argument_help = (
+        'Write a JSON report of where the time goes in each module and asset to this file: the time in each phase'
+        '\n(like decompression, encoding, and writing), bytes in and out, frame counts, cache hits, and which'
+        '\nPackBits decompressor was used.')
+    argument_parser.add_argument('--profile', default = None, help = profile_argument_help)
+    profile_hooks_argument_help = (
+        'The optional profilers to run while profiling each module.'
+        '\ncprofile: Profile every function call. The statistics are written next to the report, one file per module.'
+        '\ntracemalloc: Trace memory allocations, and report the peak and the largest allocations.')
+    argument_parser.add_argument('--profile-hooks', nargs = '*', choices = ['cprofile', 'tracemalloc'], 
+        default = [], help = profile_hooks_argument_help)
+    bitmap_color_argument_help = (
+        'Specify the color format of exported bitmaps.'
+        '\npaletted: Export paletted bitmaps, exactly as they are stored.'
+        '\nrgb: Expand bitmaps to RGB with their palettes.'
+        '\nrgba: Expand bitmaps to RGBA with their palettes. The transparent color in assets is fully transparent.')
+    argument_parser.add_argument('--bitmap-color', choices = ['paletted', 'rgb', 'rgba'], 
+        default = 'paletted', help = bitmap_color_argument_help)
 
 # DEFINE THE FILE TYPES IN THIS APPLICATION.
 def main(raw_command_line: List[str] = None):
+    # RUN THE CATALOG SUBCOMMAND, IF REQUESTED.
+    if raw_command_line is None:
+        raw_command_line = sys.argv[1:]
+    if raw_command_line[:1] == ['catalog']:
+        catalog_main(raw_command_line[1:])
+        return
+
     # PARSE THE COMMAND-LINE ARGUMENTS.
     APPLICATION_NAME: str = 'Tonka'
     APPLICATION_DESCRIPTION: str = 'Tonka Construction (1997)'
-    command_line_arguments = CommandLineArguments(APPLICATION_NAME, APPLICATION_DESCRIPTION).parse(raw_command_line)
-
-    # PARSE THE ASSETS.
+    command_line_argument_parser = CommandLineArguments(APPLICATION_NAME, APPLICATION_DESCRIPTION)
+    # ALLOW BITMAPS TO BE EXPORTED AS PNG.
+    # BMP files cannot hold transparency, so RGBA bitmaps must be exported in another format.
+    # The framework's --bitmap-format argument doesn't accept PNG, so it is replaced with one
+    # that does, in a parser that otherwise has all the same arguments.
+    framework_argument_parser = command_line_argument_parser.argument_parser
+    command_line_argument_parser.argument_parser = argparse.ArgumentParser(parents = [framework_argument_parser], conflict_handler = 'resolve',
+        formatter_class = framework_argument_parser.formatter_class, description = framework_argument_parser.description)
+    bitmap_format_argument_help = (
+        'Specify the desired export format for bitmaps.'
+        '\nIf \'png\' is provided, bitmaps are exported as PNG files, which can hold transparency.'
+        '\nIf \'raw\' is provided, no decompression or other transformation will occur on the original.'
+        '\nIf \'none\' is provided, bitmaps will not be exported.')
+    command_line_argument_parser.argument_parser.add_argument('--bitmap-format', choices = ['bmp', 'png', 'raw', 'none'],
+        default = 'bmp', help = bitmap_format_argument_help)
+    add_performance_arguments(command_line_argument_parser.argument_parser)
+    command_line_arguments = command_line_argument_parser.parse(raw_command_line)
+    if (command_line_arguments.bitmap_color == 'rgba') and (command_line_arguments.bitmap_format == 'bmp'):
+        command_line_argument_parser.argument_parser.error('BMP files cannot hold transparency. Use --bitmap-format png with --bitmap-color rgba.')
     tonka: TonkaConstruction = TonkaConstruction(APPLICATION_NAME)
-    tonka.process(command_line_arguments.input)
 
-    # EXPORT THE ASSETS, IF REQUESTED.
-    if command_line_arguments.export:
-        tonka.export_assets(command_line_arguments)
-        tonka.export_metadata(command_line_arguments)
+    if command_line_arguments.inventory:
+        # READ ONLY THE MODULE HEADERS.
+        module_filepaths = tonka.find_matching_files(command_line_arguments.input, r'module.*\.dat$', case_sensitive = False)
+        inventories = [ModuleInventory(module_filepath) for module_filepath in module_filepaths]
+        print_inventories(inventories)
+        problem_module_filenames = [inventory.filename for inventory in inventories if len(inventory.problems) > 0]
+        if len(problem_module_filenames) > 0:
+            raise SystemExit(f'ERROR: {len(problem_module_filenames)} module(s) have problems: {", ".join(problem_module_filenames)}')
+        return
+
+    pixel_cache.resize(command_line_arguments.pixel_cache_size * 1024 * 1024)
+
+    if command_line_arguments.jobs > 1:
+        # PARSE AND EXPORT THE MODULES ON WORKER PROCESSES.
+        failed_module_filepaths = tonka.process_in_parallel(command_line_arguments)
+        if command_line_arguments.export:
+            print_pixel_cache_statistics(tonka.pixel_cache_statistics)
+        if len(failed_module_filepaths) > 0:
+            raise SystemExit(f'ERROR: {len(failed_module_filepaths)} module(s) could not be processed: {", ".join(failed_module_filepaths)}')
+
+    elif command_line_arguments.stream:
+        # PARSE AND EXPORT THE MODULES ONE AT A TIME.
+        tonka.process_streaming(command_line_arguments)
+        if command_line_arguments.export:
+            print_pixel_cache_statistics(pixel_cache.statistics)
+
+    else:
+        # PARSE THE ASSETS.
+        tonka.process(command_line_arguments.input, zero_copy = command_line_arguments.zero_copy, 
+            parse_index_path = command_line_arguments.parse_index, validate_frame_pointers = command_line_arguments.validate_frame_pointers,
+            profile_hooks = command_line_arguments.profile_hooks if command_line_arguments.profile else None,
+            metadata_directory_path = jsonl_metadata_directory_path(APPLICATION_NAME, command_line_arguments))
+
+        # EXPORT THE ASSETS, IF REQUESTED.
+        if command_line_arguments.export:
+            tonka.export_assets(command_line_arguments)
+            tonka.export_metadata(command_line_arguments)
+            print_pixel_cache_statistics(pixel_cache.statistics)
+        if command_line_arguments.profile:
+            tonka.profile_reports = [profile_report(profile, command_line_arguments.profile) for profile in tonka.profiles.values()]
+
+    # WRITE THE PROFILE, IF REQUESTED.
+    if command_line_arguments.profile:
+        write_profile_reports(command_line_arguments.profile, tonka.profile_reports)
 
 # TODO: Get good documentation here.
 if __name__ == '__main__':
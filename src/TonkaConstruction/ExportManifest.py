@@ -0,0 +1,96 @@
+import os
+import json
+import hashlib
+
+## Records what was exported from a module, so a later export with the same options
+## can skip everything whose source data hasn't changed.
+##
+## Each exported item (the background or an asset) is recorded by name with a fingerprint
+## and the files exported for it. The fingerprint is a hash of everything the item is made
+## from in the module and the export options. An item is up to date when its fingerprint
+## is the same as the one recorded in the previous export and all the files exported
+## for it are still there.
+## The manifest is stored in the export directory of the module, so removing the
+## export directory also forces a full export.
+class ExportManifest:
+    FILENAME = '.export_manifest.json'
+    VERSION = 1
+    # The command-line arguments that change the exported files.
+    EXPORT_OPTION_NAMES = ('bitmap_options', 'animation_format', 'bitmap_format', 'audio_format', 'bitmap_color', 'sprite_atlas', 'dirty_rectangles')
+
+    ## Reads the manifest of the previous export, if there is one.
+    ## \param[in] export_directory_path - The directory where the module is exported.
+    ## \param[in] command_line_arguments - All the command-line arguments provided to the
+    ##            script that invoked this function, including the export options.
+    def __init__(self, export_directory_path: str, command_line_arguments):
+        self.export_directory_path = export_directory_path
+        self.filepath = os.path.join(export_directory_path, self.FILENAME)
+        export_options = {option_name: getattr(command_line_arguments, option_name, None) for option_name in self.EXPORT_OPTION_NAMES}
+        self._export_options = json.dumps(export_options, sort_keys = True).encode('utf-8')
+        self._previous_items = self._read()
+        self._fingerprints = {}
+
+    ## \return The fingerprint of an item exported with the current options.
+    ## \param[in] source_buffers - Everything in the module the item is made from,
+    ##            like its chunk and the palette its bitmaps are drawn with.
+    def fingerprint(self, *source_buffers) -> str:
+        fingerprint_hash = hashlib.sha256(self._export_options)
+        for source_buffer in source_buffers:
+            fingerprint_hash.update(source_buffer)
+        return fingerprint_hash.hexdigest()
+
+    ## \return True if the item was exported previously with the same fingerprint
+    ##         and none of its exported files have been removed since; False otherwise.
+    def is_current(self, name: str, fingerprint: str) -> bool:
+        previous_item = self._previous_items.get(name)
+        if (previous_item is None) or (previous_item.get('fingerprint') != fingerprint):
+            return False
+        return all(os.path.isfile(os.path.join(self.export_directory_path, relative_filepath)) for relative_filepath in previous_item.get('files', []))
+
+    ## Records that an item is exported with the given fingerprint.
+    ## Every item in the module should be recorded, including those that were up to date.
+    def record(self, name: str, fingerprint: str):
+        self._fingerprints[name] = fingerprint
+
+    ## Records that an item is unchanged by this export, keeping its fingerprint from the previous export.
+    ## Items that were not previously exported stay unrecorded.
+    def retain(self, name: str):
+        if name in self._previous_items:
+            self._fingerprints[name] = self._previous_items[name]['fingerprint']
+
+    ## Writes the manifest with the recorded items only, along with the files now exported for each.
+    ## The manifest is replaced in one step, so an interrupted export never leaves a partial manifest.
+    def save(self):
+        exported_filenames = os.listdir(self.export_directory_path)
+        items = {name: {'fingerprint': fingerprint, 'files': self._find_exported_files(name, exported_filenames)} 
+            for name, fingerprint in self._fingerprints.items()}
+        temporary_filepath = f'{self.filepath}.tmp'
+        with open(temporary_filepath, 'w') as manifest_file:
+            json.dump({'version': self.VERSION, 'items': items}, manifest_file, indent = 2, sort_keys = True)
+        os.replace(temporary_filepath, self.filepath)
+
+    ## \return The paths of the files exported for an item, relative to the export directory.
+    ##         An item is exported either to a directory with its name or to files with its name and any extension.
+    ## \param[in] exported_filenames - The names of everything in the export directory.
+    def _find_exported_files(self, name: str, exported_filenames) -> list:
+        relative_filepaths = []
+        for filename in exported_filenames:
+            if filename.startswith(f'{name}.'):
+                relative_filepaths.append(filename)
+            elif filename == name:
+                for directory_path, _, filenames in os.walk(os.path.join(self.export_directory_path, filename)):
+                    relative_directory_path = os.path.relpath(directory_path, self.export_directory_path)
+                    relative_filepaths.extend(os.path.join(relative_directory_path, filename) for filename in filenames)
+        return sorted(relative_filepaths)
+
+    ## \return The items recorded in the previous export, each with its fingerprint and exported files.
+    ##         Empty if there was no previous export or its manifest cannot be used.
+    def _read(self) -> dict:
+        try:
+            with open(self.filepath, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or (manifest.get('version') != self.VERSION):
+            return {}
+        return manifest.get('items', {})
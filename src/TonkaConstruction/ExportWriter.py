@@ -0,0 +1,178 @@
+
+import io
+import os
+import time
+import queue
+import threading
+from typing import Optional
+
+from .Profiler import Profile, profile_phase
+
+# The writer that exports are currently queued on, if any.
+_active_export_writer = None
+
+## Writes exported files on background threads, so encoding the next bitmap
+## overlaps with writing the previous ones to disk.
+##
+## Encoded files wait in a bounded queue for a writer thread. When the queue is full,
+## the exporter stalls until a writer catches up, so the queue size caps the memory
+## held by encoded files that are not yet written.
+##
+## While a writer is active (inside a with block), bitmaps and audio exported
+## with export_bitmap and export_audio_track are queued rather than written directly.
+class ExportWriter:
+    DEFAULT_QUEUE_SIZE = 64
+
+    ## \param[in] writer_count - The number of writer threads.
+    ## \param[in] queue_size - The most encoded files that can wait to be written.
+    def __init__(self, writer_count: int, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.writer_count = writer_count
+        self.queue_size = queue_size
+        self.files_written = 0
+        self.bytes_written = 0
+        self.maximum_queue_depth = 0
+        self.stall_count = 0
+        self.stall_seconds = 0.0
+        self.writer_idle_seconds = 0.0
+        self._queue_depth_total = 0
+        self._queued_file_count = 0
+        self._queue = queue.Queue(maxsize = queue_size)
+        self._lock = threading.Lock()
+        self._error = None
+        self._writers = []
+        self._previous_active_writer = None
+        self._profile = None
+
+    ## Starts the writer threads and makes this the active writer.
+    def __enter__(self):
+        # Writer threads record their work in the profile that is active when they start.
+        self._profile = Profile.active()
+        for _ in range(self.writer_count):
+            writer = threading.Thread(target = self._write_queued_files, daemon = True)
+            writer.start()
+            self._writers.append(writer)
+        global _active_export_writer
+        self._previous_active_writer = _active_export_writer
+        _active_export_writer = self
+        return self
+
+    ## Waits for every queued file to be written and stops the writer threads.
+    ## Any error from a writer thread is raised here.
+    def __exit__(self, *exception_info):
+        global _active_export_writer
+        _active_export_writer = self._previous_active_writer
+        for _ in self._writers:
+            self._queue.put(None)
+        for writer in self._writers:
+            writer.join()
+        self._writers = []
+        if (self._error is not None) and (exception_info[0] is None):
+            raise self._error
+
+    ## \return The writer that exports should be queued on, or None if files should be written directly.
+    @staticmethod
+    def active() -> Optional['ExportWriter']:
+        return _active_export_writer
+
+    ## Queues a file to be written. If the queue is full, this waits for a writer to catch up.
+    ## \param[in] filepath - Where to write the file.
+    ## \param[in] data - The complete contents of the file.
+    ## \param[in] on_written - Called on the writer thread once the file is written, if provided.
+    def write(self, filepath: str, data: bytes, on_written = None):
+        # REPORT ANY EARLIER ERROR.
+        # There is no point in encoding more files if they cannot be written.
+        if self._error is not None:
+            raise self._error
+
+        # QUEUE THE FILE.
+        queue_depth = self._queue.qsize()
+        if self._queue.full():
+            stall_start_time = time.perf_counter()
+            self._queue.put((filepath, data, on_written))
+            with self._lock:
+                self.stall_count += 1
+                self.stall_seconds += time.perf_counter() - stall_start_time
+        else:
+            self._queue.put((filepath, data, on_written))
+        with self._lock:
+            self._queued_file_count += 1
+            self._queue_depth_total += queue_depth + 1
+            self.maximum_queue_depth = max(self.maximum_queue_depth, queue_depth + 1)
+
+    ## Encodes a bitmap and queues it to be written, like RectangularBitmap.export would write it.
+    ## \return True if the bitmap was queued; False if it must be exported directly.
+    ##         Only bitmaps encoded by Pillow are queued; raw bitmaps are always exported directly.
+    ## \param[in] on_written - Called on the writer thread once the bitmap is written, if provided.
+    def export_bitmap(self, bitmap, root_directory_path: str, command_line_arguments, on_written = None) -> bool:
+        if (not bitmap._include_in_export) or (command_line_arguments.bitmap_format in ('none', 'raw')):
+            return False
+        if bitmap._exportable_image is None:
+            bitmap.create_exportable_image_from_pixels()
+        if bitmap._exportable_image is None:
+            return False
+
+        # ENCODE THE BITMAP.
+        if getattr(bitmap, 'name', None) is not None:
+            filename = os.path.join(root_directory_path, bitmap.name)
+        else:
+            filename = root_directory_path
+        encoded_bitmap = io.BytesIO()
+        with profile_phase('image_encoding'):
+            bitmap._exportable_image.save(encoded_bitmap, command_line_arguments.bitmap_format)
+        self.write(f'{filename}.{command_line_arguments.bitmap_format}', encoded_bitmap.getvalue(), on_written)
+        return True
+
+    ## Encodes an audio track as one WAV file and queues it to be written, like AudioTrack.write_wave would write it.
+    def export_audio_track(self, audio_track, filepath: str):
+        encoded_audio_track = io.BytesIO()
+        with profile_phase('audio_encoding'):
+            audio_track.write_wave(encoded_audio_track)
+        self.write(filepath, encoded_audio_track.getvalue())
+
+    ## \return The writer counters, suitable for reporting.
+    @property
+    def statistics(self) -> dict:
+        return {
+            'files_written': self.files_written,
+            'bytes_written': self.bytes_written,
+            'maximum_queue_depth': self.maximum_queue_depth,
+            'average_queue_depth': self._queue_depth_total / max(self._queued_file_count, 1),
+            'stall_count': self.stall_count,
+            'stall_seconds': self.stall_seconds,
+            'writer_idle_seconds': self.writer_idle_seconds}
+
+    ## Writes queued files until told to stop. Runs on each writer thread.
+    def _write_queued_files(self):
+        while True:
+            # WAIT FOR A FILE.
+            idle_start_time = time.perf_counter()
+            queued_file = self._queue.get()
+            idle_seconds = time.perf_counter() - idle_start_time
+            if queued_file is None:
+                return
+
+            # WRITE THE FILE.
+            filepath, data, on_written = queued_file
+            write_start_time = time.perf_counter()
+            try:
+                with open(filepath, 'wb') as file:
+                    file.write(data)
+                if on_written is not None:
+                    on_written()
+            except Exception as error:
+                self._error = error
+            if self._profile is not None:
+                self._profile.count('writer_disk_write_seconds', time.perf_counter() - write_start_time, for_asset = False)
+                self._profile.count('writer_bytes_written', len(data), for_asset = False)
+            with self._lock:
+                self.writer_idle_seconds += idle_seconds
+                if self._error is None:
+                    self.files_written += 1
+                    self.bytes_written += len(data)
+
+## Prints the counters of an export writer.
+def print_export_writer_statistics(statistics: dict):
+    print(f'INFO: Export writer: {statistics["files_written"]} files, {statistics["bytes_written"]} bytes written, '
+        f'queue depth {statistics["average_queue_depth"]:.1f} average / {statistics["maximum_queue_depth"]} maximum, '
+        f'{statistics["stall_count"]} stalls ({statistics["stall_seconds"]:.3f} s), '
+        f'writers idle {statistics["writer_idle_seconds"]:.3f} s')
@@ -0,0 +1,81 @@
+
+from typing import List
+
+import numpy
+
+from .FrameView import FrameView
+
+# The fields of each frame in a frame table. Frames without audio have an audio pointer of -1.
+FRAME_TABLE_DTYPE = numpy.dtype([
+    ('width', '<u4'),
+    ('height', '<u4'),
+    ('uncompressed_image_size', '<u4'),
+    ('compressed_image_data_size', '<u4'),
+    ('audio_length_in_bytes', '<u4'),
+    ('left', '<i2'),
+    ('top', '<i2'),
+    ('audio_pointer', '<i8'),
+    ('raw_pointer', '<u8')])
+NO_AUDIO_POINTER = -1
+
+## Holds the header fields and payload positions of the frames in an asset as
+## one column per field, rather than as one object per frame. This takes far less
+## memory than frame objects, and frames can be selected with vector operations:
+##  large_frames = frame_table[frame_table['width'] > 100]
+##
+## Indexing with a field name gives the column for that field, indexing with a frame
+## index gives a view of that frame, and indexing with a mask, slice, or index array
+## gives a table of the selected frames.
+class FrameTable:
+    ## \param[in] file - The module file that contains the frames.
+    ## \param[in] records - A structured array of frame records with the FRAME_TABLE_DTYPE fields.
+    def __init__(self, file, records: numpy.ndarray):
+        self.file = file
+        self.records = records
+
+    ## Creates a frame table from frame records, like those stored in a parse index.
+    ## \param[in] file - The module file that contains the frames.
+    ## \param[in] index_records - For each frame, a mapping with the FRAME_TABLE_DTYPE fields.
+    ##            An audio pointer of None indicates the frame has no audio.
+    @classmethod
+    def from_index_records(cls, file, index_records) -> 'FrameTable':
+        records = numpy.array([tuple(
+            (NO_AUDIO_POINTER if index_record[field_name] is None else index_record[field_name]) 
+            for field_name in FRAME_TABLE_DTYPE.names) for index_record in index_records], dtype = FRAME_TABLE_DTYPE)
+        return cls(file, records)
+
+    ## \return For each frame, a dictionary of its fields. Frames without audio have an audio pointer of None.
+    def index_records(self) -> List[dict]:
+        index_records = []
+        for values in self.records.tolist():
+            index_record = dict(zip(FRAME_TABLE_DTYPE.names, values))
+            if index_record['audio_pointer'] == NO_AUDIO_POINTER:
+                index_record['audio_pointer'] = None
+            index_records.append(index_record)
+        return index_records
+
+    ## \return The fields of one frame as a dictionary, like index_records.
+    def index_record(self, index: int) -> dict:
+        index_record = dict(zip(FRAME_TABLE_DTYPE.names, self.records[index].tolist()))
+        if index_record['audio_pointer'] == NO_AUDIO_POINTER:
+            index_record['audio_pointer'] = None
+        return index_record
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.records[key]
+        if isinstance(key, (int, numpy.integer)):
+            index = int(key)
+            if index < 0:
+                index += len(self.records)
+            if not (0 <= index < len(self.records)):
+                raise IndexError(f'Frame index {key} out of range for {len(self.records)} frames')
+            return FrameView(self, index)
+        return FrameTable(self.file, self.records[key])
+
+    def __iter__(self):
+        for index in range(len(self.records)):
+            yield FrameView(self, index)
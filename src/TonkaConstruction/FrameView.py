@@ -0,0 +1,78 @@
+
+from typing import Optional
+
+from .PackBitsDecompression import decompress_frame_bitmap
+
+## A lightweight view of one frame in a frame table.
+## Views hold nothing but their position in the table, so they are cheap to create
+## and are created on access rather than kept. The payloads are read from the module
+## only when they are requested.
+class FrameView:
+    __slots__ = ('_table', '_index')
+
+    ## \param[in] table - The frame table that holds this frame.
+    ## \param[in] index - The position of this frame in the table.
+    def __init__(self, table, index: int):
+        self._table = table
+        self._index = index
+
+    @property
+    def width(self) -> int:
+        return int(self._table.records['width'][self._index])
+
+    @property
+    def height(self) -> int:
+        return int(self._table.records['height'][self._index])
+
+    @property
+    def left(self) -> int:
+        return int(self._table.records['left'][self._index])
+
+    @property
+    def top(self) -> int:
+        return int(self._table.records['top'][self._index])
+
+    @property
+    def uncompressed_image_size(self) -> int:
+        return int(self._table.records['uncompressed_image_size'][self._index])
+
+    @property
+    def compressed_image_data_size(self) -> int:
+        return int(self._table.records['compressed_image_data_size'][self._index])
+
+    @property
+    def audio_length_in_bytes(self) -> int:
+        return int(self._table.records['audio_length_in_bytes'][self._index])
+
+    ## \return The position of the audio of this frame in the module, or None if this frame has no audio.
+    @property
+    def audio_pointer(self) -> Optional[int]:
+        audio_pointer = int(self._table.records['audio_pointer'][self._index])
+        return audio_pointer if audio_pointer >= 0 else None
+
+    ## \return The position of the compressed bitmap of this frame in the module.
+    @property
+    def raw_pointer(self) -> int:
+        return int(self._table.records['raw_pointer'][self._index])
+
+    ## \return The compressed bitmap of this frame.
+    @property
+    def raw(self):
+        return self._table.file.payload_at(self.raw_pointer, self.compressed_image_data_size)
+
+    ## \return The audio of this frame, or None if this frame has no audio.
+    @property
+    def audio(self):
+        audio_pointer = self.audio_pointer
+        if audio_pointer is None:
+            return None
+        return self._table.file.payload_at(audio_pointer, self.audio_length_in_bytes)
+
+    ## \return The decompressed pixels of this frame, or None if this frame has no bitmap.
+    ##         Decompressed pixels are shared with the frame objects through the pixel cache.
+    @property
+    def pixels(self) -> Optional[bytes]:
+        compressed_image_data_size = self.compressed_image_data_size
+        if compressed_image_data_size > 0:
+            pixel_cache_key = (self._table.file.filepath, self.raw_pointer)
+            return decompress_frame_bitmap(pixel_cache_key, self.raw, compressed_image_data_size, self.uncompressed_image_size)
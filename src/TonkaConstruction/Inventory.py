@@ -0,0 +1,99 @@
+
+import os
+import struct
+from collections import Counter
+from typing import List
+
+from .AssetTypeCodes import ASSET_TYPE_CODES, asset_type_name
+
+# The chunk table at the start of each module:
+#  - The chunk count,
+#  - A pointer to the start of each chunk,
+#  - The chunk count again,
+#  - 4 unknown bytes.
+CHUNK_COUNT = struct.Struct('<H')
+CHUNK_TABLE_FOOTER = struct.Struct('<HL')
+
+## Summarizes what is in a module by reading only its chunk table and the type codes
+## at the start of each asset. Nothing else in the module is read, and none of the parsing
+## or exporting machinery is loaded, so a whole directory of modules can be checked quickly.
+##
+## Anything that would keep the module from being parsed (like a chunk pointer outside
+## the module or unknown type codes) is recorded as a problem rather than raised.
+class ModuleInventory:
+    ## Reads the inventory of a module.
+    ## \param[in] filepath - The full path to the module file.
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.filename = os.path.basename(filepath)
+        self.size = os.path.getsize(filepath)
+        self.chunk_pointers = []
+        self.asset_type_names = []
+        self.problems = []
+        with open(filepath, 'rb') as module_file:
+            self._read(module_file)
+
+    ## \return The number of assets of each type in the module.
+    @property
+    def asset_type_counts(self) -> Counter:
+        return Counter(self.asset_type_names)
+
+    ## Reads the chunk table and asset type codes of the module.
+    def _read(self, module_file):
+        # READ THE CHUNK TABLE.
+        chunk_table_header = module_file.read(CHUNK_COUNT.size)
+        if len(chunk_table_header) < CHUNK_COUNT.size:
+            self.problems.append('The chunk table is truncated.')
+            return
+        chunk_count, = CHUNK_COUNT.unpack(chunk_table_header)
+        chunk_table = module_file.read((4 * chunk_count) + CHUNK_TABLE_FOOTER.size)
+        if len(chunk_table) < (4 * chunk_count) + CHUNK_TABLE_FOOTER.size:
+            self.problems.append('The chunk table is truncated.')
+            return
+        self.chunk_pointers = list(struct.unpack_from(f'<{chunk_count}L', chunk_table))
+        redundant_chunk_count, _ = CHUNK_TABLE_FOOTER.unpack_from(chunk_table, 4 * chunk_count)
+        if redundant_chunk_count != chunk_count:
+            self.problems.append(f'The chunk counts disagree: {chunk_count} and {redundant_chunk_count}.')
+
+        # VERIFY THE CHUNK POINTERS.
+        # Each chunk must start after the one before it and inside the module.
+        end_of_chunk_table_pointer = CHUNK_COUNT.size + len(chunk_table)
+        previous_chunk_pointer = end_of_chunk_table_pointer
+        for index, chunk_pointer in enumerate(self.chunk_pointers):
+            if not (previous_chunk_pointer <= chunk_pointer < self.size):
+                self.problems.append(f'Chunk {index} has an implausible pointer: 0x{chunk_pointer:08x}.')
+                return
+            previous_chunk_pointer = chunk_pointer
+
+        # READ THE ASSET TYPE CODES.
+        for index, chunk_pointer in enumerate(self.chunk_pointers):
+            module_file.seek(chunk_pointer)
+            type_codes = module_file.read(ASSET_TYPE_CODES.size)
+            try:
+                if len(type_codes) < ASSET_TYPE_CODES.size:
+                    raise ValueError('The asset header is truncated.')
+                self.asset_type_names.append(asset_type_name(list(ASSET_TYPE_CODES.unpack(type_codes))))
+            except ValueError as error:
+                self.asset_type_names.append('UNKNOWN')
+                self.problems.append(f'Asset {index}: {error}')
+
+## Prints the inventories of modules, one line per module followed by the totals.
+## Any problems are printed as warnings after the module they were found in.
+def print_inventories(inventories: List[ModuleInventory]):
+    total_asset_type_counts = Counter()
+    for inventory in inventories:
+        asset_type_counts = inventory.asset_type_counts
+        total_asset_type_counts.update(asset_type_counts)
+        print(f'{inventory.filename}: {inventory.size} bytes, {len(inventory.asset_type_names)} asset(s)'
+            f'{format_asset_type_counts(asset_type_counts)}')
+        for problem in inventory.problems:
+            print(f'WARNING: {inventory.filename}: {problem}')
+    problem_module_count = sum(1 for inventory in inventories if len(inventory.problems) > 0)
+    print(f'INFO: {len(inventories)} module(s), {sum(total_asset_type_counts.values())} asset(s)'
+        f'{format_asset_type_counts(total_asset_type_counts)}, {problem_module_count} module(s) with problems')
+
+## \return The counts of each asset type, like ": 2 CURSOR, 1 TIMED_ANIMATION", in order of type name.
+def format_asset_type_counts(asset_type_counts: Counter) -> str:
+    if len(asset_type_counts) == 0:
+        return ''
+    return ': ' + ', '.join(f'{count} {type_name}' for type_name, count in sorted(asset_type_counts.items()))
@@ -0,0 +1,121 @@
+
+import os
+import json
+
+from .FrameTable import FRAME_TABLE_DTYPE, NO_AUDIO_POINTER
+
+## Writes the metadata of a module as JSON Lines, one record per line, while the module is parsed.
+##
+## Unlike the JSON metadata export, which serializes every attribute of every object once the
+## module is fully parsed, this writes only the scalar header fields of the module, its background,
+## its assets, and their frames. Pixels, compressed bitmaps, audio, and palettes are never written.
+## Each record is written as soon as it is parsed, so writing metadata needs no second pass over
+## the module and holds no more than one record in memory.
+##
+## Each record has a "record" field that is one of "module", "background", "asset", or "frame".
+## Asset records have the index of the asset in the module, and frame records have the index
+## of their asset as well as their own index.
+class MetadataWriter:
+    # The extension of the metadata files.
+    EXTENSION = 'jsonl'
+
+    # The header fields of the background that are written as they are.
+    BACKGROUND_FIELD_NAMES = ('unk1', 'unk2', 'unk3', 'unk4', 'unk5', 'unk6', 'unk7', 'unk8', 'unk8_1', 'unk9', 'unk10')
+
+    ## Opens the metadata file, replacing any that already exists.
+    ## \param[in] filepath - The path to the JSON Lines file. Its directory is created if it does not exist.
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.record_count = 0
+        os.makedirs(os.path.dirname(filepath), exist_ok = True)
+        self._file = open(filepath, 'w', encoding = 'utf-8')
+
+    ## Opens the metadata file for a module in its export directory, next to where its
+    ## JSON metadata would be exported.
+    ## \param[in] directory_path - The directory where the module export directories are created.
+    @classmethod
+    def for_module(cls, directory_path: str, module_filepath: str) -> 'MetadataWriter':
+        module_filename = os.path.basename(module_filepath)
+        return cls(os.path.join(directory_path, module_filename, f'{module_filename}.{cls.EXTENSION}'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_info):
+        self.close()
+
+    ## Closes the metadata file.
+    def close(self):
+        self._file.close()
+
+    ## Writes the record for a module, from its chunk table.
+    def write_module(self, module):
+        self._write_record({
+            'record': 'module',
+            'filename': module.filename,
+            'filepath': module.filepath,
+            'length': len(module.stream),
+            'chunk_count': len(module._chunk_pointers) - 1,
+            'unk1': module.unk1})
+
+    ## Writes the record for the background of a module, from its header.
+    def write_background(self, background):
+        record = {
+            'record': 'background',
+            'name': background.name,
+            'filename': background.filename.decode('latin-1'),
+            'width': background._width,
+            'height': background._height,
+            'pixels_pointer': background._pixels_pointer}
+        record.update({field_name: getattr(background, field_name) for field_name in self.BACKGROUND_FIELD_NAMES})
+        self._write_record(record)
+
+    ## Writes the record for an asset, from its header, followed by the records for
+    ## its frames if they have been read.
+    ## \param[in] module - The module that contains the asset.
+    ## \param[in] asset_index - The index of the asset in the module.
+    def write_asset(self, module, asset_index: int, asset):
+        self._write_record({
+            'record': 'asset',
+            'index': asset_index,
+            'type': asset.type.name,
+            'contents': asset.contents.name,
+            'frame_count': asset._frame_count,
+            'width': asset._width,
+            'height': asset._height,
+            'left': asset._left,
+            'top': asset._top,
+            'horizontal_resolution': asset.horizontal_resolution,
+            'vertical_resolution': asset.vertical_resolution,
+            'hotspot_x': asset.hotspot_x,
+            'hotspot_y': asset.hotspot_y,
+            'cursor_directions': getattr(asset, 'cursor_directions', None),
+            'cursor_facets': getattr(asset, 'cursor_facets', None),
+            'bitmaps_per_audio': asset.bitmaps_per_audio,
+            'chunk_pointer': module._chunk_pointers[asset_index],
+            'byte_size': module._chunk_pointers[asset_index + 1] - module._chunk_pointers[asset_index]})
+
+        # WRITE THE FRAME RECORDS.
+        # These come straight from the columns of the frame table, so no frame objects are created.
+        frame_table = asset.frame_table()
+        if frame_table is None:
+            return
+        for frame_index, values in enumerate(frame_table.records.tolist()):
+            record = {'record': 'frame', 'asset_index': asset_index, 'index': frame_index}
+            record.update(zip(FRAME_TABLE_DTYPE.names, values))
+            if record['audio_pointer'] == NO_AUDIO_POINTER:
+                record['audio_pointer'] = None
+            self._write_record(record)
+
+    ## Writes the records for a module that is already parsed, like one restored from a parse index.
+    def write_parsed_module(self, module):
+        self.write_module(module)
+        self.write_background(module.background)
+        for asset_index, asset in enumerate(module.asset_headers()):
+            self.write_asset(module, asset_index, asset)
+
+    ## Writes one record as one line.
+    def _write_record(self, record: dict):
+        self._file.write(json.dumps(record, separators = (',', ':')))
+        self._file.write('\n')
+        self.record_count += 1
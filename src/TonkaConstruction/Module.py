@@ -1,55 +1,120 @@
 
 import os
 import logging
+import contextlib
+from typing import List
+from collections.abc import Sequence
 
+import jsons
+from PIL import Image
 import self_documenting_struct as struct
 from asset_extraction_framework.File import File
 from asset_extraction_framework.Asserts import assert_equal
 
 from .Background import Background
-from .Asset import Asset
+from .Asset import Asset, ALPHA_COLOR
+from .PaletteLookupTable import PaletteLookupTable
+from .ExportManifest import ExportManifest
+from .ExportWriter import ExportWriter, print_export_writer_statistics
+from .ContentStore import ContentStore, print_content_store_statistics
+from .PixelCache import pixel_cache
+from .Profiler import Profile, profile_phase, profile_count, exported_size_in_bytes
+
+## Provides indexed access to the assets in a lazily-loaded module.
+## Only the fixed asset headers are read when the module is opened;
+## the frames of an asset are read the first time that asset is accessed.
+class LazyAssetList(Sequence):
+    ## \param[in] module - The module that contains the assets.
+    ## \param[in] assets - The assets in the module, with only their headers read.
+    def __init__(self, module, assets):
+        self._module = module
+        self._assets = assets
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        asset = self._assets[index]
+        asset.read_frames(self._module)
+        return asset
 
 ## Contains all the assets for a single scene.
 ## Each of the assets is stored in a chunk in this file.
 class Module(File):
     ## Parses the module.
     ## \param[in] filepath - The full path to the module file.
-    def __init__(self, filepath: str):
+    ## \param[in] lazy - When True, only the chunk table and the fixed asset headers
+    ##            are read now. The frames of each asset are read the first time the
+    ##            asset is accessed through self.assets.
+    ## \param[in] zero_copy - When True, bitmap, audio, and background payloads are
+    ##            memoryviews into the memory-mapped module file rather than copies.
+    ## \param[in] parse_index - When provided, the headers of the module are read from this
+    ##            index rather than parsed, if the index has a record of this exact module.
+    ##            Otherwise, the module is parsed and then recorded in the index.
+    ## \param[in] metadata_writer - When provided, the metadata records of the module are
+    ##            written to this MetadataWriter as the module is parsed.
+    def __init__(self, filepath: str, lazy: bool = False, zero_copy: bool = False, parse_index = None, metadata_writer = None):
         # OPEN THE MODULE FILE.
         super().__init__(filepath)
         self.assets = []
 
+        # MAP THE PAYLOADS.
+        # The module file is already memory-mapped, so payloads can just reference
+        # the map rather than being copied out of it.
+        self._stream_view = memoryview(self.stream) if zero_copy else None
+        jsons.set_serializer(lambda view, **kwargs: jsons.dump(view.tobytes(), **kwargs), memoryview, fork_inst = self.json_serializer)
+
+        # CHECK FOR AN INDEXED COPY OF THIS MODULE.
+        # The headers are then already known, so only the payloads need to be read.
+        if parse_index is not None:
+            with profile_phase('parse_index'):
+                restored = parse_index.restore(self)
+            profile_count('parse_index_hits' if restored else 'parse_index_misses')
+            if restored:
+                if metadata_writer is not None:
+                    metadata_writer.write_parsed_module(self)
+                return
+
         # REGISTER THE CHUNKS IN THIS FILE.
         # Each Module typically contains the assets for a single screen of the game,
         # and each of these assets is stored in a chunk. These chunks are referenced
         # by their byte position in this file.
-        chunk_pointers = []
-        chunk_count = struct.unpack.uint16_le(self.stream)
-        logging.debug(f'Expecting {chunk_count} chunks in {filepath}')
-        for index in range(chunk_count):
-            # REGISTER THIS CHUNK.
-            chunk_pointer = struct.unpack.uint32_le(self.stream)
-            chunk_pointers.append(chunk_pointer)
-            logging.debug(f'Registered chunk {index + 1} \\ {chunk_count} @ 0x{chunk_pointer:012x}')
-        # The pointer to the final chunk is the total length of this file.
-        total_file_length = len(self.stream)
-        chunk_pointers.append(total_file_length)
-        # For some reason the chunk count is included twice.
-        # We will just verify they are equal.
-        redundant_chunk_count = struct.unpack.uint16_le(self.stream)
-        assert_equal(redundant_chunk_count, chunk_count)
-        # TODO: I don't know what is here.
-        self.unk1 = struct.unpack.uint32_le(self.stream)
-        logging.debug(f'Unk1: {self.unk1}')
+        with profile_phase('chunk_table'):
+            chunk_pointers = []
+            chunk_count = struct.unpack.uint16_le(self.stream)
+            logging.debug(f'Expecting {chunk_count} chunks in {filepath}')
+            for index in range(chunk_count):
+                # REGISTER THIS CHUNK.
+                chunk_pointer = struct.unpack.uint32_le(self.stream)
+                chunk_pointers.append(chunk_pointer)
+                logging.debug(f'Registered chunk {index + 1} \\ {chunk_count} @ 0x{chunk_pointer:012x}')
+            # The pointer to the final chunk is the total length of this file.
+            total_file_length = len(self.stream)
+            chunk_pointers.append(total_file_length)
+            self._chunk_pointers = chunk_pointers
+            # For some reason the chunk count is included twice.
+            # We will just verify they are equal.
+            redundant_chunk_count = struct.unpack.uint16_le(self.stream)
+            assert_equal(redundant_chunk_count, chunk_count)
+            # TODO: I don't know what is here.
+            self.unk1 = struct.unpack.uint32_le(self.stream)
+            logging.debug(f'Unk1: {self.unk1}')
+        if metadata_writer is not None:
+            metadata_writer.write_module(self)
 
         # READ THE BACKGROUND IMAGE FOR THIS SCREEN.
         # The background is always the first chunk of the module.
         end_of_background_pointer = chunk_pointers[0]
         background_size = end_of_background_pointer - self.stream.tell()
         logging.debug(f'*** CHUNK BACKGROUND (0x{self.stream.tell():012x} -> 0x{end_of_background_pointer:012x} [0x{background_size:04x} bytes]) ***')
-        self.background = Background(self)
+        with profile_phase('background_header'):
+            self.background = Background(self)
         # Ensure we are at the end of the background.
         self.assert_at_stream_position(chunk_pointers[0])
+        if metadata_writer is not None:
+            metadata_writer.write_background(self.background)
 
         # READ EACH OF THE ASSETS IN THIS MODULE.
         for index in range(len(chunk_pointers) - 1):
@@ -59,6 +124,10 @@ class Module(File):
             asset_length = end_of_asset_pointer - start_of_asset_pointer
 
             # READ THE ASSET.
+            if lazy:
+                # The frames of the previous asset were not read,
+                # so the stream is expected to be behind the start of this asset.
+                self.stream.seek(start_of_asset_pointer)
             stream_at_start_of_asset = self.assert_at_stream_position(start_of_asset_pointer, warn_only = True)
             if not stream_at_start_of_asset:
                 # Ensure the stream is at the start of the asset.
@@ -66,29 +135,251 @@ class Module(File):
                 # TODO: Figure out the instance where this is required.
                 self.stream.seek(start_of_asset_pointer)
             # Read the asset.
-            asset = Asset(self)
+            with profile_phase('asset_headers'):
+                asset = Asset(self, read_frames = not lazy)
             self.assets.append(asset)
+            if metadata_writer is not None:
+                metadata_writer.write_asset(self, index, asset)
+
+        # DEFER READING THE ASSET FRAMES.
+        if lazy:
+            self.assets = LazyAssetList(self, self.assets)
+
+        # RECORD THE MODULE IN THE INDEX.
+        if parse_index is not None:
+            with profile_phase('parse_index'):
+                parse_index.store(self)
     
+    ## Reads a payload (like compressed bitmap or audio data) from the current stream position
+    ## and advances the stream past it.
+    ## \return The payload. In zero-copy mode, this is a memoryview into the memory-mapped
+    ##         module file; otherwise, it is a copy of the payload bytes.
+    def read_payload(self, length: int):
+        if self._stream_view is None:
+            return self.stream.read(length)
+
+        start_pointer = self.stream.tell()
+        end_pointer = min(start_pointer + length, len(self._stream_view))
+        self.stream.seek(end_pointer)
+        return self._stream_view[start_pointer:end_pointer]
+
+    ## Reads a payload at the given position without moving the stream, so payloads
+    ## can be read from several threads at once.
+    ## \return The payload. In zero-copy mode, this is a memoryview into the memory-mapped
+    ##         module file; otherwise, it is a copy of the payload bytes.
+    def payload_at(self, pointer: int, length: int):
+        if self._stream_view is None:
+            return self.stream[pointer:pointer + length]
+        return self._stream_view[pointer:pointer + length]
+
+    ## Expands the background and asset frames in this module from paletted pixels
+    ## to RGB or RGBA, ready for export. All the frames in this module share the background
+    ## palette, so they are all expanded together with a single lookup. In RGBA, the alpha
+    ## color of the assets is fully transparent.
+    ## \param[in] include_alpha - When True, expand to RGBA; otherwise, expand to RGB.
+    ## \param[in] include_background - When True, expand the background.
+    ## \param[in] assets - The assets whose frames should be expanded. All the assets by default.
+    def expand_bitmaps(self, include_alpha: bool, include_background: bool = True, assets = None):
+        # EXPAND THE BACKGROUND.
+        # The background has no transparent color.
+        if include_background:
+            background_lookup_table = PaletteLookupTable(self.background._palette, include_alpha)
+            self._set_expanded_images([self.background], background_lookup_table)
+
+        # EXPAND THE ASSET FRAMES.
+        frame_lookup_table = PaletteLookupTable(self.background._palette, include_alpha, transparent_color = ALPHA_COLOR)
+        frames = [frame for asset in (self.assets if assets is None else assets) for frame in asset.frames]
+        self._set_expanded_images(frames, frame_lookup_table)
+
+    ## Replaces the exportable images of the given bitmaps with their expanded pixels.
+    ## Bitmaps that cannot be expanded are left as they are.
+    def _set_expanded_images(self, bitmaps, lookup_table: PaletteLookupTable):
+        for bitmap, expanded_pixels in zip(bitmaps, lookup_table.expand(bitmaps)):
+            if expanded_pixels is not None:
+                height, width, _ = expanded_pixels.shape
+                mode = lookup_table.image_mode
+                bitmap._exportable_image = Image.frombuffer(mode, (width, height), expanded_pixels, 'raw', mode, 0, 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_info):
+        self.close()
+
+    ## Closes the module file. The parsed background and assets are released first, since in
+    ## zero-copy mode their payloads are views into the memory-mapped file, and the file can't be
+    ## closed while any view into it exists. So no payloads from this module can be kept past this.
+    def close(self):
+        self.background = None
+        self.assets = []
+        if self._stream_view is not None:
+            self._stream_view.release()
+            self._stream_view = None
+        self.stream.close()
+
+    ## \return The assets in this module, without reading the frames of any that
+    ##         were not read yet. Only the fixed headers of those assets can be used.
+    def asset_headers(self):
+        if isinstance(self.assets, LazyAssetList):
+            return self.assets._assets
+        return self.assets
+
+    ## Compares the frame start pointers of each asset with the frames found by reading them in sequence.
+    ## \return A description of each disagreement, naming its asset. Empty if they all agree.
+    def frame_start_pointer_mismatches(self) -> List[str]:
+        mismatches = []
+        for index, asset in enumerate(self.asset_headers()):
+            for mismatch in asset.frame_start_pointer_mismatches():
+                mismatches.append(f'Asset {index}: {mismatch}')
+        return mismatches
+
     ## Exports the assets in this module.
     ## \param[in] directory_path - The directory where the assets should be exported.
     ##            Asset exporters may create initial subdirectories.
     ## \param[in] command_line_arguments - All the command-line arguments provided to the 
     ##            script that invoked this function, so asset exporters can read any 
     ##            necessary formatting options.
-    def export_assets(self, directory_path: str, command_line_arguments):
+    ## \param[in] asset_indices - The indices of the assets to export. When provided, only these
+    ##            assets are exported (and only their frames are read in a lazy module),
+    ##            and the background is not exported. All the assets and the background by default.
+    def export_assets(self, directory_path: str, command_line_arguments, asset_indices = None):
         export_directory = self.create_export_directory(directory_path)
 
-        # EXPORT THE BACKGROUND.
-        # Because the background is not stored in the assets list,
-        # it must be exported separately.
-        self.background.export(export_directory, command_line_arguments)
-
-        # EXPORT THE ASSETS IN THIS CONTEXT.
-        for index, asset in enumerate(self.assets):
-            # SET THE ASSET NAME IF IT IS NOT ALREADY SET.
-            # This ensures every asset has a unique name within this file.
+        # SET THE ASSET NAMES IF THEY ARE NOT ALREADY SET.
+        # This ensures every asset has a unique name within this file.
+        for index, asset in enumerate(self.asset_headers()):
             if asset.name is None:
                 asset.name = f'{index}'
 
-            # EXPORT THE ASSET.
-            asset.export(export_directory, command_line_arguments)
\ No newline at end of file
+        # SELECT THE ASSETS TO EXPORT.
+        include_background = (asset_indices is None)
+        if asset_indices is None:
+            asset_indices = range(len(self.assets))
+
+        # FIND WHAT IS ALREADY EXPORTED, IF REQUESTED.
+        # Anything whose source bytes and export options are the same
+        # as in the previous export is already up to date.
+        manifest = ExportManifest(export_directory, command_line_arguments) if command_line_arguments.incremental else None
+        export_background = include_background
+        if manifest is not None:
+            # Items that are not selected keep their records from the previous export.
+            skipped_count = 0
+            if include_background:
+                with self._chunk_view(-1) as background_chunk:
+                    background_fingerprint = manifest.fingerprint(background_chunk)
+                manifest.record(self.background.name, background_fingerprint)
+                if manifest.is_current(self.background.name, background_fingerprint):
+                    export_background = False
+                    skipped_count += 1
+            else:
+                manifest.retain(self.background.name)
+            # The asset frames are drawn with the background palette, so they change when it does.
+            palette_bytes = self.background._palette.raw_bgr_bytes()
+            selected_asset_indices = set(asset_indices)
+            outdated_asset_indices = []
+            for index, asset in enumerate(self.asset_headers()):
+                if index not in selected_asset_indices:
+                    manifest.retain(asset.name)
+                    continue
+                with self._chunk_view(index) as asset_chunk:
+                    asset_fingerprint = manifest.fingerprint(asset_chunk, palette_bytes)
+                manifest.record(asset.name, asset_fingerprint)
+                if manifest.is_current(asset.name, asset_fingerprint):
+                    skipped_count += 1
+                else:
+                    outdated_asset_indices.append(index)
+            asset_indices = outdated_asset_indices
+            print(f'INFO: Skipping {skipped_count} up-to-date item(s) in {self.filename}')
+        assets_to_export = [self.assets[index] for index in asset_indices]
+        profile = Profile.active()
+        if (profile is not None) and (manifest is not None):
+            profile.count('incremental_skipped', skipped_count)
+
+        # EXPAND THE PALETTED BITMAPS, IF REQUESTED.
+        if command_line_arguments.bitmap_color != 'paletted':
+            with profile_phase('palette_conversion'):
+                self.expand_bitmaps(include_alpha = (command_line_arguments.bitmap_color == 'rgba'), 
+                    include_background = export_background, assets = assets_to_export)
+
+        # DECODE THE FRAMES OF EACH ANIMATION IN PARALLEL, IF REQUESTED.
+        # The decoded frames are held in the pixel cache until they are exported, so this
+        # only helps when there is a pixel cache and the bitmaps are decoded for export.
+        decode_frames_in_parallel = (command_line_arguments.decode_threads > 1) and \
+            (command_line_arguments.bitmap_format not in ('none', 'raw')) and (pixel_cache.maximum_size_in_bytes > 0)
+
+        # START THE EXPORT WRITERS, IF REQUESTED.
+        # Encoded files are then written on background threads while the next ones are encoded.
+        export_writer = None
+        if command_line_arguments.export_writers > 0:
+            export_writer = ExportWriter(command_line_arguments.export_writers, command_line_arguments.export_queue_size)
+        # USE THE CONTENT STORE, IF REQUESTED.
+        # Bitmaps already exported from this or any other module are then linked rather than exported again.
+        content_store = None
+        if command_line_arguments.content_store:
+            content_store = ContentStore(command_line_arguments.content_store)
+        with content_store or contextlib.nullcontext(), export_writer or contextlib.nullcontext():
+            # EXPORT THE BACKGROUND.
+            # Because the background is not stored in the assets list,
+            # it must be exported separately.
+            if export_background:
+                with self._profile_asset(profile, self.background.name, type = 'BACKGROUND', bytes_in = self._chunk_size(-1)):
+                    self.background.export(export_directory, command_line_arguments)
+
+            # EXPORT THE ASSETS IN THIS CONTEXT.
+            # Each asset's frame objects are released once it is exported,
+            # so only one asset's frames are held in memory at a time.
+            for index, asset in zip(asset_indices, assets_to_export):
+                with self._profile_asset(profile, asset.name, type = asset.type.name, frame_count = asset._frame_count,
+                        bytes_in = self._chunk_size(index)):
+                    if decode_frames_in_parallel and asset.is_animation and \
+                            (asset.frame_table()['uncompressed_image_size'].sum() <= pixel_cache.maximum_size_in_bytes):
+                        asset.decode_frames(command_line_arguments.decode_threads)
+                    asset.export(export_directory, command_line_arguments)
+                    asset.release_frames()
+
+        # RECORD THE EXPORTED SIZES, IF PROFILING.
+        # The files are all written only once the export writers are finished.
+        if profile is not None:
+            for asset_report in profile.assets.values():
+                asset_report['bytes_out'] = exported_size_in_bytes(export_directory, asset_report['name'])
+        if export_writer is not None:
+            print_export_writer_statistics(export_writer.statistics)
+        if content_store is not None:
+            print_content_store_statistics(content_store.statistics)
+
+        # RECORD WHAT WAS EXPORTED.
+        if manifest is not None:
+            manifest.save()
+
+    ## \return A context that records exporting an item of this module in a profile,
+    ##         or that does nothing if there is no profile.
+    @staticmethod
+    def _profile_asset(profile: Profile, name: str, **fields):
+        if profile is None:
+            return contextlib.nullcontext()
+        return profile.asset(name, **fields)
+
+    ## \return A context that provides the bytes of a chunk of this module, as a view into
+    ##         the memory-mapped file. The view is released when the context exits,
+    ##         so it doesn't keep the module file from being closed.
+    ## \param[in] index - The index of the asset in the chunk, or -1 for the background.
+    @contextlib.contextmanager
+    def _chunk_view(self, index: int):
+        start_pointer, end_pointer = self._chunk_bounds(index)
+        with memoryview(self.stream) as stream_view, stream_view[start_pointer:end_pointer] as chunk_view:
+            yield chunk_view
+
+    ## \return The size of a chunk of this module, in bytes.
+    ## \param[in] index - The index of the asset in the chunk, or -1 for the background.
+    def _chunk_size(self, index: int) -> int:
+        start_pointer, end_pointer = self._chunk_bounds(index)
+        return end_pointer - start_pointer
+
+    ## \return The start and end pointers of a chunk of this module.
+    ## \param[in] index - The index of the asset in the chunk, or -1 for the background.
+    ##            The background chunk starts after the chunk table.
+    def _chunk_bounds(self, index: int):
+        if index < 0:
+            CHUNK_TABLE_HEADER_SIZE = 2 + 2 + 4
+            return CHUNK_TABLE_HEADER_SIZE + (4 * (len(self._chunk_pointers) - 1)), self._chunk_pointers[0]
+        return self._chunk_pointers[index], self._chunk_pointers[index + 1]
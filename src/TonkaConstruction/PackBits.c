@@ -1,73 +1,281 @@
 #define PY_SSIZE_T_CLEAN
 #include <Python.h>
 
+/// Returned by the decompressor when the compressed stream ends in the middle of a run.
+#define PACK_BITS_TRUNCATED_INPUT -1
+/// Returned by the decompressor when a run would write past the end of the uncompressed buffer.
+#define PACK_BITS_OUTPUT_OVERFLOW -2
+
 /// Actually decompresses the PackBits stream, and easily provides a 10x performance improvement
 /// over the pure Python implementation.
-static PyObject *method_decompress_pack_bits(PyObject *self, PyObject *args) {
-    // READ THE PARAMETERS FROM PYTHON.
-    PyBytesObject *compressed_image_data_object = NULL;
-    char *compressed_image_data = NULL;
-    unsigned int compressed_image_data_size = 0;
-    unsigned int uncompressed_image_data_size = 0;
-    if(!PyArg_ParseTuple(args, "SII", &compressed_image_data_object, &compressed_image_data_size, &uncompressed_image_data_size)) {
-        return NULL;
-    }
-
-    // ALLOCATE THE UNCOMPRESSED PIXELS BUFFER.
-    char *uncompressed_image_data = malloc(uncompressed_image_data_size + 1);
-    unsigned int uncompressed_data_index = 0;
-
-    // DECOMPRESS THIS IMAGE.
-    compressed_image_data = PyBytes_AsString(compressed_image_data_object);
-    unsigned int compressed_data_index = 0;
+///
+/// This does not touch any Python objects, so it can (and should) be called without holding the GIL.
+/// Every run is checked against both buffers, so malformed streams cannot read or write out of bounds.
+/// \return The number of uncompressed bytes written, or one of the negative error codes above.
+static Py_ssize_t decompress_pack_bits(
+    const unsigned char *compressed_image_data, Py_ssize_t compressed_image_data_size,
+    unsigned char *uncompressed_image_data, Py_ssize_t uncompressed_image_data_size) {
+    Py_ssize_t compressed_data_index = 0;
+    Py_ssize_t uncompressed_data_index = 0;
     while ((compressed_data_index < compressed_image_data_size) && (uncompressed_data_index < uncompressed_image_data_size)) {
         // TAKE THE NEXT OPERATION.
-        char operation_byte = compressed_image_data[compressed_data_index++];
-        if (operation_byte >= 0 && operation_byte <= 127) {
-            // READ AN UNCOMPRESSED RUN.
+        signed char operation_byte = (signed char)compressed_image_data[compressed_data_index++];
+        Py_ssize_t run_length = 0;
+        if (operation_byte == -128) {
+            // SKIP THIS NO-OP.
+            // An operation byte of 0x80 (-128) is a no-op, and no color byte follows it.
+            continue;
+        } else if (operation_byte >= 0) {
+            // CHECK THE UNCOMPRESSED RUN IS COMPLETE.
             // An operation byte inclusively between 0x00 (+0) and 0x7f (+127) indicates
             // an uncompressed run of the value of the operation byte plus one.
-            unsigned int run_length = operation_byte + 1;
-            memcpy(&uncompressed_image_data[uncompressed_data_index], &compressed_image_data[compressed_data_index], run_length);
-            uncompressed_data_index += run_length;
-            compressed_data_index += run_length;
+            run_length = operation_byte + 1;
+            if (compressed_data_index + run_length > compressed_image_data_size) {
+                return PACK_BITS_TRUNCATED_INPUT;
+            }
         } else {
-            // EXPAND THIS COMPRESSED RUN.
+            // CHECK THE COLOR OF THE COMPRESSED RUN IS PRESENT.
             // An operation byte inclusively between 0x81 (-127) and 0xff (-1) indicates
             // the next byte is a color that should be repeated for a run of (-n+1) pixels.
-            unsigned int color_index = compressed_image_data[compressed_data_index++];
-            unsigned int run_length = -operation_byte + 1;
-            for (unsigned int run_index = 0; run_index < run_length; run_index++) {
-                uncompressed_image_data[uncompressed_data_index] = color_index;
-                uncompressed_data_index += 1;
+            run_length = -operation_byte + 1;
+            if (compressed_data_index >= compressed_image_data_size) {
+                return PACK_BITS_TRUNCATED_INPUT;
             }
         }
+
+        // CHECK THE RUN FITS IN THE UNCOMPRESSED BUFFER.
+        // Some bitmaps in the game decompress to exactly one byte more than
+        // their stated size, so that extra byte is dropped. Any other overflow
+        // means the stream is malformed.
+        Py_ssize_t copied_run_length = run_length;
+        Py_ssize_t overflow_length = (uncompressed_data_index + run_length) - uncompressed_image_data_size;
+        if (overflow_length > 1) {
+            return PACK_BITS_OUTPUT_OVERFLOW;
+        } else if (overflow_length == 1) {
+            copied_run_length -= 1;
+        }
+
+        if (operation_byte >= 0) {
+            // READ AN UNCOMPRESSED RUN.
+            memcpy(&uncompressed_image_data[uncompressed_data_index], &compressed_image_data[compressed_data_index], copied_run_length);
+            compressed_data_index += run_length;
+        } else {
+            // EXPAND THIS COMPRESSED RUN.
+            unsigned char color_index = compressed_image_data[compressed_data_index++];
+            memset(&uncompressed_image_data[uncompressed_data_index], color_index, copied_run_length);
+        }
+        uncompressed_data_index += copied_run_length;
+    }
+    return uncompressed_data_index;
+}
+
+/// Raises a Python exception that describes a decompression error code.
+/// \param[in] error_code - One of the negative error codes returned by the decompressor.
+/// \param[in] frame_index - The index of the stream in a batch, or -1 if there is no batch.
+static void raise_decompression_error(Py_ssize_t error_code, Py_ssize_t frame_index) {
+    const char *description = (error_code == PACK_BITS_TRUNCATED_INPUT) ?
+        "The compressed stream ends in the middle of a run" :
+        "A run extends past the end of the uncompressed buffer";
+    if (frame_index < 0) {
+        PyErr_Format(PyExc_ValueError, "%s.", description);
+    } else {
+        PyErr_Format(PyExc_ValueError, "Stream %zd: %s.", frame_index, description);
+    }
+}
+
+/// Decompresses a PackBits stream into a new bytes object of the uncompressed size.
+/// The compressed stream can be any object that supports the buffer protocol (like bytes, memoryview, or mmap).
+/// Any part of the uncompressed buffer not written by the stream is zero.
+static PyObject *method_decompress_pack_bits(PyObject *self, PyObject *args) {
+    // READ THE PARAMETERS FROM PYTHON.
+    Py_buffer compressed_image_data = {0};
+    Py_ssize_t compressed_image_data_size = 0;
+    Py_ssize_t uncompressed_image_data_size = 0;
+    if (!PyArg_ParseTuple(args, "y*nn", &compressed_image_data, &compressed_image_data_size, &uncompressed_image_data_size)) {
+        return NULL;
+    }
+    if ((compressed_image_data_size < 0) || (uncompressed_image_data_size < 0)) {
+        PyBuffer_Release(&compressed_image_data);
+        PyErr_SetString(PyExc_ValueError, "Sizes must not be negative.");
+        return NULL;
+    }
+    if (compressed_image_data_size > compressed_image_data.len) {
+        compressed_image_data_size = compressed_image_data.len;
+    }
+
+    // ALLOCATE THE UNCOMPRESSED PIXELS.
+    // The pixels are decompressed directly into the returned object, so no copy is needed.
+    PyObject *uncompressed_image_data = PyBytes_FromStringAndSize(NULL, uncompressed_image_data_size);
+    if (uncompressed_image_data == NULL) {
+        PyBuffer_Release(&compressed_image_data);
+        return NULL;
+    }
+
+    // DECOMPRESS THIS IMAGE.
+    unsigned char *uncompressed_pixels = (unsigned char *)PyBytes_AS_STRING(uncompressed_image_data);
+    Py_ssize_t result = 0;
+    Py_BEGIN_ALLOW_THREADS
+    result = decompress_pack_bits(compressed_image_data.buf, compressed_image_data_size, uncompressed_pixels, uncompressed_image_data_size);
+    if (result >= 0) {
+        memset(&uncompressed_pixels[result], 0, uncompressed_image_data_size - result);
     }
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&compressed_image_data);
 
     // RETURN THE DECOMPRESSED PIXELS TO PYTHON.
-    PyObject *return_value = Py_BuildValue("y#", uncompressed_image_data, uncompressed_image_data_size);
+    if (result < 0) {
+        Py_DECREF(uncompressed_image_data);
+        raise_decompression_error(result, -1);
+        return NULL;
+    }
+    return uncompressed_image_data;
+}
+
+/// Decompresses a PackBits stream into a writable buffer provided by the caller
+/// (like a bytearray or a NumPy array). The whole compressed buffer is decompressed,
+/// and the uncompressed size is the size of the destination buffer.
+/// \return The number of bytes written. Any bytes in the destination past this are untouched.
+static PyObject *method_decompress_pack_bits_into(PyObject *self, PyObject *args) {
+    // READ THE PARAMETERS FROM PYTHON.
+    Py_buffer compressed_image_data = {0};
+    Py_buffer uncompressed_image_data = {0};
+    if (!PyArg_ParseTuple(args, "y*w*", &compressed_image_data, &uncompressed_image_data)) {
+        return NULL;
+    }
+
+    // DECOMPRESS THIS IMAGE.
+    Py_ssize_t result = 0;
+    Py_BEGIN_ALLOW_THREADS
+    result = decompress_pack_bits(compressed_image_data.buf, compressed_image_data.len, uncompressed_image_data.buf, uncompressed_image_data.len);
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&compressed_image_data);
+    PyBuffer_Release(&uncompressed_image_data);
 
-    // FREE THE DECOMPRESSED PIXELS.
-    free(uncompressed_image_data);
-    return return_value;
+    // RETURN THE NUMBER OF BYTES WRITTEN TO PYTHON.
+    if (result < 0) {
+        raise_decompression_error(result, -1);
+        return NULL;
+    }
+    return PyLong_FromSsize_t(result);
 }
 
+/// Decompresses many PackBits streams in one call, with the GIL released for the whole batch.
+/// The streams are provided as a sequence of (compressed_data, uncompressed_size) pairs.
+/// \return A list with a new bytes object of the uncompressed size for each stream.
+static PyObject *method_decompress_many_pack_bits(PyObject *self, PyObject *args) {
+    // READ THE PARAMETERS FROM PYTHON.
+    PyObject *streams_object = NULL;
+    if (!PyArg_ParseTuple(args, "O", &streams_object)) {
+        return NULL;
+    }
+    PyObject *streams = PySequence_Fast(streams_object, "Expected a sequence of (compressed_data, uncompressed_size) pairs.");
+    if (streams == NULL) {
+        return NULL;
+    }
+    Py_ssize_t stream_count = PySequence_Fast_GET_SIZE(streams);
+
+    // PREPARE EVERY STREAM.
+    // Everything that touches Python objects must happen before the GIL is released.
+    Py_buffer *compressed_image_data = PyMem_Calloc(stream_count > 0 ? stream_count : 1, sizeof(Py_buffer));
+    Py_ssize_t *results = PyMem_Calloc(stream_count > 0 ? stream_count : 1, sizeof(Py_ssize_t));
+    PyObject *uncompressed_image_data = PyList_New(stream_count);
+    Py_ssize_t prepared_stream_count = 0;
+    if ((compressed_image_data == NULL) || (results == NULL) || (uncompressed_image_data == NULL)) {
+        PyErr_NoMemory();
+        goto error;
+    }
+    for (Py_ssize_t index = 0; index < stream_count; index++) {
+        Py_ssize_t uncompressed_image_data_size = 0;
+        PyObject *stream = PySequence_Fast_GET_ITEM(streams, index);
+        if (!PyTuple_Check(stream)) {
+            PyErr_Format(PyExc_TypeError, "Stream %zd: Each stream must be a (compressed_data, uncompressed_size) tuple.", index);
+            goto error;
+        }
+        if (!PyArg_ParseTuple(stream, "y*n;Each stream must be a (compressed_data, uncompressed_size) pair.",
+                &compressed_image_data[index], &uncompressed_image_data_size)) {
+            goto error;
+        }
+        prepared_stream_count++;
+        if (uncompressed_image_data_size < 0) {
+            PyErr_Format(PyExc_ValueError, "Stream %zd: Sizes must not be negative.", index);
+            goto error;
+        }
+        PyObject *uncompressed_pixels = PyBytes_FromStringAndSize(NULL, uncompressed_image_data_size);
+        if (uncompressed_pixels == NULL) {
+            goto error;
+        }
+        PyList_SET_ITEM(uncompressed_image_data, index, uncompressed_pixels);
+    }
+
+    // DECOMPRESS EVERY STREAM.
+    Py_BEGIN_ALLOW_THREADS
+    for (Py_ssize_t index = 0; index < stream_count; index++) {
+        PyObject *uncompressed_pixels_object = PyList_GET_ITEM(uncompressed_image_data, index);
+        unsigned char *uncompressed_pixels = (unsigned char *)PyBytes_AS_STRING(uncompressed_pixels_object);
+        Py_ssize_t uncompressed_image_data_size = PyBytes_GET_SIZE(uncompressed_pixels_object);
+        results[index] = decompress_pack_bits(
+            compressed_image_data[index].buf, compressed_image_data[index].len, uncompressed_pixels, uncompressed_image_data_size);
+        if (results[index] >= 0) {
+            memset(&uncompressed_pixels[results[index]], 0, uncompressed_image_data_size - results[index]);
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    // REPORT THE FIRST MALFORMED STREAM.
+    for (Py_ssize_t index = 0; index < stream_count; index++) {
+        if (results[index] < 0) {
+            raise_decompression_error(results[index], index);
+            goto error;
+        }
+    }
+
+    // RETURN THE DECOMPRESSED PIXELS TO PYTHON.
+    for (Py_ssize_t index = 0; index < prepared_stream_count; index++) {
+        PyBuffer_Release(&compressed_image_data[index]);
+    }
+    PyMem_Free(compressed_image_data);
+    PyMem_Free(results);
+    Py_DECREF(streams);
+    return uncompressed_image_data;
+
+error:
+    if (compressed_image_data != NULL) {
+        for (Py_ssize_t index = 0; index < prepared_stream_count; index++) {
+            PyBuffer_Release(&compressed_image_data[index]);
+        }
+    }
+    PyMem_Free(compressed_image_data);
+    PyMem_Free(results);
+    Py_XDECREF(uncompressed_image_data);
+    Py_DECREF(streams);
+    return NULL;
+}
 
 /// Defines the Python methods callable in this module.
 static PyMethodDef PackBitsDecompressionMethod[] = {
-    {"decompress", method_decompress_pack_bits, METH_VARARGS, "Decompresses raw PackBits-encoded streams."},
+    {"decompress", method_decompress_pack_bits, METH_VARARGS,
+        "decompress(compressed_data, compressed_size, uncompressed_size) -> bytes\n\n"
+        "Decompresses a raw PackBits-encoded stream from any buffer-protocol object."},
+    {"decompress_into", method_decompress_pack_bits_into, METH_VARARGS,
+        "decompress_into(compressed_data, destination) -> int\n\n"
+        "Decompresses a raw PackBits-encoded stream directly into a writable buffer, like a bytearray\n"
+        "or NumPy array, and returns the number of bytes written."},
+    {"decompress_many", method_decompress_many_pack_bits, METH_VARARGS,
+        "decompress_many(streams) -> list\n\n"
+        "Decompresses a sequence of (compressed_data, uncompressed_size) pairs with the GIL released."},
     // An entry of nulls must be provided to indicate we're done.
     {NULL, NULL, 0, NULL}
 };
 
-/// Defines the Python module itself. Because the module requires references to 
+/// Defines the Python module itself. Because the module requires references to
 /// each of the methods, the module must be defined after the methods.
 static struct PyModuleDef PackBitsModule = {
     PyModuleDef_HEAD_INIT,
     "PackBits",
-    "Python interface for interacting with raw PackBits-encoded streams. Currently only decompression is supported.",
+    "Python interface for interacting with raw PackBits-encoded streams. Currently only decompression is supported.\n"
+    "The GIL is released while decompressing, and malformed streams raise ValueError.",
     // A negative value indicates that this module doesn’t have support for sub-interpreters.
-    // A non-negative value enables the re-initialization of your module. It also specifies 
+    // A non-negative value enables the re-initialization of your module. It also specifies
     // the memory requirement of your module to be allocated on each sub-interpreter session.
     -1,
     PackBitsDecompressionMethod
@@ -0,0 +1,140 @@
+
+import logging
+import warnings
+from typing import Optional
+
+import numpy
+
+from .PixelCache import pixel_cache, MALFORMED_PIXELS
+from .Profiler import profile_phase, profile_count
+
+# ATTEMPT TO IMPORT THE C-BASED DECOMPRESSION LIBRARY.
+try:
+    # We will fall back to the NumPy implementation if it doesn't work, 
+    # which is slower but still within a small factor.
+    import PackBits
+    packbits_c_loaded = True
+except ImportError:
+    warnings.warn('The C PackBits decompression binary is not available on this installation. '
+        'Bitmaps will be decompressed with the NumPy fallback, which is slower.')
+    packbits_c_loaded = False
+
+# The number of compressed bytes (including the operation byte itself) 
+# consumed by each PackBits operation byte.
+#  - 0x00 through 0x7f: An uncompressed run of (n + 1) bytes follows.
+#  - 0x80: No-op.
+#  - 0x81 through 0xff: A single color byte follows.
+PACKBITS_OPERATION_LENGTHS = tuple([operation_byte + 2 for operation_byte in range(0x80)] + [1] + [2] * 0x7f)
+# The number of uncompressed bytes produced by each PackBits operation byte.
+PACKBITS_RUN_LENGTHS = tuple([operation_byte + 1 for operation_byte in range(0x80)] + [0] + [0x101 - operation_byte for operation_byte in range(0x81, 0x100)])
+
+## Decompresses a frame bitmap. Decompressed pixels are held in the shared pixel cache,
+## so decompressing the same bitmap repeatedly only decompresses it once.
+## \param[in] pixel_cache_key - Uniquely identifies the bitmap, like the module filepath
+##            and the position of the compressed bitmap in it.
+## \param[in] compressed_image_data - The compressed bitmap.
+## \param[in] compressed_image_data_size - The nominal size of the compressed bitmap.
+## \param[in] uncompressed_image_size - The nominal size of the decompressed bitmap.
+## \return The decompressed pixels, or None if the compressed bitmap is malformed.
+##         A malformed bitmap is reported as a warning and then treated as if there were no bitmap,
+##         so one bad frame doesn't stop the rest of the module from being exported.
+def decompress_frame_bitmap(pixel_cache_key, compressed_image_data, compressed_image_data_size: int, uncompressed_image_size: int) -> Optional[bytes]:
+    pixels = pixel_cache.get(pixel_cache_key)
+    if pixels is None:
+        profile_count('pixel_cache_misses')
+        try:
+            with profile_phase('decompression'):
+                if packbits_c_loaded:
+                    pixels = PackBits.decompress(compressed_image_data, compressed_image_data_size, uncompressed_image_size)
+                else:
+                    pixels = decompress_pack_bits_with_numpy(compressed_image_data, compressed_image_data_size, uncompressed_image_size)
+        except ValueError as error:
+            profile_count('malformed_bitmaps')
+            logging.warning(f'Skipping the malformed bitmap at {pixel_cache_key}: {error}')
+            pixels = MALFORMED_PIXELS
+        else:
+            profile_count('c_decompressions' if packbits_c_loaded else 'python_decompressions')
+            profile_count('decompressed_bytes_in', compressed_image_data_size)
+            profile_count('decompressed_bytes_out', len(pixels))
+        pixel_cache.put(pixel_cache_key, pixels)
+    else:
+        profile_count('pixel_cache_hits')
+    if pixels is MALFORMED_PIXELS:
+        return None
+    return pixels
+
+## Applies Apple PackBits to decompress a bitmap bitstream. The pixels are exactly the same
+## as from the C implementation, including for malformed streams.
+## \param[in] compressed_image_data - The compressed bitmap.
+## \param[in] compressed_image_data_size - The nominal size of the compressed bitmap.
+## \param[in] uncompressed_image_size - The nominal size of the decompressed bitmap.
+## \return The decompressed pixels, padded with zeros to the uncompressed size.
+##         Some bitmaps in the game decompress to exactly one byte more than their
+##         stated size, so that extra byte is dropped.
+## \exception ValueError - The compressed stream ends in the middle of a run,
+##             or a run extends more than one byte past the uncompressed size.
+# NOTE: This is a NumPy implementation that is used when the C implementation is not available.
+# It is within a small factor of the C implementation, but the C implementation should be preferred.
+def decompress_pack_bits_with_numpy(compressed_image_data, compressed_image_data_size: int, uncompressed_image_size: int) -> bytes:
+    if (compressed_image_data_size < 0) or (uncompressed_image_size < 0):
+        raise ValueError('Sizes must not be negative.')
+
+    # FIND THE OPERATION BYTES IN THE COMPRESSED IMAGE STREAM.
+    # Only the operation bytes are visited here, not every byte of every run,
+    # so this loop runs once per run rather than once per pixel. The runs
+    # themselves are then described all at once from their operation bytes.
+    # Like the C implementation, this stops once the uncompressed pixels are full.
+    compressed_image_data_size = min(compressed_image_data_size, len(compressed_image_data))
+    operation_pointers = []
+    register_operation = operation_pointers.append
+    operation_lengths = PACKBITS_OPERATION_LENGTHS
+    run_lengths = PACKBITS_RUN_LENGTHS
+    compressed_data_index = 0
+    uncompressed_data_index = 0
+    while (compressed_data_index < compressed_image_data_size) and (uncompressed_data_index < uncompressed_image_size):
+        register_operation(compressed_data_index)
+        operation_byte = compressed_image_data[compressed_data_index]
+        compressed_data_index += operation_lengths[operation_byte]
+        uncompressed_data_index += run_lengths[operation_byte]
+
+    # CHECK THE STREAM IS WELL-FORMED.
+    # Only the last run can be cut off by the end of the stream.
+    if compressed_data_index > compressed_image_data_size:
+        raise ValueError('The compressed stream ends in the middle of a run.')
+    if uncompressed_data_index - uncompressed_image_size > 1:
+        raise ValueError('A run extends past the end of the uncompressed buffer.')
+    if len(operation_pointers) == 0:
+        return bytes(uncompressed_image_size)
+
+    # DESCRIBE THE RUNS.
+    compressed_image_data = numpy.frombuffer(compressed_image_data, dtype = numpy.uint8, count = compressed_image_data_size)
+    operation_pointers = numpy.array(operation_pointers, dtype = numpy.intp)
+    operation_bytes = compressed_image_data[operation_pointers].astype(numpy.intp)
+    # An operation byte of 0x80 (-128) is a no-op, so it has no run.
+    has_run = (operation_bytes != 0x80)
+    operation_bytes = operation_bytes[has_run]
+    run_source_pointers = operation_pointers[has_run] + 1
+    # An operation byte inclusively between 0x00 (+0) and 0x7f (+127) indicates
+    # an uncompressed run of the value of the operation byte plus one.
+    # An operation byte inclusively between 0x81 (-127) and 0xff (-1) indicates
+    # the next byte is a color that should be repeated for a run of (-n+1) pixels.
+    run_is_literal = operation_bytes <= 0x7f
+    run_lengths = numpy.where(run_is_literal, operation_bytes + 1, 0x101 - operation_bytes)
+
+    # EXPAND THE RUNS.
+    # Each uncompressed run contributes each of its bytes once, and each compressed
+    # run contributes its one color byte many times. So the pixels are just the
+    # selected bytes of the compressed stream, each repeated the right number of times.
+    # An uncompressed run selects each of its bytes; a compressed run selects only its color byte.
+    selected_bytes_per_run = numpy.where(run_is_literal, run_lengths, 1)
+    selected_byte_offsets = numpy.arange(selected_bytes_per_run.sum(), dtype = numpy.intp) - \
+        numpy.repeat(numpy.cumsum(selected_bytes_per_run) - selected_bytes_per_run, selected_bytes_per_run)
+    selected_byte_pointers = numpy.repeat(run_source_pointers, selected_bytes_per_run) + selected_byte_offsets
+    # Each selected byte of an uncompressed run appears once; a color byte appears for its whole run.
+    selected_byte_repetitions = numpy.repeat(numpy.where(run_is_literal, 1, run_lengths), selected_bytes_per_run)
+    pixels = numpy.repeat(compressed_image_data[selected_byte_pointers], selected_byte_repetitions)
+
+    # FIT THE PIXELS TO THE UNCOMPRESSED SIZE.
+    # Any extra byte is dropped, and any pixels the stream didn't cover are zero.
+    pixels = pixels[:uncompressed_image_size].tobytes()
+    return pixels + bytes(uncompressed_image_size - len(pixels))
@@ -0,0 +1,64 @@
+
+from typing import List, Optional
+
+import numpy
+from asset_extraction_framework.Asset.Palette import RgbPalette
+
+## Expands paletted (8-bit indexed) pixels to RGB or RGBA with one 256-entry lookup table,
+## so many bitmaps that share a palette can be expanded at once with a single NumPy gather.
+class PaletteLookupTable:
+    ## \param[in] palette - The palette that the indexed pixels refer to.
+    ## \param[in] include_alpha - When True, pixels are expanded to RGBA; otherwise, to RGB.
+    ## \param[in] transparent_color - The color index that is fully transparent in RGBA output.
+    ##            All other colors are fully opaque. None if no color is transparent.
+    def __init__(self, palette: RgbPalette, include_alpha: bool = True, transparent_color: Optional[int] = None):
+        self.include_alpha = include_alpha
+        self.channel_count = 4 if include_alpha else 3
+        rgb_entries = numpy.frombuffer(bytes(palette.raw_rgb_bytes()), dtype = numpy.uint8).reshape(-1, 3)
+        self._table = numpy.zeros((0x100, self.channel_count), dtype = numpy.uint8)
+        self._table[:len(rgb_entries), 0:3] = rgb_entries[:0x100]
+        if include_alpha:
+            self._table[:, 3] = 0xff
+            if transparent_color is not None:
+                self._table[transparent_color, 3] = 0x00
+
+    ## \return The PIL image mode of the expanded pixels.
+    @property
+    def image_mode(self) -> str:
+        return 'RGBA' if self.include_alpha else 'RGB'
+
+    ## Expands the pixels of many bitmaps at once.
+    ## \param[in] bitmaps - The bitmaps to expand. Each must provide pixels, width, and height.
+    ## \return For each bitmap, a contiguous (height, width, channels) array of expanded pixels.
+    ##         None for any bitmap that has no pixels or fewer pixels than its dimensions require.
+    ##         All the arrays are views into one block of memory that holds every expanded bitmap.
+    def expand(self, bitmaps) -> List[Optional[numpy.ndarray]]:
+        # COLLECT THE INDEXED PIXELS.
+        dimensions = []
+        indexed_pixels = []
+        for bitmap in bitmaps:
+            pixels = bitmap.pixels
+            width, height = bitmap.width, bitmap.height
+            bitmap_has_pixels = (pixels is not None) and (width is not None) and (height is not None) and \
+                (width * height > 0) and (len(pixels) >= width * height)
+            if not bitmap_has_pixels:
+                dimensions.append(None)
+                continue
+            dimensions.append((width, height))
+            indexed_pixels.append(memoryview(pixels)[:width * height])
+
+        # EXPAND ALL THE PIXELS AT ONCE.
+        expanded_pixels = self._table[numpy.frombuffer(b''.join(indexed_pixels), dtype = numpy.uint8)]
+
+        # SPLIT THE EXPANDED PIXELS BACK INTO BITMAPS.
+        expanded_bitmaps = []
+        start_index = 0
+        for bitmap_dimensions in dimensions:
+            if bitmap_dimensions is None:
+                expanded_bitmaps.append(None)
+                continue
+            width, height = bitmap_dimensions
+            end_index = start_index + (width * height)
+            expanded_bitmaps.append(expanded_pixels[start_index:end_index].reshape(height, width, self.channel_count))
+            start_index = end_index
+        return expanded_bitmaps
@@ -0,0 +1,158 @@
+
+import os
+import struct
+import hashlib
+import sqlite3
+import itertools
+
+from .Background import Background
+from .Asset import Asset
+
+## Records where everything is in each parsed module, so later runs can
+## skip parsing the headers and read the payloads directly from their positions.
+##
+## The index is a SQLite database. A module is looked up by its path, size, and
+## modification time first. If any of those changed, the module is looked up by the
+## hash of its contents instead, so a module that was only copied or touched is still found.
+## Modules that changed are not found at all, so they are parsed again and re-indexed.
+class ParseIndex:
+    # Increment whenever the tables change. Indices with another version are rebuilt.
+    SCHEMA_VERSION = 1
+
+    # The columns of each table, after the columns that identify the row.
+    # These are the keys of the index records of the corresponding classes.
+    MODULE_COLUMNS = ('chunk_pointers', 'unk1')
+    BACKGROUND_COLUMNS = ('unk1', 'unk2', 'unk3', 'unk4', 'unk5', 'filename', 'unk6', 'unk7', 'unk8', 'unk8_1',
+        'unk12', 'unk9', 'unk10', 'unk13', 'palette', 'width', 'height', 'unk14', 'pixels_pointer', 'pixel_count')
+    ASSET_COLUMNS = ('type', 'cursor_directions', 'cursor_facets', 'frame_count', 'contents', 'width', 'height', 'unk1',
+        'left', 'top', 'unk2', 'horizontal_resolution', 'vertical_resolution', 'unk3', 'hotspot_x', 'hotspot_y', 'frames_pointer')
+    FRAME_COLUMNS = ('width', 'height', 'uncompressed_image_size', 'compressed_image_data_size', 'audio_length_in_bytes',
+        'left', 'top', 'audio_pointer', 'raw_pointer')
+
+    ## Opens the index, creating it if it doesn't exist.
+    ## \param[in] database_path - The path to the SQLite database that holds the index.
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        # Several worker processes might share the same index.
+        self._connection = sqlite3.connect(database_path, timeout = 60)
+        self._connection.row_factory = sqlite3.Row
+        self._create_tables()
+
+    ## Closes the index.
+    def close(self):
+        self._connection.close()
+
+    ## Creates the module from the index, if the index has a record of this exact module.
+    ## \param[in,out] module - The module to create, with its file opened but nothing parsed.
+    ## \return True if the module was created from the index; False if it must be parsed.
+    def restore(self, module) -> bool:
+        # FIND THE MODULE.
+        content_hash = self._find_content_hash(module)
+        module_record = self._connection.execute('SELECT * FROM modules WHERE content_hash = ?', (content_hash,)).fetchone()
+        if module_record is None:
+            return False
+
+        # RESTORE THE CHUNK TABLE.
+        chunk_pointer_count = len(module_record['chunk_pointers']) // 4
+        module._chunk_pointers = list(struct.unpack(f'<{chunk_pointer_count}L', module_record['chunk_pointers']))
+        module.unk1 = module_record['unk1']
+
+        # RESTORE THE BACKGROUND.
+        background_record = self._connection.execute('SELECT * FROM backgrounds WHERE content_hash = ?', (content_hash,)).fetchone()
+        module.background = Background.from_index_record(module, background_record)
+
+        # RESTORE THE ASSETS.
+        asset_records = self._connection.execute(
+            'SELECT * FROM assets WHERE content_hash = ? ORDER BY asset_index', (content_hash,)).fetchall()
+        frame_records = self._connection.execute(
+            'SELECT * FROM frames WHERE content_hash = ? ORDER BY asset_index, frame_index', (content_hash,))
+        frame_records_by_asset = {asset_index: list(records) for asset_index, records in
+            itertools.groupby(frame_records, key = lambda frame_record: frame_record['asset_index'])}
+        for asset_record in asset_records:
+            asset_frame_records = frame_records_by_asset.get(asset_record['asset_index'], [])
+            module.assets.append(Asset.from_index_record(module, asset_record, asset_frame_records))
+        return True
+
+    ## Records everything in a parsed module, replacing any previous record of it.
+    ## \param[in] module - The module to record. All of its frames are read if they weren't already.
+    def store(self, module):
+        content_hash = self._find_content_hash(module)
+        with self._connection:
+            # REMOVE ANY PREVIOUS RECORD.
+            for table_name in ('modules', 'backgrounds', 'assets', 'frames'):
+                self._connection.execute(f'DELETE FROM {table_name} WHERE content_hash = ?', (content_hash,))
+
+            # RECORD THE MODULE.
+            chunk_pointers = struct.pack(f'<{len(module._chunk_pointers)}L', *module._chunk_pointers)
+            self._insert('modules', (content_hash,), {'chunk_pointers': chunk_pointers, 'unk1': module.unk1})
+            self._insert('backgrounds', (content_hash,), module.background.to_index_record())
+            for asset_index, asset in enumerate(module.assets):
+                self._insert('assets', (content_hash, asset_index), asset.to_index_record())
+                for frame_index, frame_record in enumerate(asset.frame_table().index_records()):
+                    self._insert('frames', (content_hash, asset_index, frame_index), frame_record)
+
+            # RECORD WHERE THE MODULE IS.
+            self._record_path(module, content_hash)
+
+    ## \return The hash of the contents of the module. The hash is only
+    ##         calculated when the path, size, or modification time of the module
+    ##         don't match what is in the index.
+    def _find_content_hash(self, module) -> str:
+        # FIND THE MODULE BY ITS PATH.
+        path = os.path.realpath(module.filepath)
+        file_status = os.stat(path)
+        path_record = self._connection.execute('SELECT * FROM module_paths WHERE path = ?', (path,)).fetchone()
+        path_is_current = (path_record is not None) and \
+            (path_record['size'] == file_status.st_size) and \
+            (path_record['modification_time'] == file_status.st_mtime_ns)
+        if path_is_current:
+            return path_record['content_hash']
+
+        # FIND THE MODULE BY ITS CONTENTS.
+        content_hash = hashlib.sha256(module.stream).hexdigest()
+        with self._connection:
+            self._record_path(module, content_hash)
+        return content_hash
+
+    ## Records the path, size, and modification time of a module with the hash of its contents.
+    def _record_path(self, module, content_hash: str):
+        path = os.path.realpath(module.filepath)
+        file_status = os.stat(path)
+        self._connection.execute('INSERT OR REPLACE INTO module_paths VALUES (?, ?, ?, ?)',
+            (path, file_status.st_size, file_status.st_mtime_ns, content_hash))
+
+    ## Inserts a record into a table.
+    ## \param[in] key - The values of the columns that identify the row.
+    ## \param[in] record - The values of the other columns, by column name.
+    def _insert(self, table_name: str, key: tuple, record: dict):
+        values = (*key, *record.values())
+        placeholders = ', '.join('?' * len(values))
+        self._connection.execute(f'INSERT INTO {table_name} ({", ".join(self._key_columns(table_name))}, {", ".join(record.keys())}) VALUES ({placeholders})', values)
+
+    ## \return The names of the columns that identify the rows of a table.
+    @staticmethod
+    def _key_columns(table_name: str) -> tuple:
+        return {
+            'modules': ('content_hash',),
+            'backgrounds': ('content_hash',),
+            'assets': ('content_hash', 'asset_index'),
+            'frames': ('content_hash', 'asset_index', 'frame_index')}[table_name]
+
+    ## Creates the tables of the index, discarding an index made by another version.
+    def _create_tables(self):
+        with self._connection:
+            # DISCARD AN OUTDATED INDEX.
+            schema_version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+            if schema_version != self.SCHEMA_VERSION:
+                for table_name in ('module_paths', 'modules', 'backgrounds', 'assets', 'frames'):
+                    self._connection.execute(f'DROP TABLE IF EXISTS {table_name}')
+                self._connection.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+            # CREATE THE TABLES.
+            self._connection.execute('CREATE TABLE IF NOT EXISTS module_paths '
+                '(path TEXT PRIMARY KEY, size INTEGER, modification_time INTEGER, content_hash TEXT)')
+            for table_name, columns in (('modules', self.MODULE_COLUMNS), ('backgrounds', self.BACKGROUND_COLUMNS),
+                    ('assets', self.ASSET_COLUMNS), ('frames', self.FRAME_COLUMNS)):
+                key_columns = self._key_columns(table_name)
+                self._connection.execute(f'CREATE TABLE IF NOT EXISTS {table_name} '
+                    f'({", ".join((*key_columns, *columns))}, PRIMARY KEY ({", ".join(key_columns)}))')
@@ -0,0 +1,96 @@
+
+from collections import OrderedDict
+import threading
+
+## Holds decompressed bitmap pixels so each frame is only decompressed once,
+## even when the pixels are read many times during export.
+## The total size of the cached pixels is bounded, and the least recently
+## used pixels are evicted first when the budget is exceeded.
+class PixelCache:
+    DEFAULT_MAXIMUM_SIZE_IN_BYTES = 64 * 1024 * 1024
+
+    ## \param[in] maximum_size_in_bytes - The most pixel bytes that can be held at once.
+    ##            Zero disables caching.
+    def __init__(self, maximum_size_in_bytes: int = DEFAULT_MAXIMUM_SIZE_IN_BYTES):
+        self.maximum_size_in_bytes = maximum_size_in_bytes
+        self.size_in_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Frames might be decoded from several threads at once.
+        self._lock = threading.Lock()
+
+    ## \return The cached pixels for the given key, or None if they are not cached.
+    ## \param[in] key - Uniquely identifies the compressed pixels, like
+    ##            the module filepath and the position of the pixels in it.
+    def get(self, key):
+        with self._lock:
+            pixels = self._entries.get(key)
+            if pixels is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return pixels
+
+    ## Caches the pixels for the given key, evicting the least recently used
+    ## pixels until the cache is back within its budget.
+    ## Pixels larger than the whole budget are never cached, and nothing is cached
+    ## when the budget is zero.
+    def put(self, key, pixels):
+        pixels_size_in_bytes = len(pixels)
+        if (self.maximum_size_in_bytes == 0) or (pixels_size_in_bytes > self.maximum_size_in_bytes):
+            return
+
+        with self._lock:
+            existing_pixels = self._entries.pop(key, None)
+            if existing_pixels is not None:
+                self.size_in_bytes -= len(existing_pixels)
+            self._entries[key] = pixels
+            self.size_in_bytes += pixels_size_in_bytes
+            self._evict(self.maximum_size_in_bytes)
+
+    ## Changes the budget of the cache, evicting pixels if needed.
+    def resize(self, maximum_size_in_bytes: int):
+        with self._lock:
+            self.maximum_size_in_bytes = maximum_size_in_bytes
+            self._evict(maximum_size_in_bytes)
+
+    ## Removes all the cached pixels and resets the counters.
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_in_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    ## \return The cache counters, suitable for reporting.
+    @property
+    def statistics(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'size_in_bytes': self.size_in_bytes,
+            'maximum_size_in_bytes': self.maximum_size_in_bytes}
+
+    ## Evicts the least recently used pixels until the cache holds no more than the given size.
+    ## The lock must be held by the caller.
+    def _evict(self, maximum_size_in_bytes: int):
+        while self.size_in_bytes > maximum_size_in_bytes:
+            _, evicted_pixels = self._entries.popitem(last = False)
+            self.size_in_bytes -= len(evicted_pixels)
+            self.evictions += 1
+
+## Held in the cache in place of the pixels of a bitmap that could not be decompressed,
+## so that bitmap is only decompressed (and reported) once while it is held.
+## It takes no space, and it is evicted and cleared along with the other pixels.
+class MalformedPixels(bytes):
+    pass
+MALFORMED_PIXELS = MalformedPixels()
+
+## Decompressed pixels are shared across all the modules in this process.
+pixel_cache = PixelCache()
@@ -0,0 +1,182 @@
+
+import os
+import time
+import cProfile
+import threading
+import contextlib
+import tracemalloc
+from typing import Optional
+
+# The profile that work is currently recorded in, if any.
+_active_profile = None
+
+## Records where the time goes while a module is parsed and exported.
+##
+## Work is divided into phases, like decompression or metadata export. Phases can be nested,
+## but each moment is only counted once, in the innermost phase, so on one thread the phase
+## times add up to no more than the wall time. Each thread has its own phases, so phases on
+## several threads (like when frames are decoded in parallel) can add up to more.
+##
+## Counters record things like bytes in and out, frame counts, and cache hits. Phases and
+## counters are recorded for the module and for the asset being exported at the time, if any.
+##
+## While a profile is active (inside a with block), the profile_phase and profile_count
+## functions record into it. A profile can be entered more than once, like when a module
+## is parsed and exported separately; everything accumulates.
+class Profile:
+    ## \param[in] module_filepath - The module that this profile is for.
+    ## \param[in] hooks - The optional profilers to run while this profile is active:
+    ##  - cprofile: Profile every function call with cProfile.
+    ##  - tracemalloc: Trace memory allocations with tracemalloc.
+    def __init__(self, module_filepath: str, hooks = ()):
+        self.module_filepath = module_filepath
+        self.hooks = tuple(hooks)
+        self.seconds = 0.0
+        self.phases = {}
+        self.counters = {}
+        self.assets = {}
+        self._current_asset = None
+        self._lock = threading.Lock()
+        self._thread_state = threading.local()
+        self._entered_time = None
+        self._previous_active_profile = None
+        self._cprofile = cProfile.Profile() if 'cprofile' in self.hooks else None
+        self._started_tracemalloc = False
+        self._peak_traced_memory = 0
+        self._top_allocations = []
+
+    ## Makes this the active profile and starts any hooks.
+    def __enter__(self):
+        global _active_profile
+        self._previous_active_profile = _active_profile
+        _active_profile = self
+        if ('tracemalloc' in self.hooks) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if 'tracemalloc' in self.hooks:
+            tracemalloc.reset_peak()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+        self._entered_time = time.perf_counter()
+        return self
+
+    ## Stops any hooks and restores the previously active profile.
+    ## The largest allocations are recorded as of the last time the profile is exited.
+    def __exit__(self, *exception_info):
+        global _active_profile
+        self.seconds += time.perf_counter() - self._entered_time
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if tracemalloc.is_tracing() and ('tracemalloc' in self.hooks):
+            self._peak_traced_memory = max(self._peak_traced_memory, tracemalloc.get_traced_memory()[1])
+            self._top_allocations = top_allocations()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        _active_profile = self._previous_active_profile
+
+    ## \return The profile that work should be recorded in, or None if it should not be recorded.
+    @staticmethod
+    def active() -> Optional['Profile']:
+        return _active_profile
+
+    ## Records the time spent in a phase. Time spent in phases nested inside it
+    ## is recorded in those phases instead.
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        # PAUSE THE ENCLOSING PHASE.
+        phase_stack = getattr(self._thread_state, 'phase_stack', None)
+        if phase_stack is None:
+            phase_stack = self._thread_state.phase_stack = []
+        start_time = time.perf_counter()
+        if len(phase_stack) > 0:
+            enclosing_phase_name, enclosing_phase_start_time = phase_stack[-1]
+            self._record_phase(enclosing_phase_name, start_time - enclosing_phase_start_time, call_count = 0)
+        phase_stack.append((name, start_time))
+        try:
+            yield
+        finally:
+            # RESUME THE ENCLOSING PHASE.
+            _, phase_start_time = phase_stack.pop()
+            end_time = time.perf_counter()
+            self._record_phase(name, end_time - phase_start_time, call_count = 1)
+            if len(phase_stack) > 0:
+                phase_stack[-1] = (phase_stack[-1][0], end_time)
+
+    ## Adds to a counter.
+    ## \param[in] for_asset - When True, the counter is also added to the asset being exported, if any.
+    ##            Work that isn't done for the current asset (like on export writer threads) shouldn't be.
+    def count(self, name: str, amount = 1, for_asset: bool = True):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            if for_asset and (self._current_asset is not None):
+                asset_counters = self._current_asset['counters']
+                asset_counters[name] = asset_counters.get(name, 0) + amount
+
+    ## Records everything done while exporting an asset in the report of that asset, as well as in the module.
+    ## \param[in] name - The name of the asset.
+    ## \param[in] fields - Anything else to report about the asset, like its type.
+    @contextlib.contextmanager
+    def asset(self, name: str, **fields):
+        asset_report = self.assets.setdefault(name, {'name': name, **fields, 'seconds': 0.0, 'phases': {}, 'counters': {}})
+        self._current_asset = asset_report
+        start_time = time.perf_counter()
+        try:
+            yield asset_report
+        finally:
+            asset_report['seconds'] += time.perf_counter() - start_time
+            self._current_asset = None
+
+    ## \return The report of everything recorded in this profile, as plain data that can be written as JSON.
+    ## \param[in] cprofile_filepath - Where to write the cProfile statistics, if that hook is used.
+    def report(self, cprofile_filepath: str = None) -> dict:
+        report = {
+            'module': self.module_filepath,
+            'seconds': self.seconds,
+            'phases': self.phases,
+            'counters': self.counters,
+            'assets': list(self.assets.values())}
+        if self._cprofile is not None and (cprofile_filepath is not None):
+            self._cprofile.dump_stats(cprofile_filepath)
+            report['cprofile'] = cprofile_filepath
+        if 'tracemalloc' in self.hooks:
+            report['tracemalloc'] = {'peak_bytes': self._peak_traced_memory, 'top_allocations': self._top_allocations}
+        return report
+
+    ## Adds the time spent in a phase to the module and the current asset.
+    def _record_phase(self, name: str, seconds: float, call_count: int):
+        with self._lock:
+            reports = [self.phases] if self._current_asset is None else [self.phases, self._current_asset['phases']]
+            for phases in reports:
+                phase = phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+                phase['seconds'] += seconds
+                phase['calls'] += call_count
+
+## \return The source lines that hold the most traced memory.
+def top_allocations(count: int = 10) -> list:
+    statistics = tracemalloc.take_snapshot().statistics('lineno')[:count]
+    return [{'location': f'{os.path.basename(statistic.traceback[0].filename)}:{statistic.traceback[0].lineno}',
+        'bytes': statistic.size, 'count': statistic.count} for statistic in statistics]
+
+## \return A context that records the time spent in a phase in the active profile,
+##         or that does nothing if no profile is active.
+def profile_phase(name: str):
+    if _active_profile is None:
+        return contextlib.nullcontext()
+    return _active_profile.phase(name)
+
+## Adds to a counter in the active profile, if any.
+def profile_count(name: str, amount = 1, for_asset: bool = True):
+    if _active_profile is not None:
+        _active_profile.count(name, amount, for_asset)
+
+## \return The total size of the files exported for an item, in bytes.
+##         An item is exported either to a directory with its name
+##         or to files with its name and any extension.
+def exported_size_in_bytes(export_directory_path: str, name: str) -> int:
+    item_directory_path = os.path.join(export_directory_path, name)
+    if os.path.isdir(item_directory_path):
+        return sum(os.path.getsize(os.path.join(directory_path, filename))
+            for directory_path, _, filenames in os.walk(item_directory_path) for filename in filenames)
+    return sum(os.path.getsize(os.path.join(export_directory_path, filename))
+        for filename in os.listdir(export_directory_path) if filename.startswith(f'{name}.'))
@@ -0,0 +1,139 @@
+
+import io
+import os
+import json
+import math
+from typing import List, Tuple
+
+from PIL import Image
+
+from .ExportWriter import ExportWriter
+from .Profiler import profile_phase
+
+## Packs all the frames of an asset into one image, with a JSON sidecar that locates each frame.
+##
+## Assets that are not animations (like cursors and other libraries of still frames) are otherwise
+## exported as one file per frame. Cursor sets alone have thousands of tiny frames, so the overhead
+## of creating each file dominates the export. An atlas replaces all those files with one image
+## and one sidecar, and downstream loaders can read all the frames as a single texture.
+##
+## The sidecar has the dimensions of the atlas, the position and hotspot of the asset, and
+## for each frame (in order) its rectangle in the atlas and its position in the asset.
+## Frames without a bitmap have no rectangle.
+class SpriteAtlas:
+    # The transparent pixels between frames, so frames don't bleed into each other when the atlas is filtered.
+    PADDING = 1
+
+    ## Packs the frames of an asset into an atlas. The frames must have exportable images already,
+    ## like after Module.expand_bitmaps for RGB and RGBA bitmaps.
+    ## \param[in] asset - The asset whose frames should be packed.
+    def __init__(self, asset):
+        self.asset = asset
+
+        # FIND THE FRAME IMAGES.
+        self._frame_images = []
+        for frame in asset.frames:
+            has_bitmap = (not frame.ignore_frame) and (frame.compressed_image_data_size > 0) and (frame._width > 0) and (frame._height > 0)
+            if has_bitmap and (frame._exportable_image is None):
+                frame.create_exportable_image_from_pixels()
+            self._frame_images.append(frame._exportable_image if has_bitmap else None)
+
+        # PACK THE FRAMES.
+        sizes = [image.size if image is not None else None for image in self._frame_images]
+        self.width, self.height, self.positions = pack_rectangles(sizes, self.PADDING)
+
+    ## \return The atlas image, with every frame pasted at its position.
+    ##         The rest of the atlas is filled with the transparent color of the asset.
+    def image(self) -> Image.Image:
+        # The mode and the colors of the atlas come from the first frame with a bitmap.
+        first_frame, first_frame_image = next(
+            (frame, image) for frame, image in zip(self.asset.frames, self._frame_images) if image is not None)
+        mode = first_frame_image.mode
+        if mode == 'P':
+            atlas = Image.new(mode, (self.width, self.height), color = self.asset._alpha_color)
+            atlas.putpalette(first_frame_image.getpalette())
+        else:
+            alpha_color = tuple(first_frame._palette.raw_rgb_bytes()[self.asset._alpha_color * 3:(self.asset._alpha_color * 3) + 3])
+            if mode == 'RGBA':
+                alpha_color += (0x00,)
+            atlas = Image.new(mode, (self.width, self.height), color = alpha_color)
+        for frame_image, position in zip(self._frame_images, self.positions):
+            if frame_image is not None:
+                atlas.paste(frame_image, box = position)
+        return atlas
+
+    ## \return The sidecar that locates each frame in the atlas, as plain data that can be written as JSON.
+    def sidecar(self) -> dict:
+        frame_records = []
+        for index, (frame, frame_image, position) in enumerate(zip(self.asset.frames, self._frame_images, self.positions)):
+            rectangle = None
+            if frame_image is not None:
+                rectangle = {'x': position[0], 'y': position[1], 'width': frame_image.width, 'height': frame_image.height}
+            frame_records.append({'index': index, 'rect': rectangle, '_left': frame._left, '_top': frame._top})
+        return {
+            'name': self.asset.name,
+            'type': self.asset.type.name,
+            'width': self.width,
+            'height': self.height,
+            '_left': self.asset._left,
+            '_top': self.asset._top,
+            'hotspot': {'x': self.asset.hotspot_x, 'y': self.asset.hotspot_y},
+            'cursor_directions': getattr(self.asset, 'cursor_directions', None),
+            'cursor_facets': getattr(self.asset, 'cursor_facets', None),
+            'frames': frame_records}
+
+    ## Writes the atlas image and its sidecar, queuing them on the active export writer if there is one.
+    ## The atlas is named after the asset, like {name}.png, and the sidecar is {name}.json.
+    ## \return False if the asset has no frames with bitmaps, so there is no atlas to write.
+    def export(self, directory_path: str, command_line_arguments) -> bool:
+        if all(image is None for image in self._frame_images):
+            return False
+
+        # ENCODE THE ATLAS.
+        filename = os.path.join(directory_path, self.asset.name)
+        encoded_atlas = io.BytesIO()
+        with profile_phase('image_encoding'):
+            self.image().save(encoded_atlas, command_line_arguments.bitmap_format)
+        encoded_sidecar = json.dumps(self.sidecar(), indent = 2).encode('utf-8')
+
+        # WRITE THE ATLAS AND THE SIDECAR.
+        files = ((f'{filename}.{command_line_arguments.bitmap_format}', encoded_atlas.getvalue()), (f'{filename}.json', encoded_sidecar))
+        export_writer = ExportWriter.active()
+        for filepath, data in files:
+            if export_writer is not None:
+                export_writer.write(filepath, data)
+            else:
+                with profile_phase('image_writing'), open(filepath, 'wb') as file:
+                    file.write(data)
+        return True
+
+## Packs rectangles into one larger rectangle with shelves: the rectangles are placed
+## tallest first, left to right in rows, and a new row is started when a rectangle doesn't fit.
+## The rows are about as wide as a square holding all the rectangles, so the atlas is roughly square.
+## \param[in] sizes - The width and height of each rectangle, or None for rectangles that shouldn't be placed.
+## \param[in] padding - The space to leave between rectangles.
+## \return The width and height of the packed rectangle, and the top-left corner of each
+##         rectangle in it (or None for those that weren't placed), in the same order as the sizes.
+def pack_rectangles(sizes: List[Tuple[int, int]], padding: int = 0) -> Tuple[int, int, List[Tuple[int, int]]]:
+    # DETERMINE THE ROW WIDTH.
+    placed_indices = [index for index, size in enumerate(sizes) if size is not None]
+    if len(placed_indices) == 0:
+        return 0, 0, [None] * len(sizes)
+    total_area = sum((sizes[index][0] + padding) * (sizes[index][1] + padding) for index in placed_indices)
+    widest_width = max(sizes[index][0] for index in placed_indices)
+    row_width = max(widest_width, math.ceil(math.sqrt(total_area)))
+
+    # PLACE THE RECTANGLES, TALLEST FIRST.
+    positions = [None] * len(sizes)
+    x = y = row_height = packed_width = 0
+    for index in sorted(placed_indices, key = lambda index: (-sizes[index][1], -sizes[index][0])):
+        width, height = sizes[index]
+        if (x > 0) and (x + width > row_width):
+            # START A NEW ROW.
+            y += row_height + padding
+            x = row_height = 0
+        positions[index] = (x, y)
+        packed_width = max(packed_width, x + width)
+        x += width + padding
+        row_height = max(row_height, height)
+    return packed_width, y + row_height, positions
@@ -0,0 +1,176 @@
+
+import os
+import random
+import struct
+
+# Writes synthetic module files with the same structure as the game's modules,
+# so parsing, decompression, and export can be tested and benchmarked without game data.
+#
+# Each module has a background with a palette and one asset of each asset type.
+# Frames are PackBits-compressed, and assets with audio interleave one audio chunk
+# every eight frames, with the doubled first audio chunk the game has at 22.050 kHz.
+
+# The color index that is transparent in all asset frames.
+ALPHA_COLOR = 0x0f
+AUDIO_CHUNK_LENGTH = 0x5622
+BITMAPS_PER_AUDIO = 8
+
+## Compresses pixels with Apple PackBits, as the game does.
+## \param[in] pixels - The uncompressed pixels.
+## \return The compressed pixels.
+def packbits_compress(pixels: bytes) -> bytes:
+    compressed_pixels = bytearray()
+    index = 0
+    while index < len(pixels):
+        # MEASURE THE RUN OF REPEATED PIXELS HERE.
+        MAXIMUM_RUN_LENGTH = 0x80
+        run_length = 1
+        while (index + run_length < len(pixels)) and (pixels[index + run_length] == pixels[index]) and (run_length < MAXIMUM_RUN_LENGTH):
+            run_length += 1
+
+        if run_length > 1:
+            # WRITE A COMPRESSED RUN.
+            compressed_pixels.append(0x101 - run_length)
+            compressed_pixels.append(pixels[index])
+            index += run_length
+        else:
+            # WRITE AN UNCOMPRESSED RUN.
+            # It ends where a run of repeated pixels starts.
+            start_index = index
+            index += 1
+            while (index < len(pixels)) and (index - start_index < MAXIMUM_RUN_LENGTH) and \
+                    not ((index + 1 < len(pixels)) and (pixels[index + 1] == pixels[index])):
+                index += 1
+            compressed_pixels.append(index - start_index - 1)
+            compressed_pixels += pixels[start_index:index]
+    return bytes(compressed_pixels)
+
+## \return Pixels that look roughly like the game's sprites: runs of the transparent
+##         color and a few solid colors, broken up by stretches of noise.
+def synthetic_pixels(rng: random.Random, width: int, height: int) -> bytes:
+    pixels = bytearray()
+    while len(pixels) < width * height:
+        if rng.random() < 0.5:
+            pixels += bytes([rng.choice([ALPHA_COLOR, 0x01, 0x02])]) * rng.randrange(1, 200)
+        else:
+            pixels += rng.randbytes(rng.randrange(1, 30))
+    return bytes(pixels[:width * height])
+
+## \return The bytes of a background with the given dimensions and a palette.
+def background_bytes(rng: random.Random, width: int, height: int) -> bytes:
+    background = bytearray()
+    background += struct.pack('<5H', 1, 2, 3, 4, 5)
+    background += b'SYNTHETIC.BMP'.ljust(0x50, b'\x00')
+    background += struct.pack('<4L', 1, 2, 3, 4)
+    background += bytes(0x24)
+    background += struct.pack('<2L', 5, 6)
+    background += bytes(0x14)
+    # The palette is in blue-green-red order, with each entry aligned to four bytes.
+    for color_index in range(0x100):
+        background += bytes([color_index, (color_index * 7) & 0xff, 0xff - color_index, 0x00])
+    background += struct.pack('<3L', width, height, width * height)
+    background += bytes(0x0c)
+    background += rng.randbytes(width * height)
+    return bytes(background)
+
+## \return The bytes of an asset, and the uncompressed pixels of each of its frames.
+## \param[in] type_codes - The three type codes that start the asset.
+## \param[in] frame_count - The total number of frames in the asset.
+## \param[in] contents - The frame contents code: 0x00 for video only, 0x08 for audio and video.
+## \param[in] start_pointer - The position of the asset in the module, for the frame pointer table.
+def asset_bytes(rng: random.Random, type_codes, frame_count: int, contents: int, start_pointer: int,
+        width: int, height: int, hotspot = (0, 0)):
+    # WRITE THE HEADER.
+    # For cursors, the frame count is multiplied by the directions and facets in the type codes.
+    is_cursor = (type_codes[0:2] == (0x01, 0x0c))
+    header_frame_count = frame_count // (type_codes[1] * type_codes[2]) if is_cursor else frame_count
+    header = bytearray(struct.pack('<3H', *type_codes))
+    header += struct.pack('<4H', header_frame_count, contents, width, height)
+    header += bytes(0x56)
+    header += struct.pack('<2h', 5, 7)
+    header += bytes(0x04)
+    header += struct.pack('<2H', 640, 480)
+    header += bytes(0x0c)
+    header += struct.pack('<2H', *hotspot)
+
+    # WRITE THE FRAMES.
+    frames = []
+    frame_pixels = []
+    is_audio_only = (type_codes == (0x00, 0x00, 0x00))
+    for frame_index in range(frame_count):
+        frame_width, frame_height = (0, 0) if is_audio_only else (rng.randrange(4, width), rng.randrange(4, height))
+        pixels = synthetic_pixels(rng, frame_width, frame_height)
+        compressed_pixels = packbits_compress(pixels)
+        audio_length = AUDIO_CHUNK_LENGTH if contents != 0x00 else 0
+        frame = bytearray(struct.pack('<5L2h', frame_width, frame_height, len(pixels), len(compressed_pixels),
+            audio_length, rng.randrange(0, 10), rng.randrange(0, 10)))
+        if (audio_length > 0) and (frame_index % BITMAPS_PER_AUDIO == 0):
+            # The first audio chunk is twice as long as the others.
+            frame += rng.randbytes(audio_length * 2 if frame_index == 0 else audio_length)
+        frame += compressed_pixels
+        frames.append(bytes(frame))
+        frame_pixels.append(pixels)
+
+    # WRITE THE FRAME POINTERS.
+    # Only assets with video only have them.
+    if contents == 0x00:
+        frame_pointer = start_pointer + len(header) + (4 * frame_count)
+        for frame in frames:
+            header += struct.pack('<L', frame_pointer)
+            frame_pointer += len(frame)
+    return bytes(header) + b''.join(frames), frame_pixels
+
+## Writes a synthetic module file.
+## \param[in] filepath - Where to write the module.
+## \param[in] seed - Modules with the same seed and sizes are identical.
+## \param[in] frame_scale - Multiplies the number of frames in the animation assets,
+##            to make larger modules for benchmarking.
+## \param[in] frame_width, frame_height - The largest dimensions of the asset frames.
+## \return The uncompressed pixels of each frame of each asset, for verifying parsing.
+def write_synthetic_module(filepath: str, seed: int = 0, frame_scale: int = 1, frame_width: int = 40, frame_height: int = 30):
+    rng = random.Random(seed)
+    # Each asset is (type codes, frame count, contents code).
+    ASSETS = [
+        ((0x01, 0x01, 0x01), 6 * frame_scale, 0x00), # Timed animation
+        ((0x02, 0x01, 0x01), 1, 0x00), # Clickable still
+        ((0x03, 0x01, 0x01), 5, 0x00), # Scripted animation
+        ((0x00, 0x01, 0x01), 2, 0x00), # Earth component
+        ((0x01, 0x0c, 0x02), 24, 0x00), # Cursor with 12 directions and 2 facets
+        ((0x00, 0x00, 0x00), 3, 0x08), # Audio only
+        ((0x01, 0x01, 0x01), 10 * frame_scale, 0x08)] # Timed animation with audio
+
+    # WRITE THE BACKGROUND AND ASSETS.
+    background = background_bytes(rng, frame_width * 2, frame_height * 2)
+    chunk_table_length = 2 + (4 * len(ASSETS)) + 2 + 4
+    chunk_pointers = []
+    assets = []
+    asset_frame_pixels = []
+    chunk_pointer = chunk_table_length + len(background)
+    for type_codes, frame_count, contents in ASSETS:
+        hotspot = (3, 4) if type_codes == (0x02, 0x01, 0x01) else (0, 0)
+        asset, frame_pixels = asset_bytes(rng, type_codes, frame_count, contents, chunk_pointer, frame_width, frame_height, hotspot)
+        chunk_pointers.append(chunk_pointer)
+        assets.append(asset)
+        asset_frame_pixels.append(frame_pixels)
+        chunk_pointer += len(asset)
+
+    # WRITE THE MODULE.
+    with open(filepath, 'wb') as module_file:
+        module_file.write(struct.pack('<H', len(ASSETS)))
+        module_file.write(struct.pack(f'<{len(chunk_pointers)}L', *chunk_pointers))
+        module_file.write(struct.pack('<HL', len(ASSETS), 0))
+        module_file.write(background)
+        for asset in assets:
+            module_file.write(asset)
+    return asset_frame_pixels
+
+## Writes several synthetic modules, named like the game's modules.
+## \return The filepaths of the modules.
+def write_synthetic_modules(directory_path: str, module_count: int = 3, **kwargs):
+    os.makedirs(directory_path, exist_ok = True)
+    filepaths = []
+    for index in range(module_count):
+        filepath = os.path.join(directory_path, f'MODULE{index:02d}.DAT')
+        write_synthetic_module(filepath, seed = index, **kwargs)
+        filepaths.append(filepath)
+    return filepaths
@@ -0,0 +1,165 @@
+
+import os
+import time
+import tempfile
+import shutil
+import argparse
+
+import pytest
+
+from TonkaConstruction.Module import Module
+from TonkaConstruction.PixelCache import pixel_cache
+from TonkaConstruction.ExportWriter import ExportWriter
+import TonkaConstruction.PackBitsDecompression
+
+from synthetic_module import write_synthetic_modules
+
+# Throughput benchmarks for parsing, decompression, and export on synthetic modules.
+# Each benchmark prints its throughput and fails when the throughput falls below a minimum.
+# The minimums are far below what any reasonable machine achieves, so only a large
+# regression (like accidentally decompressing byte by byte) fails a benchmark.
+# On unusually slow machines, the minimums can be scaled down with the
+# TONKA_BENCHMARK_THRESHOLD_SCALE environment variable, or disabled with 0.
+#
+# Run this file directly to print the throughputs without checking them.
+
+BENCHMARK_MODULE_COUNT = 2
+BENCHMARK_FRAME_SCALE = 8
+BENCHMARK_FRAME_WIDTH = 320
+BENCHMARK_FRAME_HEIGHT = 240
+
+# Each is (megabytes per second, frames per second).
+MINIMUM_THROUGHPUTS = {
+    'parse': (20.0, 1000.0),
+    'decompress': (20.0, 200.0),
+    'decompress_python': (5.0, 50.0),
+    'export': (1.0, 20.0),
+    'export_overlapped': (1.0, 20.0)}
+
+## Measures how long something takes and how much it processes.
+class Throughput:
+    def __init__(self, name: str):
+        self.name = name
+        self.byte_count = 0
+        self.frame_count = 0
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception_info):
+        self.seconds += time.perf_counter() - self._start_time
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return (self.byte_count / (1024 * 1024)) / self.seconds
+
+    @property
+    def frames_per_second(self) -> float:
+        return self.frame_count / self.seconds
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.megabytes_per_second:.1f} MB/s, {self.frames_per_second:.0f} frames/s ' \
+            f'({self.byte_count} bytes, {self.frame_count} frames in {self.seconds:.3f} s)'
+
+    ## Fails if this throughput is below the minimums for its benchmark.
+    def check(self):
+        print(self)
+        threshold_scale = float(os.environ.get('TONKA_BENCHMARK_THRESHOLD_SCALE', 1.0))
+        minimum_megabytes_per_second, minimum_frames_per_second = MINIMUM_THROUGHPUTS[self.name]
+        assert self.megabytes_per_second >= minimum_megabytes_per_second * threshold_scale, str(self)
+        assert self.frames_per_second >= minimum_frames_per_second * threshold_scale, str(self)
+
+## \return The frames in all the assets of the modules.
+def all_frames(modules):
+    return [frame for module in modules for asset in module.assets for frame in asset.frames if frame.compressed_image_data_size > 0]
+
+## Measures parsing the modules. Throughput is measured in module bytes.
+def benchmark_parse(module_filepaths) -> Throughput:
+    throughput = Throughput('parse')
+    with throughput:
+        modules = [Module(module_filepath) for module_filepath in module_filepaths]
+    throughput.byte_count = sum(os.path.getsize(module_filepath) for module_filepath in module_filepaths)
+    throughput.frame_count = sum(len(asset.frames) for module in modules for asset in module.assets)
+    return throughput
+
+## Measures decompressing every frame of the modules, without the pixel cache.
+## Throughput is measured in decompressed bytes.
+## \param[in] use_c - When True, use the C decompressor; otherwise, use the NumPy decompressor.
+def benchmark_decompress(module_filepaths, use_c: bool = True) -> Throughput:
+    throughput = Throughput('decompress' if use_c else 'decompress_python')
+    frames = all_frames([Module(module_filepath) for module_filepath in module_filepaths])
+    saved_cache_size = pixel_cache.maximum_size_in_bytes
+    saved_packbits_c_loaded = TonkaConstruction.PackBitsDecompression.packbits_c_loaded
+    pixel_cache.resize(0)
+    TonkaConstruction.PackBitsDecompression.packbits_c_loaded = use_c and saved_packbits_c_loaded
+    try:
+        with throughput:
+            for frame in frames:
+                throughput.byte_count += len(frame.pixels)
+    finally:
+        pixel_cache.resize(saved_cache_size)
+        TonkaConstruction.PackBitsDecompression.packbits_c_loaded = saved_packbits_c_loaded
+    throughput.frame_count = len(frames)
+    return throughput
+
+## Measures parsing and exporting the modules to BMP bitmaps and WAV audio.
+## Throughput is measured in module bytes.
+## \param[in] export_writers - The number of threads that write exported files.
+##            Zero to write them directly.
+def benchmark_export(module_filepaths, export_directory_path: str, export_writers: int = 0) -> Throughput:
+    command_line_arguments = argparse.Namespace(bitmap_format = 'bmp', bitmap_options = 'no_framing',
+        animation_format = 'none', audio_format = 'wav', bitmap_color = 'paletted', incremental = False, content_store = None, decode_threads = 1,
+        export_writers = export_writers, export_queue_size = ExportWriter.DEFAULT_QUEUE_SIZE)
+    throughput = Throughput('export_overlapped' if export_writers > 0 else 'export')
+    with throughput:
+        for module_filepath in module_filepaths:
+            module = Module(module_filepath)
+            module.export_assets(export_directory_path, command_line_arguments)
+            throughput.frame_count += sum(len(asset.frames) for asset in module.assets)
+    throughput.byte_count = sum(os.path.getsize(module_filepath) for module_filepath in module_filepaths)
+    return throughput
+
+@pytest.fixture(scope = 'module')
+def benchmark_directory():
+    directory_path = tempfile.mkdtemp()
+    try:
+        yield directory_path
+    finally:
+        shutil.rmtree(directory_path)
+
+@pytest.fixture(scope = 'module')
+def benchmark_modules(benchmark_directory):
+    return write_synthetic_modules(os.path.join(benchmark_directory, 'input'), BENCHMARK_MODULE_COUNT,
+        frame_scale = BENCHMARK_FRAME_SCALE, frame_width = BENCHMARK_FRAME_WIDTH, frame_height = BENCHMARK_FRAME_HEIGHT)
+
+def test_parse_throughput(benchmark_modules):
+    benchmark_parse(benchmark_modules).check()
+
+def test_decompress_throughput(benchmark_modules):
+    if not TonkaConstruction.PackBitsDecompression.packbits_c_loaded:
+        pytest.skip('The C PackBits decompressor is not available.')
+    benchmark_decompress(benchmark_modules, use_c = True).check()
+
+def test_decompress_python_throughput(benchmark_modules):
+    benchmark_decompress(benchmark_modules, use_c = False).check()
+
+def test_export_throughput(benchmark_modules, benchmark_directory):
+    benchmark_export(benchmark_modules, os.path.join(benchmark_directory, 'export')).check()
+
+def test_export_overlapped_throughput(benchmark_modules, benchmark_directory):
+    benchmark_export(benchmark_modules, os.path.join(benchmark_directory, 'export_overlapped'), export_writers = 2).check()
+
+if __name__ == '__main__':
+    directory_path = tempfile.mkdtemp()
+    try:
+        module_filepaths = write_synthetic_modules(os.path.join(directory_path, 'input'), BENCHMARK_MODULE_COUNT,
+            frame_scale = BENCHMARK_FRAME_SCALE, frame_width = BENCHMARK_FRAME_WIDTH, frame_height = BENCHMARK_FRAME_HEIGHT)
+        print(benchmark_parse(module_filepaths))
+        print(benchmark_decompress(module_filepaths, use_c = True))
+        print(benchmark_decompress(module_filepaths, use_c = False))
+        print(benchmark_export(module_filepaths, os.path.join(directory_path, 'export')))
+        print(benchmark_export(module_filepaths, os.path.join(directory_path, 'export_overlapped'), export_writers = 2))
+    finally:
+        shutil.rmtree(directory_path)
@@ -0,0 +1,135 @@
+import mmap
+import random
+import logging
+
+import numpy
+import pytest
+
+from TonkaConstruction import PackBitsDecompression
+from TonkaConstruction.PackBitsDecompression import decompress_frame_bitmap, decompress_pack_bits_with_numpy
+
+try:
+    import PackBits
+except ImportError:
+    PackBits = None
+requires_c = pytest.mark.skipif(PackBits is None, reason = 'The C PackBits decompressor is not available.')
+
+# A stream with an uncompressed run of two bytes and a compressed run of three bytes.
+COMPRESSED_PIXELS = bytes.fromhex('010102fe03')
+PIXELS = bytes.fromhex('0102030303')
+
+@requires_c
+def test_decompress_buffers():
+    # VERIFY ANY BUFFER CAN BE DECOMPRESSED.
+    assert PackBits.decompress(COMPRESSED_PIXELS, len(COMPRESSED_PIXELS), len(PIXELS)) == PIXELS
+    assert PackBits.decompress(memoryview(b'\xff' + COMPRESSED_PIXELS)[1:], len(COMPRESSED_PIXELS), len(PIXELS)) == PIXELS
+    with mmap.mmap(-1, len(COMPRESSED_PIXELS)) as compressed_pixels:
+        compressed_pixels.write(COMPRESSED_PIXELS)
+        assert PackBits.decompress(compressed_pixels, len(COMPRESSED_PIXELS), len(PIXELS)) == PIXELS
+
+    # VERIFY THE PIXELS ARE PADDED TO THE UNCOMPRESSED SIZE.
+    assert PackBits.decompress(COMPRESSED_PIXELS, len(COMPRESSED_PIXELS), len(PIXELS) + 2) == PIXELS + b'\x00\x00'
+    # An operation byte of 0x80 is a no-op.
+    assert PackBits.decompress(bytes.fromhex('80fe07'), 3, 3) == b'\x07\x07\x07'
+
+@requires_c
+def test_decompress_into():
+    # VERIFY PIXELS CAN BE DECOMPRESSED INTO A BYTEARRAY OR AN ARRAY.
+    destination = bytearray(len(PIXELS) + 1)
+    assert PackBits.decompress_into(COMPRESSED_PIXELS, destination) == len(PIXELS)
+    assert destination == PIXELS + b'\x00'
+    destination = numpy.full(len(PIXELS), 0xff, dtype = numpy.uint8)
+    assert PackBits.decompress_into(COMPRESSED_PIXELS, destination) == len(PIXELS)
+    assert destination.tobytes() == PIXELS
+
+    # VERIFY A DESTINATION THAT IS TOO SMALL IS REJECTED.
+    # Bitmaps that decompress to one byte more than their size just lose that byte.
+    destination = bytearray(len(PIXELS) - 1)
+    assert PackBits.decompress_into(COMPRESSED_PIXELS, destination) == len(PIXELS) - 1
+    assert destination == PIXELS[:-1]
+    with pytest.raises(ValueError):
+        PackBits.decompress_into(COMPRESSED_PIXELS, bytearray(len(PIXELS) - 2))
+    with pytest.raises(TypeError):
+        PackBits.decompress_into(COMPRESSED_PIXELS, bytes(len(PIXELS)))
+
+@requires_c
+def test_decompress_many():
+    # VERIFY A BATCH OF STREAMS IS DECOMPRESSED.
+    streams = [(COMPRESSED_PIXELS, len(PIXELS)), (memoryview(COMPRESSED_PIXELS), len(PIXELS) + 1), (b'', 2)]
+    assert PackBits.decompress_many(streams) == [PIXELS, PIXELS + b'\x00', b'\x00\x00']
+    assert PackBits.decompress_many([]) == []
+
+    # VERIFY A MALFORMED STREAM IS REPORTED BY ITS INDEX.
+    with pytest.raises(ValueError, match = 'Stream 1'):
+        PackBits.decompress_many([(COMPRESSED_PIXELS, len(PIXELS)), (bytes.fromhex('020102'), 3)])
+    with pytest.raises(TypeError, match = 'Stream 0'):
+        PackBits.decompress_many([[COMPRESSED_PIXELS, len(PIXELS)]])
+    with pytest.raises(ValueError):
+        PackBits.decompress_many([(COMPRESSED_PIXELS, -1)])
+
+@requires_c
+def test_malformed_streams():
+    # VERIFY A TRUNCATED RUN IS REJECTED.
+    with pytest.raises(ValueError, match = 'ends in the middle of a run'):
+        PackBits.decompress(bytes.fromhex('020102'), 3, 3)
+    with pytest.raises(ValueError, match = 'ends in the middle of a run'):
+        PackBits.decompress(bytes.fromhex('fe'), 1, 3)
+
+    # VERIFY A RUN PAST THE END OF THE PIXELS IS REJECTED.
+    with pytest.raises(ValueError, match = 'past the end'):
+        PackBits.decompress(bytes.fromhex('fd07'), 2, 2)
+    with pytest.raises(ValueError):
+        PackBits.decompress(COMPRESSED_PIXELS, len(COMPRESSED_PIXELS), -1)
+
+@pytest.mark.parametrize('use_c', [pytest.param(True, marks = requires_c), False])
+def test_malformed_frame_bitmap(use_c, monkeypatch, caplog):
+    # VERIFY A MALFORMED BITMAP IS TREATED AS NO BITMAP.
+    monkeypatch.setattr(PackBitsDecompression, 'packbits_c_loaded', use_c)
+    pixel_cache_key = ('malformed', use_c)
+    with caplog.at_level(logging.WARNING):
+        assert decompress_frame_bitmap(pixel_cache_key, bytes.fromhex('fd07'), 2, 2) is None
+        assert decompress_frame_bitmap(pixel_cache_key, bytes.fromhex('fd07'), 2, 2) is None
+    # It is only reported once while it is cached.
+    assert len([record for record in caplog.records if 'malformed bitmap' in record.getMessage()]) == 1
+
+def test_numpy_decompression():
+    # VERIFY THE PIXELS ARE FIT TO THE UNCOMPRESSED SIZE.
+    assert decompress_pack_bits_with_numpy(COMPRESSED_PIXELS, len(COMPRESSED_PIXELS), len(PIXELS)) == PIXELS
+    assert decompress_pack_bits_with_numpy(bytes.fromhex('0005'), 2, 4) == b'\x05\x00\x00\x00'
+    assert decompress_pack_bits_with_numpy(bytes.fromhex('fd07'), 2, 3) == b'\x07\x07\x07'
+    assert decompress_pack_bits_with_numpy(b'', 0, 2) == b'\x00\x00'
+    # An operation byte of 0x80 is a no-op.
+    assert decompress_pack_bits_with_numpy(bytes.fromhex('80fe07'), 3, 3) == b'\x07\x07\x07'
+
+    # VERIFY MALFORMED STREAMS ARE REJECTED.
+    with pytest.raises(ValueError):
+        decompress_pack_bits_with_numpy(bytes.fromhex('020102'), 3, 3)
+    with pytest.raises(ValueError):
+        decompress_pack_bits_with_numpy(bytes.fromhex('fd07'), 2, 2)
+
+## \return The pixels decompressed with a decompressor, or the type of the exception it raised.
+def decompress_or_fail(decompress, compressed_pixels: bytes, compressed_size: int, uncompressed_size: int):
+    try:
+        return decompress(compressed_pixels, compressed_size, uncompressed_size)
+    except ValueError:
+        return ValueError
+
+@requires_c
+def test_numpy_decompression_matches_c():
+    # BUILD THE STREAMS.
+    # These include every short stream, to cover all the edge cases around
+    # the ends of both buffers, and many longer random streams.
+    rng = random.Random(0x544b)
+    streams = [bytes(stream) for stream in [
+        [], [0x00], [0x80], [0xff], [0x80, 0x80], [0x7f], [0x00, 0x01, 0x80], [0x81, 0x02], [0xfe, 0x03, 0x80, 0x00]]]
+    operation_bytes = [0x00, 0x01, 0x02, 0x7f, 0x80, 0x81, 0xfd, 0xfe, 0xff]
+    streams += [bytes([first, second, third]) for first in operation_bytes for second in operation_bytes for third in (0x05, 0x80)]
+    streams += [rng.randbytes(rng.randrange(1, 64)) for _ in range(500)]
+
+    # VERIFY THE DECOMPRESSORS AGREE.
+    for stream in streams:
+        for compressed_size in {len(stream), max(len(stream) - 1, 0), len(stream) + 1}:
+            for uncompressed_size in (0, 1, 2, 3, 5, 64, 200, 1000):
+                expected = decompress_or_fail(PackBits.decompress, stream, compressed_size, uncompressed_size)
+                actual = decompress_or_fail(decompress_pack_bits_with_numpy, stream, compressed_size, uncompressed_size)
+                assert actual == expected, (stream.hex(), compressed_size, uncompressed_size)
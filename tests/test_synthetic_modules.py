@@ -0,0 +1,746 @@
+import gc
+import io
+import os
+import json
+import logging
+import struct
+import wave
+import weakref
+import tempfile
+import shutil
+import argparse
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+from asset_extraction_framework.Asset.Palette import RgbPalette
+
+from TonkaConstruction import Engine
+from TonkaConstruction import PackBitsDecompression
+from TonkaConstruction import Module as ModuleModule
+from TonkaConstruction.Module import Module
+from TonkaConstruction.Asset import Asset
+from TonkaConstruction.PixelCache import PixelCache, pixel_cache
+from TonkaConstruction.AssetCatalog import AssetCatalog
+from TonkaConstruction.PaletteLookupTable import PaletteLookupTable
+from TonkaConstruction.ParseIndex import ParseIndex
+from TonkaConstruction.ExportManifest import ExportManifest
+from TonkaConstruction.ExportWriter import ExportWriter
+from TonkaConstruction.SpriteAtlas import SpriteAtlas
+from TonkaConstruction.Inventory import ModuleInventory
+
+from synthetic_module import write_synthetic_module, write_synthetic_modules, AUDIO_CHUNK_LENGTH
+
+try:
+    import PackBits
+except ImportError:
+    PackBits = None
+requires_c = pytest.mark.skipif(PackBits is None, reason = 'The C PackBits decompressor is not available.')
+
+@pytest.fixture
+def synthetic_directory():
+    directory_path = tempfile.mkdtemp()
+    try:
+        yield directory_path
+    finally:
+        shutil.rmtree(directory_path)
+
+def test_lazy_loading(synthetic_directory):
+    # OPEN THE MODULE LAZILY.
+    module_filepath = os.path.join(synthetic_directory, 'MODULE00.DAT')
+    asset_frame_pixels = write_synthetic_module(module_filepath)
+    lazy_module = Module(module_filepath, lazy = True)
+
+    # VERIFY NO FRAMES WERE READ.
+    unread_assets = lazy_module.assets._assets
+    assert len(lazy_module.assets) == len(asset_frame_pixels)
+    assert not any(asset._frames_read for asset in unread_assets)
+
+    # VERIFY INDEXING AN ASSET READS ONLY THAT ASSET.
+    lazy_module.assets[2]
+    assert [asset._frames_read for asset in unread_assets] == [index == 2 for index in range(len(unread_assets))]
+
+    # VERIFY THE FRAMES OF AN ASSET ARE READ WHEN THEY ARE FIRST TOUCHED.
+    assert len(unread_assets[0].frames) == len(asset_frame_pixels[0])
+    assert unread_assets[0]._frames_read
+    assert len(unread_assets[-1].sounds) > 0
+
+    # VERIFY THE ASSETS MATCH AN EAGER PARSE.
+    eager_module = Module(module_filepath)
+    for lazy_asset, eager_asset, frame_pixels in zip(lazy_module.assets, eager_module.assets, asset_frame_pixels):
+        assert lazy_asset.type == eager_asset.type
+        assert (lazy_asset.width, lazy_asset.height) == (eager_asset.width, eager_asset.height)
+        assert [frame.pixels or b'' for frame in lazy_asset.frames] == [frame.pixels or b'' for frame in eager_asset.frames] == frame_pixels
+        assert [(frame.left, frame.top) for frame in lazy_asset.frames] == [(frame.left, frame.top) for frame in eager_asset.frames]
+        assert [sound._pcm for sound in lazy_asset.sounds] == [sound._pcm for sound in eager_asset.sounds]
+
+def test_pixel_cache():
+    # FILL THE CACHE PAST ITS BUDGET.
+    cache = PixelCache(maximum_size_in_bytes = 10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    assert cache.get('a') == b'aaaa'
+    cache.put('c', b'cccc')
+
+    # VERIFY THE LEAST RECENTLY USED PIXELS WERE EVICTED.
+    # Reading a made it more recently used than b.
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa'
+    assert cache.get('c') == b'cccc'
+    assert cache.statistics == {'hits': 3, 'misses': 1, 'evictions': 1, 'entries': 2, 'size_in_bytes': 8, 'maximum_size_in_bytes': 10}
+    # Pixels larger than the whole budget are never cached.
+    cache.put('d', b'd' * 11)
+    assert cache.get('d') is None
+
+    # VERIFY A BUDGET OF ZERO DISABLES THE CACHE.
+    cache.resize(0)
+    assert (cache.size_in_bytes, cache.evictions) == (0, 3)
+    cache.put('a', b'aaaa')
+    assert cache.get('a') is None
+
+    # VERIFY CLEARING RESETS THE CACHE.
+    cache.resize(10)
+    cache.put('a', b'aaaa')
+    cache.clear()
+    assert cache.statistics == {'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 0, 'size_in_bytes': 0, 'maximum_size_in_bytes': 10}
+    assert cache.get('a') is None
+
+## \return The contents of every file in a directory tree, by path relative to the directory.
+def read_directory_tree(directory_path: str) -> dict:
+    files = {}
+    for subdirectory_path, _, filenames in os.walk(directory_path):
+        for filename in filenames:
+            filepath = os.path.join(subdirectory_path, filename)
+            with open(filepath, 'rb') as file:
+                files[os.path.relpath(filepath, directory_path)] = file.read()
+    return files
+
+def test_zero_copy(synthetic_directory):
+    # EXPORT THE MODULES WITH AND WITHOUT COPYING THE PAYLOADS.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    module_filepaths = write_synthetic_modules(input_directory)
+    copy_export_directory = os.path.join(synthetic_directory, 'copy')
+    zero_copy_export_directory = os.path.join(synthetic_directory, 'zero_copy')
+    Engine.main([input_directory, '--export', copy_export_directory])
+    Engine.main([input_directory, '--export', zero_copy_export_directory, '--zero-copy'])
+
+    # VERIFY THE EXPORTS ARE THE SAME.
+    assert read_directory_tree(zero_copy_export_directory) == read_directory_tree(copy_export_directory)
+
+    # VERIFY THE MODULE FILE CAN BE CLOSED.
+    # No views into the mapped file are left once the parsed module is released.
+    with Module(module_filepaths[0], zero_copy = True) as module:
+        assert all(frame.pixels is not None for frame in module.assets[0].frames)
+    assert module.stream.closed
+
+def test_parallel_export(synthetic_directory, capsys):
+    # EXPORT THE MODULES ONE AT A TIME AND ON WORKER PROCESSES.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    write_synthetic_modules(input_directory)
+    serial_export_directory = os.path.join(synthetic_directory, 'serial')
+    parallel_export_directory = os.path.join(synthetic_directory, 'parallel')
+    Engine.main([input_directory, '--export', serial_export_directory])
+    Engine.main([input_directory, '--export', parallel_export_directory, '--jobs', '2'])
+
+    # VERIFY THE EXPORTS ARE THE SAME.
+    assert read_directory_tree(parallel_export_directory) == read_directory_tree(serial_export_directory)
+
+    # VERIFY A MODULE THAT FAILS IS REPORTED WITHOUT STOPPING THE OTHERS.
+    # This module claims far more chunks than it has.
+    with open(os.path.join(input_directory, 'MODULE03.DAT'), 'wb') as module_file:
+        module_file.write(struct.pack('<H', 0xffff))
+    shutil.rmtree(parallel_export_directory)
+    capsys.readouterr()
+    with pytest.raises(SystemExit) as exit_info:
+        Engine.main([input_directory, '--export', parallel_export_directory, '--jobs', '2'])
+    assert str(exit_info.value).startswith('ERROR: 1 module(s) could not be processed:')
+    assert str(exit_info.value).endswith('MODULE03.DAT')
+    assert f'ERROR: Failed to process {os.path.join(input_directory, "MODULE03.DAT")}' in capsys.readouterr().out
+    parallel_files = read_directory_tree(parallel_export_directory)
+    assert {path: data for path, data in parallel_files.items() if 'MODULE03.DAT' not in path} == read_directory_tree(serial_export_directory)
+
+def test_streaming_export(synthetic_directory, monkeypatch):
+    # RECORD EVERY MODULE THAT IS PARSED.
+    # When each module is parsed, count how many of the modules parsed before it are still held.
+    parsed_modules = []
+    parsed_module_streams = []
+    held_module_counts = []
+    class RecordedModule(Module):
+        def __init__(self, *args, **kwargs):
+            gc.collect()
+            held_module_counts.append(sum(1 for parsed_module in parsed_modules if parsed_module() is not None))
+            super().__init__(*args, **kwargs)
+            parsed_modules.append(weakref.ref(self))
+            parsed_module_streams.append(self.stream)
+    monkeypatch.setattr(ModuleModule, 'Module', RecordedModule)
+
+    # EXPORT THE MODULES ALL AT ONCE AND ONE AT A TIME.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    write_synthetic_modules(input_directory)
+    default_export_directory = os.path.join(synthetic_directory, 'default')
+    streaming_export_directory = os.path.join(synthetic_directory, 'streaming')
+    Engine.main([input_directory, '--export', default_export_directory])
+    # Otherwise, every module is held until they are all exported.
+    assert held_module_counts == [0, 1, 2]
+    parsed_modules.clear()
+    parsed_module_streams.clear()
+    held_module_counts.clear()
+    Engine.main([input_directory, '--export', streaming_export_directory, '--stream'])
+
+    # VERIFY THE EXPORTS ARE THE SAME AND NO MODULES WERE KEPT.
+    assert read_directory_tree(streaming_export_directory) == read_directory_tree(default_export_directory)
+    assert held_module_counts == [0, 0, 0]
+    assert all(stream.closed for stream in parsed_module_streams)
+    gc.collect()
+    assert all(parsed_module() is None for parsed_module in parsed_modules)
+
+@pytest.mark.parametrize('use_c', [pytest.param(True, marks = requires_c), False])
+def test_malformed_frame(synthetic_directory, use_c, monkeypatch, caplog):
+    # CORRUPT THE BITMAP OF ONE FRAME.
+    # Compressed runs of 128 pixels run well past the end of its pixels.
+    monkeypatch.setattr(PackBitsDecompression, 'packbits_c_loaded', use_c)
+    input_directory = os.path.join(synthetic_directory, 'input')
+    module_filepaths = write_synthetic_modules(input_directory)
+    malformed_frame = Module(module_filepaths[0]).assets[0].frames[1]
+    assert malformed_frame.uncompressed_image_size % 0x80 not in (0, 0x7f)
+    _, raw_pointer = malformed_frame._pixel_cache_key
+    with open(module_filepaths[0], 'r+b') as module_file:
+        module_file.seek(raw_pointer)
+        module_file.write(b'\x81' * malformed_frame.compressed_image_data_size)
+
+    # VERIFY THE REST OF THE MODULES ARE STILL EXPORTED.
+    pixel_cache.clear()
+    export_directory = os.path.join(synthetic_directory, 'export')
+    with caplog.at_level(logging.WARNING):
+        Engine.main([input_directory, '--export', export_directory])
+    animation_directory = os.path.join(export_directory, 'Tonka', 'MODULE00.DAT', '0')
+    assert os.path.getsize(os.path.join(animation_directory, '1')) == 0
+    assert os.path.exists(os.path.join(animation_directory, '2.bmp'))
+    assert os.path.exists(os.path.join(export_directory, 'Tonka', 'MODULE02.DAT', 'MODULE02.DAT.json'))
+
+    # VERIFY THE MALFORMED BITMAP IS ONLY REPORTED ONCE WHILE IT IS CACHED.
+    malformed_bitmap_warnings = [record for record in caplog.records if 'malformed bitmap' in record.getMessage()]
+    assert len(malformed_bitmap_warnings) == 1
+    pixel_cache.clear()
+    with caplog.at_level(logging.WARNING):
+        assert Module(module_filepaths[0]).assets[0].frames[1].pixels is None
+    assert len([record for record in caplog.records if 'malformed bitmap' in record.getMessage()]) == 2
+
+def test_palette_lookup_table(synthetic_directory, capsys):
+    # CREATE A PALETTE AND SOME BITMAPS.
+    # Each color in the palette is (index, index + 1, index + 2).
+    palette = RgbPalette(io.BytesIO(bytes((index + channel) % 0x100 for index in range(0x100) for channel in range(3))), has_entry_alignment = False)
+    bitmaps = [
+        SimpleNamespace(pixels = bytes([0x00, 0x01, 0x0f, 0xff]), width = 2, height = 2),
+        # This bitmap has too few pixels for its dimensions.
+        SimpleNamespace(pixels = bytes([0x01, 0x02]), width = 2, height = 2),
+        SimpleNamespace(pixels = None, width = 2, height = 2),
+        # Any pixels past the dimensions are ignored.
+        SimpleNamespace(pixels = bytes([0x0f, 0x10, 0x11]), width = 2, height = 1)]
+
+    # VERIFY THE PIXELS ARE EXPANDED TO RGB.
+    lookup_table = PaletteLookupTable(palette, include_alpha = False, transparent_color = 0x0f)
+    assert lookup_table.image_mode == 'RGB'
+    expanded_bitmaps = lookup_table.expand(bitmaps)
+    assert expanded_bitmaps[1] is None and expanded_bitmaps[2] is None
+    assert expanded_bitmaps[0].shape == (2, 2, 3)
+    assert expanded_bitmaps[0].tolist() == [[[0x00, 0x01, 0x02], [0x01, 0x02, 0x03]], [[0x0f, 0x10, 0x11], [0xff, 0x00, 0x01]]]
+    assert expanded_bitmaps[3].tolist() == [[[0x0f, 0x10, 0x11], [0x10, 0x11, 0x12]]]
+
+    # VERIFY THE PIXELS ARE EXPANDED TO RGBA, WITH THE TRANSPARENT COLOR FULLY TRANSPARENT.
+    lookup_table = PaletteLookupTable(palette, include_alpha = True, transparent_color = 0x0f)
+    assert lookup_table.image_mode == 'RGBA'
+    expanded_bitmaps = lookup_table.expand(bitmaps)
+    assert expanded_bitmaps[0].shape == (2, 2, 4)
+    assert expanded_bitmaps[0][:, :, 3].tolist() == [[0xff, 0xff], [0x00, 0xff]]
+    assert expanded_bitmaps[0][:, :, :3].tolist() == [[[0x00, 0x01, 0x02], [0x01, 0x02, 0x03]], [[0x0f, 0x10, 0x11], [0xff, 0x00, 0x01]]]
+    assert PaletteLookupTable(palette, include_alpha = True).expand(bitmaps[:1])[0][:, :, 3].tolist() == [[0xff, 0xff], [0xff, 0xff]]
+
+    # VERIFY RGBA BITMAPS CAN'T BE EXPORTED AS BMP.
+    with pytest.raises(SystemExit):
+        Engine.main([synthetic_directory, '--export', synthetic_directory, '--bitmap-color', 'rgba', '--bitmap-format', 'bmp'])
+    assert 'BMP files cannot hold transparency' in capsys.readouterr().err
+
+## Parses a module with a parse index.
+## \return The module, and whether it was restored from the index rather than parsed.
+## Records whether each module was restored from the index rather than parsed.
+class RecordingParseIndex(ParseIndex):
+    def restore(self, module) -> bool:
+        self.restored = super().restore(module)
+        return self.restored
+
+## \return The module parsed with the index, and whether it was restored from the index.
+def parse_with_index(module_filepath: str, parse_index: RecordingParseIndex):
+    module = Module(module_filepath, parse_index = parse_index)
+    return module, parse_index.restored
+
+def test_parse_index(synthetic_directory, monkeypatch):
+    # PARSE THE MODULE WITH AN EMPTY INDEX AND THEN A WARM ONE.
+    module_filepath = os.path.join(synthetic_directory, 'MODULE00.DAT')
+    asset_frame_pixels = write_synthetic_module(module_filepath)
+    parse_index = RecordingParseIndex(os.path.join(synthetic_directory, 'index.sqlite'))
+    _, restored = parse_with_index(module_filepath, parse_index)
+    assert not restored
+    module, restored = parse_with_index(module_filepath, parse_index)
+    assert restored
+
+    # VERIFY THE RESTORED MODULE MATCHES A PARSED ONE.
+    parsed_module = Module(module_filepath)
+    assert module._chunk_pointers == parsed_module._chunk_pointers
+    assert module.background.to_index_record() == parsed_module.background.to_index_record()
+    assert [asset.to_index_record() for asset in module.assets] == [asset.to_index_record() for asset in parsed_module.assets]
+    for asset, parsed_asset, frame_pixels in zip(module.assets, parsed_module.assets, asset_frame_pixels):
+        assert asset.frame_table().index_records() == parsed_asset.frame_table().index_records()
+        assert [frame.pixels or b'' for frame in asset.frames] == frame_pixels
+
+    # VERIFY A TOUCHED MODULE IS FOUND BY ITS CONTENTS.
+    # Its path record is outdated, so the contents are hashed again.
+    file_status = os.stat(module_filepath)
+    os.utime(module_filepath, ns = (file_status.st_atime_ns, file_status.st_mtime_ns + 1_000_000_000))
+    module, restored = parse_with_index(module_filepath, parse_index)
+    assert restored
+    path_record = parse_index._connection.execute('SELECT modification_time FROM module_paths').fetchone()
+    assert path_record['modification_time'] == file_status.st_mtime_ns + 1_000_000_000
+
+    # VERIFY A CHANGED MODULE IS PARSED AGAIN.
+    with open(module_filepath, 'ab') as module_file:
+        module_file.write(b'\x00')
+    _, restored = parse_with_index(module_filepath, parse_index)
+    assert not restored
+    _, restored = parse_with_index(module_filepath, parse_index)
+    assert restored
+    parse_index.close()
+
+    # VERIFY AN INDEX WITH ANOTHER SCHEMA VERSION IS DISCARDED.
+    monkeypatch.setattr(ParseIndex, 'SCHEMA_VERSION', ParseIndex.SCHEMA_VERSION + 1)
+    parse_index = RecordingParseIndex(os.path.join(synthetic_directory, 'index.sqlite'))
+    _, restored = parse_with_index(module_filepath, parse_index)
+    assert not restored
+    parse_index.close()
+
+def test_incremental_export(synthetic_directory, capsys):
+    # EXPORT THE MODULES.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    module_filepaths = write_synthetic_modules(input_directory)
+    export_directory = os.path.join(synthetic_directory, 'export')
+    module_export_directory = os.path.join(export_directory, 'Tonka', 'MODULE00.DAT')
+    Engine.main([input_directory, '--export', export_directory, '--incremental'])
+    assert 'INFO: Skipping 0 up-to-date item(s) in MODULE00.DAT' in capsys.readouterr().out
+    exported_files = read_directory_tree(export_directory)
+
+    # VERIFY AN UNCHANGED MODULE IS SKIPPED.
+    # The background and all seven assets are up to date.
+    Engine.main([input_directory, '--export', export_directory, '--incremental'])
+    assert 'INFO: Skipping 8 up-to-date item(s) in MODULE00.DAT' in capsys.readouterr().out
+    assert read_directory_tree(export_directory) == exported_files
+
+    # VERIFY DELETED FILES ARE EXPORTED AGAIN.
+    # This includes an asset with only some of its files deleted.
+    os.remove(os.path.join(module_export_directory, 'Background.bmp'))
+    shutil.rmtree(os.path.join(module_export_directory, '0'))
+    os.remove(os.path.join(module_export_directory, '2', '1.bmp'))
+    Engine.main([input_directory, '--export', export_directory, '--incremental'])
+    assert 'INFO: Skipping 5 up-to-date item(s) in MODULE00.DAT' in capsys.readouterr().out
+    assert read_directory_tree(export_directory) == exported_files
+
+    # VERIFY CHANGING THE PALETTE EXPORTS THE ASSETS AGAIN.
+    # The asset chunks are unchanged, but their frames are drawn with the background palette.
+    with open(module_filepaths[0], 'r+b') as module_file:
+        module_data = module_file.read()
+        palette_pointer = module_data.find(Module(module_filepaths[0]).background._palette._raw_bytes.getvalue())
+        module_file.seek(palette_pointer + (4 * 0x01))
+        module_file.write(bytes([module_data[palette_pointer + (4 * 0x01)] ^ 0xff]))
+    Engine.main([input_directory, '--export', export_directory, '--incremental'])
+    assert 'INFO: Skipping 0 up-to-date item(s) in MODULE00.DAT' in capsys.readouterr().out
+    full_export_directory = os.path.join(synthetic_directory, 'full_export')
+    Engine.main([input_directory, '--export', full_export_directory])
+    exported_files = read_directory_tree(export_directory)
+    assert {path: data for path, data in exported_files.items() if os.path.basename(path) != ExportManifest.FILENAME} == \
+        read_directory_tree(full_export_directory)
+
+    # VERIFY CHANGING AN EXPORT OPTION EXPORTS EVERYTHING AGAIN.
+    Engine.main([input_directory, '--export', export_directory, '--incremental', '--bitmap-format', 'png'])
+    assert 'INFO: Skipping 0 up-to-date item(s) in MODULE00.DAT' in capsys.readouterr().out
+    assert os.path.exists(os.path.join(module_export_directory, 'Background.png'))
+    assert os.path.exists(os.path.join(module_export_directory, '0', '0.png'))
+
+def test_export_writer(synthetic_directory):
+    # VERIFY QUEUED FILES ARE ALL WRITTEN.
+    files = {f'{index}.bin': bytes([index]) * index for index in range(20)}
+    with ExportWriter(writer_count = 3, queue_size = 2) as export_writer:
+        assert ExportWriter.active() is export_writer
+        for filename, data in files.items():
+            export_writer.write(os.path.join(synthetic_directory, filename), data)
+    assert ExportWriter.active() is None
+    assert read_directory_tree(synthetic_directory) == files
+    assert export_writer.statistics['files_written'] == len(files)
+
+    # VERIFY AN ERROR ON A WRITER THREAD IS RAISED WHEN THE WRITER EXITS.
+    with pytest.raises(FileNotFoundError):
+        with ExportWriter(writer_count = 2) as export_writer:
+            export_writer.write(os.path.join(synthetic_directory, 'missing', '0.bin'), b'')
+
+    # VERIFY EXPORTING WITH WRITERS WRITES THE SAME FILES AS EXPORTING DIRECTLY.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    write_synthetic_modules(input_directory)
+    direct_export_directory = os.path.join(synthetic_directory, 'direct')
+    queued_export_directory = os.path.join(synthetic_directory, 'queued')
+    Engine.main([input_directory, '--export', direct_export_directory])
+    Engine.main([input_directory, '--export', queued_export_directory, '--export-writers', '2', '--export-queue-size', '4'])
+    assert read_directory_tree(queued_export_directory) == read_directory_tree(direct_export_directory)
+
+def test_animation_framing(synthetic_directory):
+    # FRAME AN ANIMATION TWICE.
+    module_filepath = os.path.join(synthetic_directory, 'MODULE00.DAT')
+    write_synthetic_module(module_filepath)
+    asset = Module(module_filepath).assets[0]
+    command_line_arguments = argparse.Namespace(bitmap_options = 'animation_framing', animation_format = 'none', dirty_rectangles = False)
+    asset._reframe_to_animation_size(command_line_arguments)
+    framed_images = [frame._exportable_image.tobytes() for frame in asset.frames]
+    asset._reframe_to_animation_size(command_line_arguments)
+
+    # VERIFY THE FRAMES ARE ONLY FRAMED ONCE.
+    assert {frame._exportable_image.size for frame in asset.frames} == {(asset._minimal_bounding_box.width, asset._minimal_bounding_box.height)}
+    assert [frame._exportable_image.tobytes() for frame in asset.frames] == framed_images
+
+    # VERIFY RELEASED FRAMES ARE FRAMED AGAIN.
+    asset.release_frames()
+    asset._reframe_to_animation_size(command_line_arguments)
+    assert [frame._exportable_image.tobytes() for frame in asset.frames] == framed_images
+
+def test_parse_synthetic_module(synthetic_directory):
+    # WRITE AND PARSE THE MODULE.
+    module_filepath = os.path.join(synthetic_directory, 'MODULE00.DAT')
+    asset_frame_pixels = write_synthetic_module(module_filepath)
+    pixel_cache.clear()
+    module = Module(module_filepath)
+
+    # VERIFY THE ASSETS.
+    assert {asset.type for asset in module.assets} == set(Asset.AssetType) - {Asset.AssetType.UNKNOWN}
+    assert len(module.assets) == len(asset_frame_pixels)
+    for asset, frame_pixels in zip(module.assets, asset_frame_pixels):
+        assert len(asset.frames) == len(frame_pixels)
+        for frame, pixels in zip(asset.frames, frame_pixels):
+            assert (frame.pixels or b'') == pixels
+            if frame.compressed_image_data_size > 0:
+                assert frame.decompress_bitmap() == pixels
+
+    # VERIFY THE AUDIO.
+    # The first audio chunk is doubled.
+    audio_asset = module.assets[-1]
+    assert [len(sound._pcm) for sound in audio_asset.sounds] == [AUDIO_CHUNK_LENGTH * 2, AUDIO_CHUNK_LENGTH]
+
+def test_frame_table(synthetic_directory):
+    # WRITE AND PARSE THE MODULE.
+    module_filepath = os.path.join(synthetic_directory, 'MODULE00.DAT')
+    asset_frame_pixels = write_synthetic_module(module_filepath)
+    module = Module(module_filepath)
+
+    # VERIFY THE FRAME TABLES MATCH THE FRAMES.
+    for asset, frame_pixels in zip(module.assets, asset_frame_pixels):
+        frame_table = asset.frame_table()
+        assert len(frame_table) == len(frame_pixels)
+        assert list(frame_table['width']) == [frame.width for frame in asset.frames]
+        for frame_view, pixels in zip(frame_table, frame_pixels):
+            assert (frame_view.pixels or b'') == pixels
+
+    # VERIFY FRAMES CAN BE SELECTED BY COLUMN.
+    audio_asset = module.assets[-1]
+    frames_with_audio = audio_asset.frame_table()[audio_asset.frame_table()['audio_pointer'] >= 0]
+    assert [len(frame_view.audio) for frame_view in frames_with_audio] == [AUDIO_CHUNK_LENGTH * 2, AUDIO_CHUNK_LENGTH]
+
+    # VERIFY RELEASED FRAMES ARE CREATED AGAIN.
+    asset = module.assets[0]
+    asset.release_frames()
+    assert [frame.pixels for frame in asset.frames] == asset_frame_pixels[0]
+
+def test_audio_track(synthetic_directory):
+    # WRITE AND PARSE THE MODULE.
+    module_filepath = os.path.join(synthetic_directory, 'MODULE00.DAT')
+    write_synthetic_module(module_filepath)
+    module = Module(module_filepath)
+
+    # VERIFY THE TRACK HAS ALL THE AUDIO CHUNKS.
+    # The first audio chunk is doubled.
+    audio_asset = module.assets[-1]
+    audio_track = audio_asset.audio_track()
+    assert len(audio_track) == 2
+    assert audio_track.length_in_bytes == AUDIO_CHUNK_LENGTH * 3
+    assert module.assets[0].audio_track() is None
+
+    # VERIFY THE STREAMED TRACK MATCHES THE AUDIO CHUNKS.
+    wave_filepath = os.path.join(synthetic_directory, 'audio.wav')
+    audio_track.write_wave(wave_filepath)
+    with wave.open(wave_filepath, 'rb') as wave_file:
+        assert wave_file.getframerate() == 22050
+        assert wave_file.readframes(wave_file.getnframes()) == b''.join(bytes(sound._pcm) for sound in audio_asset.sounds)
+
+    # VERIFY NO AUDIO IS EXPORTED WHEN NO AUDIO FORMAT IS REQUESTED.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    export_directory = os.path.join(synthetic_directory, 'export')
+    write_synthetic_modules(input_directory)
+    Engine.main([input_directory, '--export', export_directory, '--audio-format', 'none'])
+    exported_filenames = [filename for _, _, filenames in os.walk(export_directory) for filename in filenames]
+    assert not any(filename.startswith('audio.') for filename in exported_filenames)
+
+def test_export_synthetic_modules(synthetic_directory):
+    # EXPORT THE MODULES.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    export_directory = os.path.join(synthetic_directory, 'export')
+    write_synthetic_modules(input_directory)
+    Engine.main([input_directory, '--export', export_directory])
+
+    # VERIFY SOMETHING WAS EXPORTED FOR EACH MODULE.
+    for module_filename in ('MODULE00.DAT', 'MODULE01.DAT', 'MODULE02.DAT'):
+        module_export_directory = os.path.join(export_directory, 'Tonka', module_filename)
+        assert os.path.exists(os.path.join(module_export_directory, 'Background.bmp'))
+        assert os.path.exists(os.path.join(module_export_directory, f'{module_filename}.json'))
+
+def test_asset_catalog(synthetic_directory):
+    # CATALOG THE MODULES.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    module_filepaths = write_synthetic_modules(input_directory)
+    catalog = AssetCatalog(os.path.join(synthetic_directory, 'catalog.sqlite'))
+    assert catalog.build(module_filepaths) == 3
+    # Unchanged modules are not cataloged again.
+    assert catalog.build(module_filepaths) == 0
+
+    # VERIFY THE QUERIES.
+    cursors = catalog.query(types = ['CURSOR'])
+    assert [(cursor['module_filename'], cursor['cursor_directions'], cursor['cursor_facets']) for cursor in cursors] == \
+        [('MODULE00.DAT', 12, 2), ('MODULE01.DAT', 12, 2), ('MODULE02.DAT', 12, 2)]
+    clickable_stills = catalog.query(types = ['CLICKABLE_STILL'], has_hotspot = True, module_pattern = 'MODULE01*')
+    assert [(still['hotspot_x'], still['hotspot_y']) for still in clickable_stills] == [(3, 4)]
+    assert len(catalog.query(contents = ['AUDIO_AND_VIDEO'], minimum_frame_count = 10)) == 3
+
+    # EXPORT ONLY THE SELECTED ASSETS.
+    export_directory = os.path.join(synthetic_directory, 'export')
+    Engine.main(['catalog', catalog.database_path, '--type', 'CLICKABLE_STILL', '--module', 'MODULE01*', '--export', export_directory])
+    module_export_directory = os.path.join(export_directory, 'Tonka', 'MODULE01.DAT')
+    assert os.listdir(module_export_directory) == [str(clickable_stills[0]['asset_index'])]
+    catalog.close()
+
+def test_content_store(synthetic_directory):
+    # WRITE TWO IDENTICAL MODULES.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    os.makedirs(input_directory)
+    write_synthetic_module(os.path.join(input_directory, 'MODULE00.DAT'))
+    shutil.copyfile(os.path.join(input_directory, 'MODULE00.DAT'), os.path.join(input_directory, 'MODULE01.DAT'))
+
+    # EXPORT THE MODULES WITH A CONTENT STORE.
+    export_directory = os.path.join(synthetic_directory, 'export')
+    content_store_directory = os.path.join(synthetic_directory, 'content')
+    Engine.main([input_directory, '--export', export_directory, '--content-store', content_store_directory])
+
+    # VERIFY THE DUPLICATE BITMAPS ARE LINKED TO THE SAME STORED FILE.
+    first_background_filepath = os.path.join(export_directory, 'Tonka', 'MODULE00.DAT', 'Background.bmp')
+    second_background_filepath = os.path.join(export_directory, 'Tonka', 'MODULE01.DAT', 'Background.bmp')
+    assert os.path.samefile(first_background_filepath, second_background_filepath)
+    first_frame_filepath = os.path.join(export_directory, 'Tonka', 'MODULE00.DAT', '0', '0.bmp')
+    second_frame_filepath = os.path.join(export_directory, 'Tonka', 'MODULE01.DAT', '0', '0.bmp')
+    assert os.path.samefile(first_frame_filepath, second_frame_filepath)
+
+    # VERIFY EXPORTING AGAIN WITHOUT THE STORE DOES NOT CHANGE THE STORED FILES.
+    # The bitmaps are exported with different colors, over the bitmaps linked to the store.
+    stored_files = read_directory_tree(content_store_directory)
+    Engine.main([input_directory, '--export', export_directory, '--bitmap-color', 'rgb'])
+    assert read_directory_tree(content_store_directory) == stored_files
+    with open(first_background_filepath, 'rb') as background_file:
+        assert background_file.read() not in stored_files.values()
+
+    # VERIFY EXPORTING WITH THE STORE ON WORKER PROCESSES MATCHES EXPORTING ONE MODULE AT A TIME.
+    serial_export_directory = os.path.join(synthetic_directory, 'serial')
+    parallel_export_directory = os.path.join(synthetic_directory, 'parallel')
+    serial_content_store_directory = os.path.join(synthetic_directory, 'serial_content')
+    parallel_content_store_directory = os.path.join(synthetic_directory, 'parallel_content')
+    input_directory = os.path.join(synthetic_directory, 'modules')
+    write_synthetic_modules(input_directory)
+    Engine.main([input_directory, '--export', serial_export_directory, '--content-store', serial_content_store_directory])
+    Engine.main([input_directory, '--export', parallel_export_directory, '--content-store', parallel_content_store_directory, '--jobs', '3'])
+    assert read_directory_tree(parallel_export_directory) == read_directory_tree(serial_export_directory)
+    assert read_directory_tree(parallel_content_store_directory) == read_directory_tree(serial_content_store_directory)
+
+def test_frame_start_pointers(synthetic_directory):
+    # WRITE AND PARSE THE MODULE.
+    module_filepath = os.path.join(synthetic_directory, 'MODULE00.DAT')
+    asset_frame_pixels = write_synthetic_module(module_filepath)
+    module = Module(module_filepath, lazy = True)
+
+    # VERIFY FRAMES CAN BE READ OUT OF ORDER.
+    # Frames with pointers don't need the frames before them to be read.
+    asset = module.asset_headers()[0]
+    assert asset.frame(3).pixels == asset_frame_pixels[0][3]
+    assert not asset._frames_read
+    assert module.frame_start_pointer_mismatches() == []
+
+    # CORRUPT A FRAME START POINTER.
+    # The pointers follow the fixed header of the first asset.
+    ASSET_HEADER_SIZE = 0x80
+    with open(module_filepath, 'r+b') as module_file:
+        module_file.seek(2)
+        first_asset_pointer = struct.unpack('<L', module_file.read(4))[0]
+        module_file.seek(first_asset_pointer + ASSET_HEADER_SIZE + (4 * 2))
+        module_file.write(struct.pack('<L', 0x10))
+
+    # VERIFY THE FRAMES ARE STILL READ CORRECTLY AND THE MISMATCH IS REPORTED.
+    module = Module(module_filepath)
+    assert [frame.pixels for frame in module.assets[0].frames] == asset_frame_pixels[0]
+    assert module.assets[0].frame(2).pixels == asset_frame_pixels[0][2]
+    mismatches = module.frame_start_pointer_mismatches()
+    assert len(mismatches) == 1 and mismatches[0].startswith('Asset 0: Frame 2')
+
+    # VERIFY A TRUNCATED FRAME START POINTER TABLE IS IGNORED.
+    # The frames can then only be read in order.
+    with open(module_filepath, 'rb') as module_file:
+        module_file.seek(first_asset_pointer)
+        truncated_asset_data = module_file.read(ASSET_HEADER_SIZE + (4 * 2))
+    truncated_asset = Asset(SimpleNamespace(stream = io.BytesIO(truncated_asset_data)), read_frames = False)
+    assert truncated_asset._frame_count > 2
+    assert truncated_asset._frame_start_pointers is None
+
+def test_profile(synthetic_directory):
+    # EXPORT THE MODULES WITH PROFILING.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    export_directory = os.path.join(synthetic_directory, 'export')
+    profile_filepath = os.path.join(synthetic_directory, 'profile.json')
+    write_synthetic_modules(input_directory)
+    Engine.main([input_directory, '--export', export_directory, '--profile', profile_filepath, '--profile-hooks', 'tracemalloc'])
+
+    # VERIFY EACH MODULE AND ASSET IS REPORTED.
+    with open(profile_filepath) as profile_file:
+        profile = json.load(profile_file)
+    assert profile['decompressor'] in ('c', 'python')
+    assert len(profile['modules']) == 3
+    module_report = profile['modules'][0]
+    assert module_report['bytes_in'] == os.path.getsize(os.path.join(input_directory, 'MODULE00.DAT'))
+    assert {'chunk_table', 'asset_headers', 'frame_headers', 'decompression', 'metadata_export'} <= set(module_report['phases'])
+    assert module_report['counters']['frames_read'] > 0
+    assert module_report['tracemalloc']['peak_bytes'] > 0
+    background_report = module_report['assets'][0]
+    assert background_report['name'] == 'Background'
+    assert background_report['bytes_out'] == os.path.getsize(os.path.join(export_directory, 'Tonka', 'MODULE00.DAT', 'Background.bmp'))
+    assert sum(asset_report.get('frame_count', 0) for asset_report in module_report['assets']) == module_report['counters']['frames_read']
+
+def test_jsonl_metadata(synthetic_directory):
+    # EXPORT THE METADATA AS JSON LINES.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    export_directory = os.path.join(synthetic_directory, 'export')
+    module_filepaths = write_synthetic_modules(input_directory)
+    Engine.main([input_directory, '--export', export_directory, '--metadata-format', 'jsonl', '--bitmap-format', 'none'])
+
+    # VERIFY THE RECORDS MATCH THE PARSED MODULE.
+    module_export_directory = os.path.join(export_directory, 'Tonka', 'MODULE00.DAT')
+    assert not os.path.exists(os.path.join(module_export_directory, 'MODULE00.DAT.json'))
+    with open(os.path.join(module_export_directory, 'MODULE00.DAT.jsonl')) as metadata_file:
+        records = [json.loads(line) for line in metadata_file]
+    module = Module(module_filepaths[0])
+    assert [record['record'] for record in records[:2]] == ['module', 'background']
+    asset_records = [record for record in records if record['record'] == 'asset']
+    assert [asset_record['type'] for asset_record in asset_records] == [asset.type.name for asset in module.assets]
+    frame_records = [record for record in records if record['record'] == 'frame']
+    assert len(frame_records) == sum(len(asset.frames) for asset in module.assets)
+    first_frame = module.assets[0].frames[0]
+    assert (frame_records[0]['width'], frame_records[0]['compressed_image_data_size']) == (first_frame._width, first_frame.compressed_image_data_size)
+    # Only scalar fields are written.
+    assert all(isinstance(value, (int, str, type(None))) for record in records for value in record.values())
+
+def test_sprite_atlas(synthetic_directory):
+    # EXPORT THE MODULES WITH SPRITE ATLASES.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    export_directory = os.path.join(synthetic_directory, 'export')
+    module_filepaths = write_synthetic_modules(input_directory)
+    Engine.main([input_directory, '--export', export_directory, '--sprite-atlas'])
+
+    # VERIFY EACH CURSOR FRAME IS IN THE ATLAS.
+    module = Module(module_filepaths[0])
+    cursor_index, cursor = next((index, asset) for index, asset in enumerate(module.assets) if asset.type == Asset.AssetType.CURSOR)
+    module_export_directory = os.path.join(export_directory, 'Tonka', 'MODULE00.DAT')
+    assert not os.path.exists(os.path.join(module_export_directory, str(cursor_index)))
+    with open(os.path.join(module_export_directory, f'{cursor_index}.json')) as sidecar_file:
+        sidecar = json.load(sidecar_file)
+    assert (sidecar['hotspot']['x'], sidecar['hotspot']['y']) == (cursor.hotspot_x, cursor.hotspot_y)
+    atlas = Image.open(os.path.join(module_export_directory, f'{cursor_index}.bmp'))
+    assert atlas.size == (sidecar['width'], sidecar['height'])
+    assert len(sidecar['frames']) == len(cursor.frames)
+    for frame, frame_record in zip(cursor.frames, sidecar['frames']):
+        rectangle = frame_record['rect']
+        frame_box = (rectangle['x'], rectangle['y'], rectangle['x'] + rectangle['width'], rectangle['y'] + rectangle['height'])
+        assert atlas.crop(frame_box).tobytes() == frame.pixels
+        assert (frame_record['_left'], frame_record['_top']) == (frame._left, frame._top)
+
+    # VERIFY ANIMATIONS ARE STILL EXPORTED FRAME BY FRAME.
+    animation_index = next(index for index, asset in enumerate(module.assets) if asset.is_animation)
+    assert os.path.exists(os.path.join(module_export_directory, str(animation_index), '0.bmp'))
+
+    # VERIFY THE ATLAS COLORS COME FROM THE FIRST FRAME WITH A BITMAP.
+    # The first frame is emptied, so it doesn't have a palette either.
+    module = Module(module_filepaths[0])
+    cursor = module.assets[cursor_index]
+    module.expand_bitmaps(include_alpha = True, include_background = False, assets = [cursor])
+    cursor.frames[0].compressed_image_data_size = 0
+    cursor.frames[0]._palette = None
+    sprite_atlas = SpriteAtlas(cursor)
+    atlas = sprite_atlas.image()
+    assert atlas.mode == 'RGBA'
+    assert sprite_atlas.sidecar()['frames'][0]['rect'] is None
+    # The space between the frames is transparent.
+    first_frame_x, first_frame_y = sprite_atlas.positions[1]
+    assert atlas.getpixel((first_frame_x + cursor.frames[1].width, first_frame_y))[3] == 0
+
+    # VERIFY NO AUDIO IS EXPORTED WITH THE ATLASES WHEN NO AUDIO FORMAT IS REQUESTED.
+    shutil.rmtree(export_directory)
+    Engine.main([input_directory, '--export', export_directory, '--sprite-atlas', '--audio-format', 'none'])
+    exported_filenames = [filename for _, _, filenames in os.walk(export_directory) for filename in filenames]
+    assert not any(filename.endswith('.none') for filename in exported_filenames)
+
+def test_dirty_rectangles(synthetic_directory):
+    # EXPORT THE FRAMED ANIMATIONS WITH AND WITHOUT DIRTY RECTANGLES.
+    input_directory = os.path.join(synthetic_directory, 'input')
+    write_synthetic_modules(input_directory)
+    full_export_directory = os.path.join(synthetic_directory, 'full')
+    dirty_export_directory = os.path.join(synthetic_directory, 'dirty')
+    Engine.main([input_directory, '--export', full_export_directory, '--bitmap-options', 'animation_framing'])
+    Engine.main([input_directory, '--export', dirty_export_directory, '--bitmap-options', 'animation_framing', '--dirty-rectangles'])
+
+    # REPLAY THE DELTA STREAM.
+    # Each frame must come out the same as the fully framed frame.
+    full_animation_directory = os.path.join(full_export_directory, 'Tonka', 'MODULE00.DAT', '0')
+    dirty_animation_directory = os.path.join(dirty_export_directory, 'Tonka', 'MODULE00.DAT', '0')
+    with open(os.path.join(dirty_animation_directory, 'deltas.bin'), 'rb') as delta_stream:
+        signature, version, width, height, channel_count, frame_count = struct.unpack('<4s4HL', delta_stream.read(16))
+        assert (signature, version, channel_count) == (b'TKDS', 1, 1)
+        first_frame = Image.open(os.path.join(full_animation_directory, '0.bmp'))
+        canvas = Image.new('P', (width, height), color = first_frame.getpixel((0, 0)))
+        for index in range(frame_count):
+            left, top, rectangle_width, rectangle_height = struct.unpack('<4H', delta_stream.read(8))
+            pixels = delta_stream.read(rectangle_width * rectangle_height)
+            if rectangle_width > 0:
+                canvas.paste(Image.frombytes('P', (rectangle_width, rectangle_height), pixels), box = (left, top))
+            assert canvas.tobytes() == Image.open(os.path.join(full_animation_directory, f'{index}.bmp')).tobytes()
+
+    # VERIFY THE EXPORTED FRAMES ARE CUT DOWN TO THEIR DIRTY RECTANGLES.
+    with open(os.path.join(dirty_animation_directory, 'dirty_rectangles.json')) as dirty_rectangles_file:
+        dirty_rectangles = json.load(dirty_rectangles_file)
+    assert Image.open(os.path.join(dirty_animation_directory, '0.bmp')).size == (width, height)
+    for index, dirty_rectangle in enumerate(dirty_rectangles['frames'][1:], start = 1):
+        assert Image.open(os.path.join(dirty_animation_directory, f'{index}.bmp')).size == tuple(dirty_rectangle[2:])
+
+def test_inventory(synthetic_directory):
+    # INVENTORY THE MODULE.
+    module_filepath = os.path.join(synthetic_directory, 'MODULE00.DAT')
+    write_synthetic_module(module_filepath)
+    inventory = ModuleInventory(module_filepath)
+    module = Module(module_filepath)
+
+    # VERIFY THE INVENTORY MATCHES THE PARSED MODULE.
+    assert inventory.problems == []
+    assert inventory.asset_type_names == [asset.type.name for asset in module.assets]
+    Engine.main([synthetic_directory, '--inventory'])
+
+    # VERIFY AN IMPLAUSIBLE CHUNK POINTER IS REPORTED.
+    with open(module_filepath, 'r+b') as module_file:
+        module_file.seek(2 + (4 * (len(inventory.chunk_pointers) - 1)))
+        module_file.write(struct.pack('<L', inventory.size + 1))
+    assert len(ModuleInventory(module_filepath).problems) == 1
+    with pytest.raises(SystemExit):
+        Engine.main([synthetic_directory, '--inventory'])